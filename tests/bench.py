@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Offline benchmarks for the disassembler. Uses the mock gdb module from this directory, so no gdb (or inferior) is
+# needed. Run from within the tests directory:
+#
+#   ./bench.py                 run everything and compare against the baseline if there is one
+#   ./bench.py -s              store the results as the new baseline
+#   ./bench.py -f synth        only run the fixtures matching the regex
+#
+# Timings depend on the machine, so there is no baseline in the repository. Before working on the disassembler store one
+# from the unchanged tree with -s (it goes to bench_baseline.json, which git ignores), then run ./bench.py after each
+# change and it fails on any stage that got slower or needs more memory than the thresholds allow.
+
+import os
+import sys
+import re
+import time
+import json
+import random
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+
+here = os.path.dirname(os.path.abspath(__file__))
+os.chdir(here)
+sys.path.insert(0,here)
+sys.path.insert(0,os.path.dirname(here))
+
+import vdb.color
+import vdb.util
+import vdb.config
+import vdb.asm
+
+goodcolor = "#080"
+failcolor = "#f00"
+skipcolor = "#ff0"
+
+debug = False
+
+def color( msg, col ):
+    print(vdb.color.color(msg,col))
+
+# name, file, architecture
+mock_fixtures = [ (f"mock{i}",f"mock{i}.txt","x86") for i in range(0,10) ] + [ ("mock10","mock10.txt","arm") ]
+
+# number of instructions of the generated listings
+synthetic_sizes = [ 1000, 5000 ]
+
+def synthetic_listing( count, seed = 42 ):
+    """
+    Generates the disassemble/r output of a function with count instructions. There is a mix of register and memory
+    moves, arithmetic, calls and jumps in both directions, and the marker is in the middle.
+    """
+    rnd = random.Random(seed)
+    regs = [ "%rax", "%rbx", "%rcx", "%rdx", "%rsi", "%rdi", "%r8", "%r9", "%r12", "%r13" ]
+    base = 0x7f0000401000
+    fname = f"synthetic_{count}"
+
+    # first the sizes so we know all addresses for the jumps
+    sizes = [ rnd.choice( [ 2, 3, 4, 5, 7 ] ) for _ in range(count) ]
+    addresses = []
+    addr = base
+    for s in sizes:
+        addresses.append(addr)
+        addr += s
+
+    ret = [ f"Dump of assembler code for function {fname}:" ]
+    for i in range(count):
+        addr = addresses[i]
+        kind = rnd.random()
+        r0 = rnd.choice(regs)
+        r1 = rnd.choice(regs)
+        if( i == count-1 ):
+            ins = "ret"
+        elif( kind < 0.25 ):
+            ins = f"mov    {r0},{r1}"
+        elif( kind < 0.40 ):
+            ins = f"mov    {rnd.randrange(0,0x200):#x}({r0}),{r1}"
+        elif( kind < 0.50 ):
+            ins = f"mov    {r0},{rnd.randrange(0,0x200):#x}(%rsp)"
+        elif( kind < 0.60 ):
+            ins = f"add    ${rnd.randrange(1,0x100):#x},{r0}"
+        elif( kind < 0.68 ):
+            ins = f"cmp    {r0},{r1}"
+        elif( kind < 0.73 ):
+            ins = f"lea    {rnd.randrange(0,0x100):#x}({r0},{r1},8),{r1}"
+        elif( kind < 0.78 ):
+            ins = f"call   0x7f0000300000 <helper_{rnd.randrange(0,20)}>"
+        elif( kind < 0.90 ):
+            # mostly short jumps, some long ones across the whole function
+            if( rnd.random() < 0.8 ):
+                tgt = min(max(i + rnd.randrange(-30,30),0),count-1)
+            else:
+                tgt = rnd.randrange(0,count)
+            taddr = addresses[tgt]
+            mne = rnd.choice( [ "je ", "jne", "jg ", "jl ", "jmp" ] )
+            ins = f"{mne}    {taddr:#x} <{fname}+{taddr-base}>"
+        else:
+            ins = f"xor    {r0},{r0}"
+        bts = " ".join( f"{rnd.randrange(0,256):02x}" for _ in range(sizes[i]) )
+        marker = "   "
+        if( i == count // 2 ):
+            marker = "=> "
+        ret.append( f"{marker}{addr:#018x} <+{addr-base}>:\t{bts}\t{ins}" )
+    ret.append("End of assembler dump.")
+    return "\n".join(ret) + "\n"
+
+def stage_parse( ctx ):
+    ctx["listing"] = vdb.asm.parse_from_gdb( ctx["name"], ctx["data"], arch = ctx["arch"], fakeframe = ctx["frame"], do_flow = False )
+
+def stage_backtrack( ctx ):
+    ctx["listing"].do_backtrack()
+
+def stage_flow( ctx ):
+    lng = ctx["listing"]
+    # Otherwise we would only measure the block reuse of the previous run
+    lng.basic_blocks = None
+    lng.flow_token = None
+    vdb.asm.register_flow( lng, ctx["frame"] )
+
+def stage_to_str( ctx ):
+    lng = ctx["listing"]
+    lng.render_cache = {}
+    lng.finished = False
+    lng.to_str( vdb.asm.asm_showspec.value, None, lng.marker, False, False )
+
+def stage_to_str_context( ctx ):
+    lng = ctx["listing"]
+    lng.render_cache = {}
+    lng.to_str( vdb.asm.asm_showspec.value, (20,20), lng.marker, False, False )
+
+def stage_to_dot( ctx ):
+    g = ctx["listing"].to_dot( vdb.asm.asm_showspec_dot.value )
+    g.write( os.path.join( ctx["tmpdir"], "bench.dot" ) )
+
+stages = [
+        ( "parse", stage_parse ),
+        ( "backtrack", stage_backtrack ),
+        ( "flow", stage_flow ),
+        ( "to_str", stage_to_str ),
+        ( "to_str/ctx", stage_to_str_context ),
+        ( "to_dot", stage_to_dot ),
+        ]
+
+def measure( func, ctx, repeat ):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(ctx)
+        t1 = time.perf_counter()
+        times.append( (t1-t0) * 1000.0 )
+
+    # separate run, tracemalloc slows everything down a lot
+    tracemalloc.start()
+    func(ctx)
+    current,peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+            "min" : min(times),
+            "median" : statistics.median(times),
+            "peak_kib" : peak / 1024.0,
+            "retained_kib" : current / 1024.0,
+            }
+
+def run_fixture( name, data, arch, repeat, tmpdir ):
+    ret = {}
+    vdb.asm.configure_arch(arch)
+    ctx = { "name" : name, "data" : data, "arch" : arch, "tmpdir" : tmpdir, "frame" : vdb.asm.fake_frame() }
+    for sname,func in stages:
+        try:
+            ret[sname] = measure( func, ctx, repeat )
+        except Exception as e:
+            color(f"{name}/{sname} failed: {e}",failcolor)
+            if( debug ):
+                vdb.print_exc()
+            ret[sname] = None
+            if( "listing" not in ctx ):
+                break
+    return ret
+
+def compare( results, baseline, threshold, min_delta ):
+    """
+    Returns the list of ( fixture, stage, what, old, new ) that are worse than the baseline
+    """
+    ret = []
+    for fixture,fres in results.items():
+        bres = baseline.get(fixture,None)
+        if( bres is None ):
+            continue
+        for sname,sres in fres.items():
+            bs = bres.get(sname,None)
+            if( bs is None or sres is None ):
+                continue
+            old = bs["min"]
+            new = sres["min"]
+            if( new > old * ( 1.0 + threshold ) and ( new - old ) > min_delta ):
+                ret.append( ( fixture, sname, "time", old, new ) )
+            old = bs["peak_kib"]
+            new = sres["peak_kib"]
+            if( new > old * ( 1.0 + threshold ) and ( new - old ) > 64 ):
+                ret.append( ( fixture, sname, "peak", old, new ) )
+    return ret
+
+def print_results( results, baseline ):
+    otbl = []
+    otbl.append( ["Fixture","Stage","min ms","median ms","peak KiB","retained KiB","baseline ms","change"] )
+    for fixture,fres in results.items():
+        for sname,sres in fres.items():
+            if( sres is None ):
+                otbl.append( [ fixture, sname, "failed" ] )
+                continue
+            line = [ fixture, sname, f"{sres['min']:.2f}", f"{sres['median']:.2f}", f"{sres['peak_kib']:.0f}", f"{sres['retained_kib']:.0f}" ]
+            bs = baseline.get(fixture,{}).get(sname,None)
+            if( bs is not None ):
+                line.append( f"{bs['min']:.2f}" )
+                if( bs["min"] > 0 ):
+                    line.append( f"{(sres['min']/bs['min']-1.0)*100.0:+.1f}%" )
+            otbl.append(line)
+    print(vdb.util.format_table(otbl))
+
+def run_benchmarks( ):
+
+    parser = argparse.ArgumentParser(description='run vdb disassembler benchmarks.')
+    parser.add_argument("-f","--filter", type=str, action="store", help = "Regex to filter fixtures for")
+    parser.add_argument("-r","--repeat", type=int, action="store", default = 3, help = "Runs per stage, the fastest counts")
+    parser.add_argument("-b","--baseline", type=str, action="store", default = os.path.join(here,"bench_baseline.json"), help = "Baseline file")
+    parser.add_argument("-s","--save", action="store_true", help = "Store the results as the new baseline")
+    parser.add_argument("-t","--threshold", type=float, action="store", default = 0.15, help = "Relative slowdown that counts as a regression")
+    parser.add_argument("-m","--min-delta", type=float, action="store", default = 0.5, help = "Absolute slowdown in ms below which nothing counts as a regression")
+    parser.add_argument("-d","--debug", action="store_true", help = "Show backtraces of failing stages")
+
+    args = parser.parse_args(sys.argv[1:])
+
+    global debug
+    debug = args.debug
+
+    # Always measure the real work
+    vdb.asm.persistent_cache.value = False
+
+    fixtures = []
+    for name,fn,arch in mock_fixtures:
+        with open(fn) as f:
+            fixtures.append( ( name, f.read(), arch ) )
+    for size in synthetic_sizes:
+        fixtures.append( ( f"synthetic{size}", synthetic_listing(size), "x86" ) )
+
+    if( args.filter ):
+        cre = re.compile(args.filter)
+        fixtures = [ f for f in fixtures if cre.search(f[0]) is not None ]
+
+    baseline = {}
+    if( os.path.exists(args.baseline) ):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name,data,arch in fixtures:
+            print(f"Running {name} ...")
+            results[name] = run_fixture( name, data, arch, args.repeat, tmpdir )
+
+    print_results( results, baseline )
+
+    if( args.save ):
+        baseline.update(results)
+        with open(args.baseline,"w") as f:
+            json.dump( baseline, f, indent = 1 )
+        color(f"Stored baseline in {args.baseline}",goodcolor)
+        return 0
+
+    if( len(baseline) == 0 ):
+        color(f"No baseline in {args.baseline}, use -s to store one",skipcolor)
+        return 0
+
+    regressions = compare( results, baseline, args.threshold, args.min_delta )
+    for fixture,sname,what,old,new in regressions:
+        color(f"REGRESSION {fixture}/{sname} {what}: {old:.2f} => {new:.2f}",failcolor)
+    if( len(regressions) > 0 ):
+        return 1
+    color("No regressions against the baseline",goodcolor)
+    return 0
+
+sys.exit( run_benchmarks() )
+# vim: tabstop=4 shiftwidth=4 expandtab ft=python
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Offline tests for the parts of vdb that work without an inferior. Like bench.py this uses the mock gdb module from
+# this directory, so no gdb is needed. Run from within the tests directory:
+#
+#   ./unit.py                  run all tests
+#   ./unit.py -f overlay       only run the tests matching the regex
+#   ./unit.py -d               show backtraces of failing tests
+
+import os
+import sys
+import re
+import shlex
+import argparse
+import tempfile
+
+here = os.path.dirname(os.path.abspath(__file__))
+os.chdir(here)
+sys.path.insert(0,here)
+sys.path.insert(0,os.path.dirname(here))
+
+import gdb
+import colors
+import vdb
+import vdb.color
+import vdb.util
+import vdb.config
+import vdb.arch
+import vdb.cache
+import vdb.elf
+import vdb.asm
+import vdb.memory
+import vdb.track
+import vdb.hexdump
+
+goodcolor = "#080"
+failcolor = "#f00"
+
+debug = False
+
+def color( msg, col ):
+    print(vdb.color.color(msg,col))
+
+def expect( what, got, wanted ):
+    if( got != wanted ):
+        raise AssertionError(f"{what}: got {got!r}, expected {wanted!r}")
+
+class patched:
+    """
+    Replaces an attribute within a with block
+    """
+
+    def __init__( self, obj, name, value ):
+        self.obj = obj
+        self.name = name
+        self.value = value
+        self.old = None
+
+    def __enter__( self ):
+        self.old = getattr(self.obj,self.name)
+        setattr(self.obj,self.name,self.value)
+        return self.value
+
+    def __exit__( self, *_ ):
+        setattr(self.obj,self.name,self.old)
+
+tests = []
+
+# Every test gets a fresh temporary directory as vdb_dir
+def unit_test( func ):
+    tests.append( ( func.__name__, func ) )
+    return func
+
+def render( lng ):
+    ret = lng.to_str( vdb.asm.asm_showspec.value, None, lng.marker, False, False )
+    if( isinstance(ret,tuple) ):
+        ret = ret[0]
+    return colors.strip_color(str(ret))
+
+@unit_test
+def persistent_cache( tmpdir ):
+    vdb.asm.configure_arch("x86")
+    with open("mock1.txt") as f:
+        data = f.read()
+    lng = vdb.asm.parse_from_gdb( "mock1", data, arch = "x86", fakeframe = vdb.asm.fake_frame() )
+    pkey = "asm/0123456789abcdef/x86_64-1000-2000"
+    vdb.asm.save_persistent( pkey, lng )
+    loaded = vdb.asm.load_persistent( pkey )
+    if( loaded is None ):
+        raise AssertionError("Nothing loaded from the persistent cache")
+    expect( "instructions", len(loaded.instructions), len(lng.instructions) )
+    expect( "rendered", render(loaded), render(lng) )
+
+    # Another version is ignored
+    vdb.cache.save_object( pkey, ( vdb.asm.persistent_cache_version + 1, lng ) )
+    expect( "other version", vdb.asm.load_persistent( pkey ), None )
+
+    # Something that can't be pickled only means it is not stored, and no temporary file is left behind
+    lng.unpicklable = lambda : None
+    vdb.asm.save_persistent( "asm/0123456789abcdef/broken", lng )
+    expect( "unpicklable", vdb.asm.load_persistent( "asm/0123456789abcdef/broken" ), None )
+    expect( "left over files", sorted(os.listdir( os.path.dirname( vdb.cache.filename(pkey) ) )), [ os.path.basename(pkey) ] )
+
+@unit_test
+def sparse_buffer( tmpdir ):
+    sb = vdb.memory.sparse_buffer( bytearray(b"a\x00\x00d"), bytearray(b"\x01\x00\x00\x01") )
+    expect( "length", len(sb), 4 )
+    expect( "bytes", list(sb), [ b"a", ..., ..., b"d" ] )
+    expect( "raw", bytes(sb), b"a\x00\x00d" )
+    expect( "all valid", sb.all_valid(), False )
+    expect( "runs", list(sb.runs()), [ (0,1,True), (1,3,False), (3,4,True) ] )
+    expect( "slice runs", list(sb[1:].runs()), [ (0,2,False), (2,3,True) ] )
+
+    # A few bytes in the middle that the memory map does not know to be unreadable
+    base = 0x10000
+    gdb.inferior_memory[:] = [ ( base, bytes(range(256)) * 32 + b"\x55" * 0x13 ), ( base + 0x2021, b"\xaa" * 0x1fdf ) ]
+    ret = vdb.memory.read_sparse( base, 0x4000 )
+    expect( "byte runs", list(ret.runs()), [ (0,0x2013,True), (0x2013,0x2021,False), (0x2021,0x4000,True) ] )
+    expect( "byte data", bytes(ret[0x2011:0x2023]), b"\x55\x55" + bytes(0xe) + b"\xaa\xaa" )
+    part = vdb.memory.read_partial( base + 0x1800, 0x2000 )
+    expect( "byte partial", len(part), 0x813 )
+
+    # A whole page, halving stops at pages when told so
+    gdb.inferior_memory[:] = [ ( base, bytes(range(256)) * 32 ), ( base + 0x3000, b"\xaa" * 0x1000 ) ]
+    reads = []
+    raw_read = vdb.memory.raw_read
+    def counted_read( addr, count ):
+        reads.append( ( addr, count ) )
+        return raw_read( addr, count )
+    with patched( vdb.memory, "raw_read", counted_read ), patched( vdb.memory.hole_granularity, "value", 0x1000 ):
+        ret = vdb.memory.read_sparse( base, 0x4000 )
+        expect( "runs", list(ret.runs()), [ (0,0x2000,True), (0x2000,0x3000,False), (0x3000,0x4000,True) ] )
+        expect( "data", bytes(ret[0x1ffe:0x3002]), b"\xfe\xff" + bytes(0x1000) + b"\xaa\xaa" )
+        if( len(reads) > 8 ):
+            raise AssertionError(f"{len(reads)} reads for a single unknown page")
+        part = vdb.memory.read_partial( base + 0x1800, 0x2000 )
+        expect( "partial", len(part), 0x800 )
+
+@unit_test
+def overlays( tmpdir ):
+    fn = os.path.join(tmpdir,"overlay_memory")
+    # Not the one in the current directory
+    with patched( vdb.memory, "overlays_loaded", True ):
+        try:
+            vdb.memory.clear_overlays()
+            vdb.memory.add_overlay( 0x1000, b"\x11\x22\x33\x44" )
+            vdb.memory.add_overlay( 0x1002, None, 4 )
+            vdb.memory.add_overlay( 0x2000, b"xyz" )
+            added = list(vdb.memory.overlays)
+            vdb.memory.save_overlays(fn)
+            vdb.memory.clear_overlays()
+            vdb.memory.load_overlays(fn)
+            expect( "loaded", vdb.memory.overlays, added )
+
+            # The later unreadable one wins over the end of the data
+            gdb.inferior_memory[:] = [ ( 0xffe, bytes(range(10)) ) ]
+            ret = vdb.memory.read_uncached( 0xffe, 10, sparse = True )
+            expect( "runs", list(ret.runs()), [ (0,4,True), (4,8,False), (8,10,True) ] )
+            expect( "data", bytes(ret), b"\x00\x01\x11\x22\x00\x00\x00\x00\x08\x09" )
+            expect( "untouched", vdb.memory.apply_overlay( 0x3000, 4, b"abcd" ), b"abcd" )
+
+            with open(fn,"wb") as f:
+                f.write(b"something else")
+            try:
+                vdb.memory.load_overlays(fn)
+                raise AssertionError("Loaded a file that is not an overlay file")
+            except ValueError:
+                pass
+        finally:
+            vdb.memory.clear_overlays()
+
+@unit_test
+def elf_symbols( tmpdir ):
+    index = vdb.elf.symbol_index()
+    for start,size,name in [ (0x1000,0x40,"outer"), (0x1010,0x4,"alias"), (0x1010,0x8,"inner"), (0x1100,0x10,"after") ]:
+        index.starts.append(start)
+        index.sizes.append(size)
+        index.names.append(name)
+    index.pie = True
+    index.sections = { ".data" : 0x4000, ".text" : 0x1000 }
+    index.files = 1
+    found = [ index.containing(a) for a in ( 0x1000, 0x1014, 0x1018, 0x1040, 0x10ff, 0x1105, 0xfff ) ]
+    expect( "containing", [ None if i is None else index.names[i] for i in found ],
+            [ "outer", "inner", "outer", None, None, "after", None ] )
+
+    # The load bias comes from where .text is, only what the index does not know is left to gdb
+    class objfile:
+        filename = "/bin/prog"
+        build_id = "0123456789abcdef"
+        owner = None
+    base = 0x555555554000
+    asked = []
+    def format_address( addr ):
+        asked.append(addr)
+        return f"{addr:#x}"
+    vdb.elf.symbol_indexes[objfile.build_id] = index
+    vdb.memory.sym_biases.clear()
+    vdb.memory.sym_sections = None
+    try:
+        with patched( vdb.elf, "objfile_for_address", lambda addr : objfile ), \
+             patched( gdb.Progspace, "filename", objfile.filename ), \
+             patched( gdb, "format_address", format_address ), \
+             patched( vdb.memory, "sym_cache", vdb.memory.sym_cache.__class__() ):
+            gdb.mockdata[("info","files")] = f"\t{base+0x1000:#018x} - {base+0x1200:#018x} is .text\n"
+            expect( "inner", vdb.memory.get_gdb_sym( base + 0x1014 ), ( base + 0x1010, 8, "inner" ) )
+            expect( "cached", vdb.memory.get_gdb_sym( base + 0x1012 ), ( base + 0x1010, 8, "inner" ) )
+            expect( "after", vdb.memory.get_gdb_sym( base + 0x110f ), ( base + 0x1100, 0x10, "after" ) )
+            expect( "asked gdb", asked, [] )
+            expect( "unknown", vdb.memory.get_gdb_sym( base + 0x1080 ), ( None, None, None ) )
+            expect( "asked gdb", asked, [ base + 0x1080 ] )
+    finally:
+        gdb.mockdata.pop( ("info","files"), None )
+        vdb.elf.symbol_indexes.clear()
+        vdb.memory.sym_biases.clear()
+        vdb.memory.sym_sections = None
+
+def track_rows( store, *numbers ):
+    return [ ( ts, ) + tuple( store.get(n,idx) for n in numbers ) for ts,idx in store.rows() ]
+
+@unit_test
+def track_store( tmpdir ):
+    with patched( vdb.track.max_rows, "value", 4 ), patched( vdb.track.max_age, "fvalue", 0.0 ):
+        store = vdb.track.track_store()
+        for i in range(6):
+            store.add( float(i*10), 1, i )
+        expect( "newest rows", track_rows(store,1), [ (20.0,2), (30.0,3), (40.0,4), (50.0,5) ] )
+
+        # Integers stay integers when a float goes in
+        store.add( 60.0, 1, 6.5 )
+        expect( "mixed", [ repr(v) for _,v in track_rows(store,1) ], [ "3", "4", "5", "6.5" ] )
+
+        # Late inserts keep to the limit too, and one older than everything is not stored at all
+        pos = store.end()
+        store.add( 45.0, 2, "late" )
+        expect( "late insert", track_rows(store,1,2), [ (40.0,4,None), (45.0,None,"late"), (50.0,5,None), (60.0,6.5,None) ] )
+        store.add( 1.0, 2, "too late" )
+        expect( "too old", len(store), 4 )
+        expect( "since", [ ts for ts,_ in store.rows(pos) ], [ 45.0 ] )
+
+        # The dropped rows are given back eventually, positions stay valid across that
+        pos = store.end()
+        for i in range(20):
+            store.add( 100.0 + i, 1, i )
+        expect( "compacted", len(store.timestamps) < 8, True )
+        expect( "since compaction", [ ts for ts,_ in store.rows(pos) ], [ 116.0, 117.0, 118.0, 119.0 ] )
+
+    with patched( vdb.track.max_rows, "value", 0 ), patched( vdb.track.max_age, "fvalue", 0.0 ):
+        # Each row is given out once, late ones too
+        store = vdb.track.track_store()
+        store.add( 1.0, 1, 1 )
+        store.add( 3.0, 1, 3 )
+        pos = store.end()
+        store.add( 2.0, 1, 2 )
+        store.add( 4.0, 1, 4 )
+        expect( "late since", [ ts for ts,_ in store.rows(pos) ], [ 2.0, 4.0 ] )
+        pos = store.end()
+        store.add( 5.0, 1, 5 )
+        expect( "appended since", [ ts for ts,_ in store.rows(pos) ], [ 5.0 ] )
+        pos = store.end()
+        expect( "nothing since", list(store.rows(pos)), [] )
+
+    with patched( vdb.track.max_rows, "value", 0 ), patched( vdb.track.max_age, "fvalue", 5.0 ):
+        store = vdb.track.track_store()
+        for i in range(10):
+            store.add( float(i), 1, float(i) )
+        expect( "max age", track_rows(store,1), [ (4.0,4.0), (5.0,5.0), (6.0,6.0), (7.0,7.0), (8.0,8.0), (9.0,9.0) ] )
+        store.add( 2.0, 1, 2.0 )
+        expect( "too old", len(store), 6 )
+
+@unit_test
+def hexdump_stream( tmpdir ):
+    base = 0x20000
+    gdb.inferior_memory[:] = [ ( base, bytes(range(256)) * 48 ) ]
+    fn = os.path.join(tmpdir,"dump")
+    def lines( addr, xlen ):
+        return [ vdb.color.strip(l) for l in vdb.hexdump.hexdump_lines( addr, xlen, symbols = False ) ]
+    def written( ):
+        with open(fn,encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    # Several chunks, the last one short
+    with patched( vdb.hexdump.chunk_size, "value", 0x400 ), patched( vdb.hexdump.file_colors, "value", False ):
+        want = lines( base, 0x4000 )
+        expect( "short read", want[-1], "Could only access 12288 of 16384 requested bytes" )
+        expect( "rows", len( [ l for l in want if l.startswith("0x") ] ), 0x300 )
+
+        # hexdump/f
+        vdb.hexdump.stream_hexdump( fn, base, 0x4000, symbols = False )
+        expect( "file", written(), want )
+
+        # hexdump/l, the pager gets the same in colour
+        with patched( vdb.hexdump.pager, "value", f"sh -c {shlex.quote('cat > ' + shlex.quote(fn))}" ):
+            vdb.hexdump.stream_hexdump( None, base, 0x4000, symbols = False )
+        expect( "pager", [ vdb.color.strip(l) for l in written() ], want )
+
+        # Quitting the pager early is fine
+        with patched( vdb.hexdump.pager, "value", "true" ):
+            vdb.hexdump.stream_hexdump( None, base, 0x4000, symbols = False )
+
+        # Short within the first chunk
+        expect( "first chunk", lines( base + 0x2f00, 0x200 )[-1], "Could only access 256 of 512 requested bytes" )
+
+def run_tests( ):
+
+    parser = argparse.ArgumentParser(description='run vdb offline tests.')
+    parser.add_argument("-f","--filter", type=str, action="store", help = "Regex to filter tests for")
+    parser.add_argument("-d","--debug", action="store_true", help = "Show backtraces of failing tests")
+
+    args = parser.parse_args(sys.argv[1:])
+
+    global debug
+    debug = args.debug
+
+    selected = tests
+    if( args.filter ):
+        cre = re.compile(args.filter)
+        selected = [ t for t in tests if cre.search(t[0]) is not None ]
+
+    # The mock types have no size, addresses would all be cut to 0
+    vdb.arch.pointer_size = 64
+
+    failed = 0
+    for name,func in selected:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            vdb.vdb_dir = tmpdir
+            gdb.inferior_memory.clear()
+            try:
+                func(tmpdir)
+                color(f"{name} OK",goodcolor)
+            except Exception as e:
+                failed += 1
+                color(f"{name} FAILED: {e}",failcolor)
+                if( debug ):
+                    vdb.print_exc()
+    print(f"{len(selected)-failed} of {len(selected)} tests passed")
+    if( failed > 0 ):
+        return 1
+    return 0
+
+sys.exit( run_tests() )
+# vim: tabstop=4 shiftwidth=4 expandtab ft=python
@@ -12,6 +12,8 @@ import vdb.arch
 import vdb.register
 import vdb.memory
 import vdb.swo
+import vdb.cache
+import vdb.elf
 
 import gdb
 import colors
@@ -22,11 +24,18 @@ import rich
 import rich.syntax
 import traceback
 import pickle
+import shutil
 import sys
 import os
 import time
 import abc
 import typing
+import collections
+import bisect
+import intervaltree
+import array
+import struct
+import mmap
 
 asm_class_colors_defaults = {
             "jump" : "#f0f",
@@ -48,6 +57,76 @@ asm_class_colors = {}
 for cl,col in asm_class_colors_defaults.items():
     asm_class_colors[cl] = vdb.config.parameter(f"vdb-asm-colors-class-{cl}", col, gdb_type = vdb.config.PARAM_COLOUR )
 
+class mnemonic_dispatch:
+    """
+    Finds the value for a mnemonic from an ordered list of ( regex, value ) where the first one that re.match()es wins.
+    Alternatives that are just a word (optionally followed by .*) are prefixes and go into a trie, only the others are
+    still tried as regular expressions. Every mnemonic is looked up only once, after that it is a dict access.
+    """
+
+    plainre = re.compile("^[A-Za-z0-9_]*$")
+
+    def __init__( self, relist = [], default = None ):
+        self.default = default
+        self.trie = {}
+        self.res = []
+        self.cache = {}
+        for idx,(r,v) in enumerate(relist):
+            for alt in r.split("|"):
+                if( alt.endswith(".*") ):
+                    alt = alt[:-2]
+                if( self.plainre.match(alt) ):
+                    self.add( alt, v, idx )
+                else:
+                    self.res.append( ( idx, re.compile(alt), v ) )
+
+    def add( self, prefix, value, priority ):
+        """
+        Adds a prefix, on multiple matches the one with the lowest priority wins
+        """
+        self.cache = {}
+        node = self.trie
+        for c in prefix:
+            node = node.setdefault(c,{})
+        old = node.get(None,None)
+        if( old is None or priority < old[0] ):
+            node[None] = ( priority, prefix, value )
+
+    def find( self, mnemonic ):
+        """
+        Returns ( priority, prefix, value ) of the best match or None
+        """
+        try:
+            return self.cache[mnemonic]
+        except KeyError:
+            pass
+        node = self.trie
+        best = node.get(None,None)
+        for c in mnemonic:
+            node = node.get(c,None)
+            if( node is None ):
+                break
+            m = node.get(None,None)
+            if( m is not None and ( best is None or m[0] < best[0] ) ):
+                best = m
+        for idx,r,v in self.res:
+            if( best is not None and idx >= best[0] ):
+                break
+            if( r.match(mnemonic) ):
+                best = ( idx, r.pattern, v )
+                break
+        self.cache[mnemonic] = best
+        return best
+
+    def get( self, mnemonic ):
+        m = self.find(mnemonic)
+        if( m is None ):
+            return self.default
+        return m[2]
+
+    def __contains__( self, mnemonic ):
+        return mnemonic in self.cache
+
 asm_colors_dot = [
         ( "j.*", "#f000f0" ),
         ( "b.*", "#f000f0" ),
@@ -75,13 +154,31 @@ pre_colors_dot = [
         ( "rep.*","#f02090" ),
         ]
 
+asm_colors_dot_dispatch = mnemonic_dispatch( asm_colors_dot )
+pre_colors_dispatch = mnemonic_dispatch( pre_colors )
+pre_colors_dot_dispatch = mnemonic_dispatch( pre_colors_dot )
+
 @vdb.event.start()
-@vdb.event.theme_changed()
 def invalidate_cache( c ):
     global parse_cache
     if( len(parse_cache) ):
         vdb.log("Invalidating disassembler parse cache",level=4)
     parse_cache = {}
+    invalidate_render_cache(c)
+
+# The rendered output of a listing depends on more than just the parsed instructions. Whenever one of these other
+# things changes, this is incremented and the listings will discard their memoised output on the next to_str()
+render_generation = 0
+
+@vdb.event.theme_changed()
+@vdb.event.breakpoint_created()
+@vdb.event.breakpoint_modified()
+@vdb.event.breakpoint_deleted()
+@vdb.event.new_objfile()
+def invalidate_render_cache( c ):
+    global render_generation
+    vdb.log("Invalidating disassembler render cache",level=5)
+    render_generation += 1
 
 bp_marker = vdb.config.parameter("vdb-asm-breakpoint-marker", "⬤" )
 bp_marker_disabled = vdb.config.parameter("vdb-asm-breakpoint-disabled-marker", "◯" )
@@ -158,6 +255,7 @@ dot_fonts          = vdb.config.parameter("vdb-asm-font-dot", "Inconsolata,Sourc
 
 callgrind_events   = vdb.config.parameter("vdb-asm-callgrind-events", "Ir,CEst", gdb_type = vdb.config.PARAM_ARRAY )
 callgrind_jumps    = vdb.config.parameter("vdb-asm-callgrind-show-jumps", True )
+callgrind_index    = vdb.config.parameter("vdb-asm-callgrind-index", True )
 header_repeat      = vdb.config.parameter("vdb-asm-header-repeat", 50 )
 direct_output      = vdb.config.parameter("vdb-asm-direct-output", True )
 gv_limit           = vdb.config.parameter("vdb-asm-variable-expansion-limit", 3 )
@@ -166,9 +264,10 @@ annotate_jumps     = vdb.config.parameter("vdb-asm-annotate-jumps", True )
 annotate_cmove     = vdb.config.parameter("vdb-asm-annotate-cmove", True )
 asm_explain        = vdb.config.parameter("vdb-asm-explain", False, on_set = invalidate_cache  )
 ref_width          = vdb.config.parameter("vdb-asm-reference-width", 120 )
+persistent_cache   = vdb.config.parameter("vdb-asm-persistent-cache", True )
+engine             = vdb.config.parameter("vdb-asm-engine", "text", on_set = invalidate_cache )
+window_threshold   = vdb.config.parameter("vdb-asm-window-threshold", 2000 )
 
-callgrind_eventmap = {} # name to index
-callgrind_data = {}
 from_tty = None
 
 xi_history = {}
@@ -715,30 +814,20 @@ class instruction_base( abc.ABC ):
     bytere2 = re.compile("^[0-9a-fA-F][0-9a-fA-F][0-9a-fA-F][0-9a-fA-F]$")
     cmpre  = re.compile(r"^\$(0x[0-9a-fA-F]*),.*")
 
-#    class_cache = {}
-#    class_res = []
+#    class_res = mnemonic_dispatch()
+
+    # How the raw bytes of an instruction are shown by gdb in this dialect, used by the native disassembler engines
+    @staticmethod
+    def byte_tokens( data ):
+        return [ f"{b:02x}" for b in data ]
 
     @staticmethod
     def compile_class_res( relist ):
-        ret = []
-        for r,n in relist:
-            ret.append( ( re.compile(r), n ) )
-        return ret
+        return mnemonic_dispatch( relist, "default" )
 
     @classmethod
     def mnemonic_class( cls, mnemonic ):
-        # XXX can be a base class functionality
-        ret = cls.class_cache.get( mnemonic )
-        if( ret is None ):
-            for r,n in cls.class_res:
-                if( r.match(mnemonic) ):
-                    ret = n
-                    cls.class_cache[mnemonic] = n
-                    break
-            else:
-                ret = "default"
-                cls.class_cache[mnemonic] = "default"
-        return ret
+        return cls.class_res.get( mnemonic )
 
     def __init__( self ):
         self.mnemonic = None            # Instructions "name" like mov or sub or push or call
@@ -806,35 +895,18 @@ class instruction_base( abc.ABC ):
     @abc.abstractmethod
     def executes( self, flags ):...
 
-    # parse common parts of all asm dialects like
+    # take over the common parts of all asm dialects from the decoded_instruction like
     # - current position marker
     # - address
     # - offset marker ( <+55> )
-    def parse_common( self, line, m, oldins ):
-        self.line = line
-
-        tokens = line.split()
-        marker = m.group(1)
-        if( marker is not None ):
-            self.marked = True
-            tokens = tokens[1:]
-
-        addr = tokens[0].strip()
-        # A : there tells us there is no <+###> offset following (common when the symbol is not known)
-        if( addr[-1] == ":" ):
-            addr = addr[:-1]
-            self.offset = ""
-            del tokens[0] # address
-        else:
-            self.offset = tokens[1].strip()[1:-2]
-            if( self.offset[0] == "+" ):
-                self.offset = self.offset[1:]
-            del tokens[0] # address
-            del tokens[0] # offset
+    # and return the tokens of the rest, starting with the bytes
+    def parse_common( self, dec, oldins ):
+        self.line = dec.line
+        self.marked = dec.marked
+        self.address = dec.address
+        self.offset = dec.offset
 
-        self.address = vdb.util.xint(addr)
-
-        return tokens
+        return dec.bytes + dec.text.split()
 
     def color_mnemonic( self ):
         if( len(color_mnemonic.value) > 0 ):
@@ -978,11 +1050,38 @@ class instruction_base( abc.ABC ):
         return ret
 
     @abc.abstractmethod
-    def parse( self, line, m, oldins ):
+    def parse( self, dec, oldins ):
         pass
+
+    # For the persistent parse cache. Linking next/previous directly would make pickle recurse through the whole
+    # listing, so we store the addresses and the listing links them up again when loading.
+    def __getstate__( self ):
+        state = self.__dict__.copy()
+        for n in ( "next", "previous" ):
+            if( state[n] is not None ):
+                state[n] = state[n].address
+        state["loaded_from"] = set()
+        return state
 # Reset should we ever be able to change classes dynamically
 
 
+class basic_block( ):
+    """
+    A run of instructions that is only ever entered at the first one. Remembers the values it was flowed with and what
+    came out of it so register_flow() can skip it the next time when they are the same.
+    """
+
+    def __init__( self ):
+        self.instructions = []
+        self.successors = []
+        self.history = []       # ( key, output ) of each visit during the last flow
+        self.visits = []        # [ key, input registers, input flags, output ] of each visit during the current flow
+        self.reused = False     # Results of the last flow are still valid for this one
+        self.had_marker = False
+
+    def __str__( self ):
+        return f"BB @{int(self.instructions[0].address):#0x} ({len(self.instructions)} instructions, {len(self.successors)} successors)"
+
 class listing( ):
 
     def __init__( self ):
@@ -1006,6 +1105,81 @@ class listing( ):
         self.initial_registers = register_set()
         self.marker = None
         self.frame = None
+        self.render_cache = {}
+        self.render_generation = None
+        self.basic_blocks = None
+        self.flow_token = None
+        self.cell_cache = {}
+        self.addresses = None
+        self.jump_tree = None
+        self.bt_window = None
+        self.var_index = None
+
+    def __getstate__( self ):
+        state = self.__dict__.copy()
+        state["frame"] = None
+        state["marker"] = None
+        state["bt_q"] = []
+        state["render_cache"] = {}
+        state["render_generation"] = None
+        state["basic_blocks"] = None
+        state["flow_token"] = None
+        state["cell_cache"] = {}
+        state["addresses"] = None
+        state["jump_tree"] = None
+        state["var_index"] = None
+        return state
+
+    def __setstate__( self, state ):
+        self.__dict__.update(state)
+        for ins in self.instructions:
+            if( ins.next is not None ):
+                ins.next = self.by_addr.get(ins.next)
+            if( ins.previous is not None ):
+                ins.previous = self.by_addr.get(ins.previous)
+
+    def cfg( self ):
+        """
+        Splits the instructions into basic blocks, this is done only once per listing. A block ends at anything that
+        jumps (or calls) somewhere within the listing or does not continue with the next instruction and the next one
+        starts at every jump target. Returns the list of blocks, the entry block first.
+        """
+        if( self.basic_blocks is not None ):
+            return self.basic_blocks
+
+        leaders = { self.instructions[0].address }
+        for ins in self.instructions:
+            for tga in ins.targets:
+                if( tga in self.by_addr ):
+                    leaders.add(tga)
+                    if( ins.next is not None ):
+                        leaders.add(ins.next.address)
+
+        blocks = []
+        by_start = {}
+        bb = None
+        for ins in self.instructions:
+            if( bb is None or ins.address in leaders ):
+                bb = basic_block()
+                blocks.append(bb)
+                by_start[ins.address] = bb
+            bb.instructions.append(ins)
+            if( ins.next is None ):
+                bb = None
+
+        for bb in blocks:
+            last = bb.instructions[-1]
+            for tga in sorted(last.targets):
+                tbb = by_start.get(tga,None)
+                if( tbb is not None ):
+                    bb.successors.append(tbb)
+            if( last.next is not None ):
+                nbb = by_start.get(last.next.address,None)
+                if( nbb is not None ):
+                    bb.successors.append(nbb)
+
+        self.basic_blocks = blocks
+        return blocks
 
     def get_frame_register( self, reg ):
         ret = None
@@ -1033,9 +1207,9 @@ class listing( ):
 
     # XXX generic enough for utils?
     def color_relist( self, s, l ):
-        for r,c in l:
-            if( re.match(r,s) ):
-                return vdb.color.color(s,c)
+        c = l.get(s)
+        if( c is not None ):
+            return vdb.color.color(s,c)
         return s
 
 
@@ -1045,7 +1219,7 @@ class listing( ):
             if( len(color_prefix.value) > 0 ):
                 ret.append( vdb.color.color(pf,color_prefix.value) )
             else:
-                ret.append( self.color_relist(pf,pre_colors) )
+                ret.append( self.color_relist(pf,pre_colors_dispatch) )
         return " ".join(ret)
     """
 ascii mockup:
@@ -1106,6 +1280,29 @@ ascii mockup:
 #                print("tgt = '%s'" % (tgt,) )
 
     def finish( self ):
+        self.do_backtrack()
+
+        self.finished = True
+
+        # Seperate loop for the later needs all informaation always
+        for ins in self.instructions:
+            self.add_target(ins)
+            if( ins.marked ):
+                self.marker = int(ins.address)
+#                print(f"{self.marker=:#0x}")
+
+        self.maxarrows = self.layout_arrows( self.instructions )
+
+        if( debug_all() ):
+            for ins in self.instructions:
+                if( debug_all(ins) ):
+                    ins._gen_debug()
+
+    def layout_arrows( self, instructions, crossing = () ):
+        """
+        Computes the jump arrows for the instructions. crossing are the ( from, to ) addresses of jumps that are already
+        going on at the first instruction, for when only a part of the listing is laid out. Returns the width needed.
+        """
         global ix
         ix = -1
 
@@ -1220,20 +1417,13 @@ ascii mockup:
                 cl[i] = None
             return ( ret, alen )
 
-        self.do_backtrack()
-
-        self.finished = True
         current_lines = []
-        adict = {}
+        for fr,to in crossing:
+            ar = arrow(fr,to)
+            ar.rows = 1 # started further up
+            find_next( current_lines, ar )
 
-        # Seperate loop for the later needs all informaation always
-        for ins in self.instructions:
-            self.add_target(ins)
-            if( ins.marked ):
-                self.marker = int(ins.address)
-#                print(f"{self.marker=:#0x}")
-
-        for ins in self.instructions:
+        for ins in instructions:
 #            print("INS_----------------------------------")
 #            print("ins = '%s'" % ins )
             self.add_target(ins)
@@ -1270,29 +1460,24 @@ ascii mockup:
                         find_next( current_lines, ar )
             (ins.jumparrows,ins.arrowwidth) = to_arrows(ins,current_lines)
 
-        while( self.optimize_arrows() ):
+        while( self.optimize_arrows( instructions ) ):
             pass
 
-        for ins in self.instructions:
+        for ins in instructions:
             nj = ""
             for ja,jl in ins.jumparrows:
                 nj += acolor(ja,jl)
             ins.jumparrows = nj
 
-        self.maxarrows = len(current_lines)+1
+        return len(current_lines)+1
 
-        if( debug_all() ):
-            for ins in self.instructions:
-                if( debug_all(ins) ):
-                    ins._gen_debug()
-
-    def optimize_arrows( self ):
+    def optimize_arrows( self, instructions ):
         start = -1
         col = 0
         ecol = 5000
         ret = False
-        for ii in range(0,len(self.instructions) ):
-            ins = self.instructions[ii]
+        for ii in range(0,len(instructions) ):
+            ins = instructions[ii]
 #            print("ins.address = '0x%x'" % (ins.address,) )
 #            print("ii = '%s'" % (ii,) )
 #            print("len(ins.jumparrows) = '%s'" % (len(ins.jumparrows),) )
@@ -1323,7 +1508,7 @@ ascii mockup:
 #                    print("start = '%s'" % (start,) )
 #                    print("ii = '%s'" % (ii,) )
                     for ni in range(start,ii+1):
-                        mi = self.instructions[ni]
+                        mi = instructions[ni]
                         ma,ml = mi.jumparrows[col]
 #                        print("ma = '%s'" % (ma,) )
                         if( col == 0 ):
@@ -1368,6 +1553,120 @@ ascii mockup:
             return
         self.finish()
 
+    def jump_index( self ):
+        """
+        Interval tree of all jumps within the listing, built once. Used to find the jumps crossing a part of it.
+        """
+        if( self.jump_tree is None ):
+            for ins in self.instructions:
+                self.add_target(ins)
+            tree = intervaltree.IntervalTree()
+            for ins in self.instructions:
+                for tgt in ins.targets:
+                    if( tgt > ins.address and tgt <= self.end ):
+                        tree[ins.address:tgt+1] = ( ins.address, tgt )
+                    elif( tgt < ins.address and tgt in self.by_addr ):
+                        tree[tgt:ins.address+1] = ( ins.address, tgt )
+            self.jump_tree = tree
+        return self.jump_tree
+
+    def index_at( self, addr ):
+        """
+        Index of the instruction that contains addr, or None
+        """
+        if( self.addresses is None ):
+            self.addresses = [ int(i.address) for i in self.instructions ]
+        idx = bisect.bisect_right( self.addresses, addr ) - 1
+        if( idx < 0 ):
+            return None
+        i = self.instructions[idx]
+        if( addr == i.address or ( addr - i.address ) < len(i.bytes) ):
+            return idx
+        return None
+
+    def vars_at( self, pc ):
+        """
+        The ( expressions, addresses ) dicts of the variables in scope at pc
+        """
+        if( self.var_index is not None ):
+            ret = self.var_index.at(pc)
+            if( ret is not None ):
+                return ret
+        return ( self.var_expressions, self.var_addresses )
+
+    def view_window( self, context, marked ):
+        """
+        For big listings where only some context around marked is shown, the range of instructions that is visible.
+        None if the whole listing needs to be rendered.
+        """
+        if( context is None or marked is None or window_threshold.value is None ):
+            return None
+        if( len(self.instructions) <= window_threshold.value ):
+            return None
+        center = self.index_at(marked)
+        if( center is None ):
+            return None
+        lo,hi = self.compute_context(context,center)
+        if( lo is None ):
+            return None
+        lo = max(lo,0)
+        hi = min(hi,len(self.instructions))
+        if( lo == 0 and hi == len(self.instructions) ):
+            return None
+        return ( lo, hi )
+
+    def finish_window( self, window, showspec ):
+        """
+        What finish() does, but only for the instructions in the window and the jumps crossing into it
+        """
+        lo,hi = window
+        jumps = self.jump_index()
+        if( any((c in showspec) for c in "jhH" ) ):
+            self.do_backtrack( window )
+
+        if( "d" in showspec ):
+            instructions = self.instructions[lo:hi]
+            top = int(instructions[0].address)
+            crossing = [ iv.data for iv in sorted(jumps.at(top)) if iv.begin < top ]
+            self.maxarrows = self.layout_arrows( instructions, crossing )
+            # The arrows are now only good for this window
+            self.finished = False
+
+    def static_columns( self, i ):
+        """
+        The columns that only depend on the instruction itself and the configuration, computed only once
+        """
+        ret = self.cell_cache.get(i.address,None)
+        if( ret is not None ):
+            return ret
+        ret = {}
+        try:
+#            io = vdb.util.xint(i.offset)
+            io = int(i.offset)
+            ret["o"] = vdb.color.colorl(offset_fmt.value.format(offset = io, maxlen = self.maxoffset ),color_offset.value)
+        except:
+            ret["o"] = vdb.color.colorl(offset_txt_fmt.value.format(offset = i.offset, maxlen = self.maxoffset ),color_offset.value)
+
+        ret["b"] = vdb.color.colorl(f"{' '.join(i.bytes)}",color_bytes.value)
+
+        pre = self.color_prefix(i.prefixes)
+#        mne = self.color_mnemonic(i.mnemonic)
+        mne = i.color_mnemonic()
+        mxe = pre + i.infix + mne
+        mlen = len(" ".join(i.prefixes)) + len(i.infix) + len(i.mnemonic)
+        ret["n"] = ( mxe, mlen )
+
+        if( i.args is not None ):
+#            args = ",".join(i.args)
+            args = i.args_string
+#            line.append( vdb.color.color(f" {i.args:{self.maxargs}}",color_args.value))
+            ret["p"] = (vdb.color.color(f"{args}",color_args.value),len(args))
+        else:
+            ret["p"] = None
+
+        self.cell_cache[i.address] = ret
+        return ret
+
     def next_backtrack( self ):
         btsym = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
         if( self.current_branch >= len(btsym) ):
@@ -1381,6 +1680,8 @@ ascii mockup:
         self.bt_q.append( (idx,bt,limit) )
 
     def backtrack_next( self, idx, bt, limit ):
+        if( self.bt_window is not None and not ( self.bt_window[0] <= idx < self.bt_window[1] ) ):
+            return
         ins=self.instructions[idx]
         if( ins.bt is not None ):
             return
@@ -1398,10 +1699,17 @@ ascii mockup:
         self.q_backtrack_next( idx-1, (bt[0]+1,bt[1]), limit - 1 )
 
 
-    def do_backtrack( self ):
+    # With a window only the instructions in there are looked at (and the map of jump sources is assumed to be there
+    # already from a previous full run)
+    def do_backtrack( self, window = None ):
 #        vdb.util.bark() # print("BARK")
-        self.ins_map = {}
-        idx = 0
+        if( window is None ):
+            self.ins_map = {}
+            window = ( 0, len(self.instructions) )
+            self.bt_window = None
+        else:
+            self.bt_window = window
+        full = ( self.bt_window is None )
         midx = None
         self.current_branch = 0
 #        if( any((c in showspec) for c in "hH" ) ):
@@ -1427,7 +1735,8 @@ ascii mockup:
                     if( h.is_speculative ):
                         hn = -hn
                     inh.setdefault(h.pc,[]).append(str(hn))
-        for i in self.instructions:
+        for idx in range(*window):
+            i = self.instructions[idx]
             if( rec is not None ):
                 h = inh.get(i.address,None)
                 if( h is not None ):
@@ -1435,13 +1744,13 @@ ascii mockup:
 #                    print("h = '%s'" % h )
             i.bt_idx = idx
             i.bt = None
-            for sr in i.target_of:
-                self.ins_map.setdefault(i.address,set()).add(sr)
-            for tgt in i.targets:
-                self.ins_map.setdefault(tgt,set()).add(i.address)
+            if( full ):
+                for sr in i.target_of:
+                    self.ins_map.setdefault(i.address,set()).add(sr)
+                for tgt in i.targets:
+                    self.ins_map.setdefault(tgt,set()).add(i.address)
             if( i.marked ):
                 midx = idx
-            idx += 1
 
 #        print("midx = '%s'" % midx )
         # Just don't do anything if we have no marker
@@ -1479,7 +1788,42 @@ ascii mockup:
     p_trans = str.maketrans("v^-|<>u#Q~T+","|  |   |  ||" )
 
     def to_str( self, showspec = "maodbnpSrT", context = None, marked = None, source = False, suppress_header = False, full_source = False ):
-        self.lazy_finish()
+        current_pc = self.get_frame_register(last_working_pc)
+        if( current_pc is None ):
+            current_pc = 0
+        else:
+            current_pc = int( current_pc )
+
+        if( self.render_generation is None or self.render_generation[1] != vdb.config.generation ):
+            # finish() bakes the colours into the jump arrows
+            self.finished = False
+            self.cell_cache = {}
+        rgen = ( render_generation, vdb.config.generation )
+        if( self.render_generation != rgen ):
+            self.render_cache = {}
+            self.render_generation = rgen
+
+        if( context is not None ):
+            context = tuple(context)
+        window = self.view_window( context, marked )
+        if( window is None ):
+            self.lazy_finish()
+
+        # The SWO counters change all the time without any event telling us, never cache those
+        rkey = None
+        if( "w" not in showspec ):
+            rkey = ( showspec, context, marked, source, suppress_header, full_source, self.marker, current_pc )
+            ret = self.render_cache.get(rkey,None)
+            if( ret is not None ):
+                return ret
+        if( window is not None ):
+            self.finish_window( window, showspec )
+        ret = self._to_str( showspec, context, marked, source, suppress_header, full_source, current_pc, window )
+        if( rkey is not None ):
+            self.render_cache[rkey] = ret
+        return ret
+
+    def _to_str( self, showspec, context, marked, source, suppress_header, full_source, current_pc, window = None ):
 
         marked_line = None
         context_start = None
@@ -1496,14 +1840,18 @@ ascii mockup:
 
         cg_events = []
         cg_header = []
-        if( len(callgrind_eventmap) > 0 ):
+        cg_data = {}
+        cg_known = callgrind_event_names()
+        if( len(cg_known) > 0 ):
             for evn in callgrind_events.elements:
-                ix = callgrind_eventmap.get(evn,None)
-                if( ix is not None ):
-                    cg_events.append(ix)
+                if( evn in cg_known ):
+                    cg_events.append(evn)
                     cg_header.append( (evn,",,bold",0) )
                 else:
                     vdb.util.log(f"Specified callgrind event {evn} not present in any loaded file", level = 4)
+            if( "c" in showspec ):
+                # Only what is needed for this listing
+                cg_data = callgrind_range( self.start, self.end )
 
         headfields = [    ("m" ,[ ("Marker",",,bold",0,0) ])
                         , ("a" ,[("Address",",,bold")])
@@ -1535,6 +1883,12 @@ ascii mockup:
                     cnt += 1
         num_headfields = len(header)
         cnt = 0
+        lines = range(0,len(self.instructions))
+        if( window is not None ):
+            lines = range(*window)
+            cnt = window[0]
+            # Only the visible part gets rendered, so there is nothing to cut away later
+            context = None
 
 #        print(f"{header_indices=}")
 
@@ -1548,11 +1902,6 @@ ascii mockup:
         for _,bp in raw_breakpoints.items():
             breakpoints[bp.address] = bp
 
-        current_pc = self.get_frame_register(last_working_pc)
-        if( current_pc is None ):
-            current_pc = 0
-        else:
-            current_pc = int( current_pc )
 #        print(f"{current_pc=:#0x}")
 #        vdb.util.bark() # print("BARK")
 #        print(f"{context=}")
@@ -1592,7 +1941,8 @@ ascii mockup:
 #                tc = vdb.util.table_cell( swos, sco, len(swos), None, None )
                 return ( swos, gcol )
 
-        for idx,i in enumerate(self.instructions):
+        for idx in lines:
+            i = self.instructions[idx]
             if( idx > 0 ):
                 previous = self.instructions[idx-1]
                 if( previous.address <= current_pc < i.address ):
@@ -1712,14 +2062,10 @@ ascii mockup:
                 else:
                     line.append(None)
 
+            static_cols = self.static_columns(i)
             if( "o" in showspec ):
                 prejump += 1
-                try:
-#                    io = vdb.util.xint(i.offset)
-                    io = int(i.offset)
-                    line.append( vdb.color.colorl(offset_fmt.value.format(offset = io, maxlen = self.maxoffset ),color_offset.value))
-                except:
-                    line.append( vdb.color.colorl(offset_txt_fmt.value.format(offset = i.offset, maxlen = self.maxoffset ),color_offset.value))
+                line.append( static_cols["o"] )
 
             if( "x" in showspec ):
                 prejump += 1
@@ -1734,10 +2080,11 @@ ascii mockup:
 
             if( "c" in showspec ):
 
-                ci = callgrind_data.get( i.address, None )
+                ci = cg_data.get( i.address, None )
                 if( ci is not None ):
-                    for _,jump in ci.jumps.items():
-                        line_extra.append( (str(jump),0,0) )
+                    if( callgrind_jumps.value ):
+                        for _,jump in ci.jumps.items():
+                            line_extra.append( (str(jump),0,0) )
                     for cge in cg_events:
                         cv = ci.event(cge)
                         if( cv == 0 ):
@@ -1780,18 +2127,13 @@ ascii mockup:
 
             if( "b" in showspec ):
                 postjump += 1
-                line.append( vdb.color.colorl(f"{' '.join(i.bytes)}",color_bytes.value) )
+                line.append( static_cols["b"] )
             aslen = 0
 #            xline = line + "123456789012345678901234567890"
 #            print(xline)
             if( "n" in showspec ):
                 postjump += 1
-                pre = self.color_prefix(i.prefixes)
-#                mne = self.color_mnemonic(i.mnemonic)
-                mne = i.color_mnemonic()
-                mxe = pre + i.infix + mne
-
-                mlen = len(" ".join(i.prefixes)) + len(i.infix) + len(i.mnemonic)
+                mxe,mlen = static_cols["n"]
 #                aslen += mlen
 #                if( i.args is not None ):
 #                    mlen = self.maxmnemoic - mlen
@@ -1807,12 +2149,7 @@ ascii mockup:
             if( "p" in showspec ):
                 if( i.args is not None ):
                     aslen += self.maxargs + 1
-#                    args = ",".join(i.args)
-                    args = i.args_string
-#                    line.append( vdb.color.color(f" {i.args:{self.maxargs}}",color_args.value))
-                    line.append( (vdb.color.color(f"{args}",color_args.value),len(args)) )
-                else:
-                    line.append(None)
+                line.append( static_cols["p"] )
 #            maxlen = self.maxmnemoic+self.maxargs+2
 #            print("maxlen = '%s'" % maxlen )
 #            print("aslen = '%s'" % aslen )
@@ -2049,7 +2386,7 @@ ascii mockup:
             hf = wrap_shorten(hf)
 
 
-        return f"Instructions in range {self.start:#0x} - {self.end:#0x} of {hf}\n{ret}"
+        return f"Instructions in range {self.start:#0x} - {self.end:#0x} of {hf}{vdb.asm.callgraph.summary(self.start)}\n{ret}"
 #        return "\n".join(ret)
 
     def print( self, showspec = "maodbnpSrT", context = None, marked = None, source = False, full_source = False ):
@@ -2059,9 +2396,9 @@ ascii mockup:
             print(self.to_str(showspec, context, marked,source,False,full_source))
 
     def color_dot_relist( self, s, l ):
-        for r,c in l:
-            if( re.match(r,s) ):
-                return vdb.dot.color(s,c)
+        c = l.get(s)
+        if( c is not None ):
+            return vdb.dot.color(s,c)
         return vdb.dot.dot_escape(s)
 
 
@@ -2103,14 +2440,14 @@ ascii mockup:
                 if( len(color_prefix_dot.value) > 0 ):
                     pcol = vdb.dot.color(" ".join(i.prefixes),color_prefix_dot.value)
                 else:
-                    pcol = self.color_dot_relist(" ".join(i.prefixes),pre_colors_dot)
+                    pcol = self.color_dot_relist(" ".join(i.prefixes),pre_colors_dot_dispatch)
                 txt += pcol
                 txt += "&nbsp;"
 
             if( len(color_mnemonic_dot.value) > 0 ):
                 mcol = vdb.dot.color(i.mnemonic,color_mnemonic_dot.value)
             else:
-                mcol = self.color_dot_relist(i.mnemonic,asm_colors_dot)
+                mcol = self.color_dot_relist(i.mnemonic,asm_colors_dot_dispatch)
             txt += mcol
             tr.td_raw(txt)
 
@@ -2376,6 +2713,11 @@ def fix_marker( ls, alt = None, frame = None, do_flow = True ):
             else:
                 previous.rmarked = False
 
+    # Only when it has been flowed before, otherwise the caller is going to do it anyways. Thanks to the per block caching
+    # this only recomputes what the new marker affects.
+    if( do_flow and ls.flow_token is not None ):
+        register_flow(ls,frame)
+
     return ls
 
 
@@ -2707,6 +3049,158 @@ def gather_vars( frame, lng, symlist, pval = None, prefix = "", reglist = None,
     return ret
 
 
+# Just enough of a listing for gather_vars() to collect the variables of one block into
+class var_collector:
+
+    def __init__( self, initial_registers ):
+        self.var_addresses = {}
+        self.var_expressions = {}
+        self.initial_registers = initial_registers
+
+class var_index:
+    """
+    Which variables of a function are where, for each range of pcs with the same blocks in scope. The expressions
+    relative to the base/stack pointer are the same for every invocation of the function, addresses in the stack frame
+    are kept relative to the base pointer so they can be moved to another frame of the same function by rebase().
+    """
+
+    def __init__( self ):
+        self.starts = []        # sorted starts of the pc ranges
+        self.ends = []
+        self.expressions = []   # per range: expression to variable
+        self.frame_offsets = [] # per range: offset to the base pointer to variable
+        self.addresses = []     # per range: absolute address to variable (statics, or through pointers)
+        self.resolved = []      # per range: addresses and frame_offsets for the current base
+        self.base = None
+        self.header = ""
+        self.user_expressions = {}
+        self.user_addresses = {}
+
+    def at( self, pc ):
+        idx = bisect.bisect_right( self.starts, pc ) - 1
+        if( idx < 0 or pc >= self.ends[idx] ):
+            return None
+        return ( self.expressions[idx], self.resolved[idx] )
+
+    def rebase( self, base ):
+        self.base = base
+        self.resolved = []
+        for addrs,offsets in zip(self.addresses,self.frame_offsets):
+            res = dict(addrs)
+            if( base is not None ):
+                for o,n in offsets.items():
+                    res[base+o] = n
+            self.resolved.append(res)
+
+    def all_vars( self ):
+        """
+        The ( expressions, addresses ) of all the variables of the function
+        """
+        expressions = dict(self.user_expressions)
+        addresses = dict(self.user_addresses)
+        for ex,ad in zip(self.expressions,self.resolved):
+            expressions.update(ex)
+            addresses.update(ad)
+        return ( expressions, addresses )
+
+# The base pointer if it looks like it is used as a frame pointer, addresses in the stack frame are kept relative to it
+def frame_base( frame ):
+    try:
+        rbpval = frame.read_register(current_arch.base_pointer)
+        rspval = frame.read_register(current_arch.stack_pointer)
+    except (gdb.error,ValueError):
+        return None
+    if( rbpval is None or rspval is None ):
+        return None
+    rbpval = int(rbpval)
+    if( 0 <= rbpval - int(rspval) < 1024*1024 ):
+        return rbpval
+    return None
+
+def build_var_index( frame, ls, block ):
+    """
+    Gathers the variables of all blocks that are part of the function of the listing, the user defined ones that are
+    already in the listing are in scope everywhere.
+    """
+    ret = var_index()
+    ret.user_expressions = ls.var_expressions
+    ret.user_addresses = ls.var_addresses
+
+    # The blocks of all instructions, up to the one of the function
+    blocks = {}
+    def add_chain( b ):
+        while( b is not None and not b.is_global and not b.is_static ):
+            key = ( b.start, b.end )
+            if( key in blocks ):
+                break
+            blocks[key] = b
+            b = b.superblock
+    add_chain(block)
+    for ins in ls.instructions:
+        try:
+            add_chain( gdb.block_for_pc( int(ins.address) ) )
+        except RuntimeError:
+            pass
+
+    base = frame_base(frame)
+    gathered = []
+    for key,b in blocks.items():
+        # Only the arguments of the function itself are in the registers at its start
+        if( b.superblock is None or b.superblock.is_static ):
+            col = var_collector( ls.initial_registers )
+            ret.header += gather_vars( frame, col, b )
+        else:
+            col = var_collector( register_set() )
+            gather_vars( frame, col, b )
+        offsets = {}
+        addresses = {}
+        for addr,n in col.var_addresses.items():
+            if( base is not None and abs(addr-base) < 1024*1024 ):
+                offsets[addr-base] = n
+            else:
+                addresses[addr] = n
+        gathered.append( ( key, col.var_expressions, offsets, addresses ) )
+
+    # Split into ranges where the same blocks are in scope, the inner ones (smaller) override the outer ones
+    gathered.sort( key = lambda g : g[0][0] - g[0][1] )
+    bounds = set()
+    for (start,end),_,_,_ in gathered:
+        bounds.add( min(max(start,ls.start),ls.end+1) )
+        bounds.add( min(max(end,ls.start),ls.end+1) )
+    bounds = sorted(bounds)
+    for start,end in zip(bounds,bounds[1:]):
+        expressions = dict(ls.var_expressions)
+        offsets = {}
+        addresses = dict(ls.var_addresses)
+        for (bstart,bend),ex,of,ad in gathered:
+            if( bstart <= start and end <= bend ):
+                expressions.update(ex)
+                offsets.update(of)
+                addresses.update(ad)
+        ret.starts.append(start)
+        ret.ends.append(end)
+        ret.expressions.append(expressions)
+        ret.frame_offsets.append(offsets)
+        ret.addresses.append(addresses)
+    ret.rebase(base)
+    return ret
+
+# When a listing is used again for another frame, move the variables in the stack frame to there
+def rebase_vars( ls, frame ):
+    if( ls.var_index is None ):
+        return
+    try:
+        pc = int(frame.pc())
+    except:
+        return
+    if( not ( ls.start <= pc <= ls.end ) ):
+        return
+    base = frame_base(frame)
+    if( base is None or base == ls.var_index.base ):
+        return
+    ls.var_index.rebase(base)
+    ls.var_expressions,ls.var_addresses = ls.var_index.all_vars()
+
 # ls is the current listing to be updated,
 # frame is the frame to update things from
 # We want to mainly collect:
@@ -2816,12 +3310,13 @@ def update_vars( ls, frame ):
             # variable not recognized
             pass
 
-    # Ask the block (a gdb debug info container thing) for all the local variables, including parameters
+    # Ask the blocks (a gdb debug info container thing) for all the local variables, including parameters. This is
+    # done once for all blocks of the function and then looked up per instruction
+    ls.var_index = None
     if( block is not None ):
-        gv = gather_vars( frame, ls, block )
-        # sometimes the args are in a superblock
-        if( block.function is None and block.superblock is not None ):
-            gv += gather_vars( frame, ls, block.superblock )
+        ls.var_index = build_var_index( frame, ls, block )
+        ls.var_expressions,ls.var_addresses = ls.var_index.all_vars()
+        gv = ls.var_index.header
     else:
         # XXX Not sure what this would gather anyways?
         gv = gather_vars( frame, ls, [] )
@@ -2894,89 +3389,142 @@ def source_line(f_file, f_line, t_line):
         ret.append( (rsl,0) )
     return ret
 
-def parse_from_gdb( arg, fakedata = None, arch = None, fakeframe = None, cached = True, do_flow = True ):
-
-    vdb.log(f"parse_from_gdb(arg={arg}, fakedata, {arch=}, {fakeframe=}, {cached=}, {do_flow=})",level=5)
-    global parse_cache
-#    print(f"{len(parse_cache)=}")
-
-    key = arg
+# Persistent parse cache. Entries are keyed by the build-id of the objfile and the address range, since gdb disables
+# address randomization per default those stay the same between runs. Bump the version whenever the instruction
+# objects change in an incompatible way.
+persistent_cache_version = 4
 
-    if( len(arg) == 0 ):
-        if( gdb.selected_thread() is None ):
-            return listing()
+def function_block( addr ):
+    block = gdb.block_for_pc(addr)
+    while( block is not None and block.function is None ):
+        block = block.superblock
+    return block
 
-#        gdb.execute(f"p $rip")
-        global last_working_pc
-        for pc in [ last_working_pc ] + pc_list:
-            try:
-#                key = gdb.execute(f"info symbol $rip",False,True)
-                key = gdb.execute(f"info symbol ${pc}",False,True)
-                last_working_pc = pc
-                if( key.startswith("No symbol matches") ):
-                    continue
-#                print("pc = '%s'" % pc )
-                break
-            except:
-                pass
-#        print("key = '%s'" % key )
-        key = re.sub(r" \+ [0-9]+","",key)
-
-#    print("arg = '%s'" % arg )
-#    print("key = '%s'" % key )
-
-    ret = None
-    if( not debug_registers.value and cached ):
-        ret = parse_cache.get(key,None)
+def function_range( arg ):
+    """
+    Figures out the address range a disassemble argument refers to, without disassembling it. Returns None if that
+    cannot be done.
+    """
+    try:
+        rng = arg.split(",")
+        if( len(rng) == 2 ):
+            return ( vdb.util.gint(rng[0]), vdb.util.gint(rng[1]) )
+        if( len(arg) == 0 ):
+            addr = vdb.util.gint(f"${last_working_pc}")
+        else:
+            val = gdb.parse_and_eval(arg)
+            if( val.type.code not in { gdb.TYPE_CODE_INT, gdb.TYPE_CODE_PTR } ):
+                val = val.address
+            addr = int(val)
+        block = function_block(addr)
+        if( block is None ):
+            return None
+        return ( block.start, block.end )
+    except (gdb.error,RuntimeError,ValueError,TypeError):
+        return None
 
-    if( fakeframe is not None ):
-        frame = fakeframe
-    else:
-        try:
-            frame = gdb.selected_frame()
-        except:
-            frame = fake_frame()
+def persistent_key( arg, archname ):
+    if( not persistent_cache.value or vdb.vdb_dir is None ):
+        return None
+    rng = function_range(arg)
+    if( rng is None ):
+        return None
+    objfile = vdb.elf.objfile_for_address(rng[0])
+    if( objfile is None or objfile.build_id is None ):
+        return None
+    return f"asm/{objfile.build_id}/{archname}-{rng[0]:x}-{rng[1]:x}"
 
-#    print("ret = '%s'" % ret )
-    if( ret is not None and fakedata is None ):
-        ret.frame = frame
-        return fix_marker(ret,arg,frame,do_flow)
-    ret = listing()
-    ret.frame = frame
-#    vdb.util.bark() # print("BARK")
-#    print("key = '%s'" % (key,) )
-#    print("parse_cache = '%s'" % (parse_cache,) )
+def load_persistent( pkey ):
+    if( pkey is None ):
+        return None
+    try:
+        version,ret = vdb.cache.get_object(pkey)
+        if( version != persistent_cache_version ):
+            return None
+        vdb.log(f"Loaded {pkey} from persistent parse cache",level=4)
+        return ret
+    except FileNotFoundError:
+        return None
+    except Exception as e: # pylint: disable=broad-exception-caught
+        vdb.log(f"Ignoring broken persistent parse cache entry {pkey}: {e}",level=3)
+        return None
 
+def save_persistent( pkey, lng ):
+    if( pkey is None ):
+        return
+    try:
+        vdb.cache.save_object( pkey, ( persistent_cache_version, lng ) )
+    # Something in the listing that can't be pickled only means it won't be cached
+    except (OSError,pickle.PicklingError,TypeError,AttributeError) as e:
+        vdb.log(f"Failed to save {pkey} to persistent parse cache: {e}",level=3)
 
-    archname = configure_arch(arch)
+def flush_persistent( ):
+    if( vdb.vdb_dir is None ):
+        return
+    shutil.rmtree( vdb.cache.filename("asm"), ignore_errors = True )
 
-    if( fakedata is None ):
+def disassemble_text( arg, quiet = False ):
+    if( not quiet ):
         print("Waiting for gdb to disassemble",end="",flush=True)
-        try:
-            dis = gdb.execute(f'disassemble/r {arg}',False,True)
-        except gdb.error as e:
-            if( str(e).find("Cannot resolve method") != -1 or str(e).find("Cannot reference virtual member function") != -1 ):
-                # I consider this a bug, lets try to work around
-                sym = gdb.lookup_symbol(arg)[0]
-                if( sym is None ):
-                    raise
-                else:
-                    addr = sym.value()
-                    addr = int(addr.address)
-                    dis = gdb.execute(f'disassemble/r {addr}',False,True)
-            else:
+    try:
+        dis = gdb.execute(f'disassemble/r {arg}',False,True)
+    except gdb.error as e:
+        if( str(e).find("Cannot resolve method") != -1 or str(e).find("Cannot reference virtual member function") != -1 ):
+            # I consider this a bug, lets try to work around
+            sym = gdb.lookup_symbol(arg)[0]
+            if( sym is None ):
                 raise
+            else:
+                addr = sym.value()
+                addr = int(addr.address)
+                dis = gdb.execute(f'disassemble/r {addr}',False,True)
+        else:
+            raise
+    if( not quiet ):
         print("\r",end="",flush=True)
+    return dis
+
+# The structured form of one instruction all disassembler engines produce and the architecture specific instruction
+# classes are constructed from.
+# marked: gdb marked this as the current instruction
+# address: integer address
+# offset: offset into the function as a string, empty if unknown
+# bytes: the instruction bytes, already split into tokens in the dialect of the architecture. Engines that only have the
+#        text may leave this empty and the bytes at the start of text instead
+# text: the rest, mnemonic, arguments and any annotations gdb added
+# line: the original line for diagnostic output
+decoded_instruction = collections.namedtuple("decoded_instruction", [ "marked", "address", "offset", "bytes", "text", "line" ] )
+
+def decode_line( line, m ):
+    tokens = line.split()
+    marked = False
+    if( m.group(1) is not None ):
+        marked = True
+        tokens = tokens[1:]
+
+    addr = tokens[0].strip()
+    # A : there tells us there is no <+###> offset following (common when the symbol is not known)
+    if( addr[-1] == ":" ):
+        addr = addr[:-1]
+        offset = ""
+        del tokens[0] # address
     else:
-        dis = fakedata
+        offset = tokens[1].strip()[1:-2]
+        if( offset[0] == "+" ):
+            offset = offset[1:]
+        del tokens[0] # address
+        del tokens[0] # offset
+
+    return decoded_instruction( marked, vdb.util.xint(addr), offset, [], " ".join(tokens), line )
+
+# Decodes the output of disassemble/r, sets the range and function name of the listing
+def decode_text( ret, dis ):
 #    linere = re.compile("^(=>)*\s*(0x[0-9a-f]*)\s*<\+([0-9]*)>:\s*([^<]*)(<[^+]*(.*)>)*")
     linere = re.compile(r"^(=>)*\s*(0x[0-9a-f]*)(\s*<\+([0-9]*)>:)*\s*([^<]*)(<[^+]*(.*)>)*")
     funcre = re.compile("for function (.*):")
     rangere = re.compile("Dump of assembler code from (0x[0-9a-f]*) to (0x[0-9a-f]*):")
-    current_function=""
 
-    markers = 0
-    oldins = None
+    decoded = []
 
     # Figure out roughly how "long" the function is
     # XXX Sometimes functions are split in parts, how do we handle that?
@@ -3010,7 +3558,6 @@ def parse_from_gdb( arg, fakedata = None, arch = None, fakeframe = None, cached
                 ret.function = fsym[0].name
             except:
                 pass
-            current_function = "<" + fm.group(1)
             continue
 
         rr = re.search(rangere,line)
@@ -3019,21 +3566,168 @@ def parse_from_gdb( arg, fakedata = None, arch = None, fakeframe = None, cached
 
         m=re.search(linere,line)
 
-        ins = None
         if( m ):
-            ins = current_arch.instruction( line, m, oldins, (ret.start,ret.end) )
-
-        if ins is not None :
-            if( ins.marked ):
-                markers += 1
-            ret.add(ins)
-            ret.start = min(ret.start,ins.address)
-            ret.end = max(ret.end,ins.address)
-
-            oldins = ins
+            decoded.append( decode_line( line, m ) )
         else:
             print(f"Don't know what to do with '{line}'")
 #			print("m = '%s'" % m )
+    return decoded
+
+# Pluggable decoders for the native engine. Each gets the gdb architecture, the start address and the bytes read from
+# there and returns a list of ( address, length, text ) tuples.
+decoders = {}
+
+def register_decoder( name, decoder ):
+    decoders[name] = decoder
+
+def gdb_decoder( arch, start, data ):
+    # gdb reads the memory on its own again, but that is served from its own cache and still way faster than
+    # formatting and parsing the text
+    ret = []
+    for d in arch.disassemble( start, start + len(data) - 1 ):
+        ret.append( ( d["addr"], d["length"], d["asm"] ) )
+    return ret
+
+register_decoder( "gdb", gdb_decoder )
+
+# Decodes the function arg refers to directly from its bytes with the decoder configured by vdb-asm-engine. Returns
+# None when that is not possible, the caller is expected to fall back to the text engine then.
+def decode_native( ret, arg ):
+    decoder = decoders.get(engine.value,None)
+    if( decoder is None ):
+        vdb.log(f"Unknown disassembler engine {engine.value}, falling back to text",level=2)
+        return None
+    rng = function_range(arg)
+    if( rng is None ):
+        return None
+    start,end = rng
+
+    try:
+        try:
+            frame = gdb.selected_frame()
+            arch = frame.architecture()
+            pc = int(frame.pc())
+        except gdb.error:
+            arch = gdb.selected_inferior().architecture()
+            pc = None
+        data = vdb.memory.read(start,end-start)
+        if( data is None ):
+            return None
+        data = data.tobytes()
+        raw = decoder( arch, start, data )
+    except (gdb.error,gdb.MemoryError,RuntimeError) as e:
+        vdb.log(f"Native disassembly of {arg} failed ({e}), falling back to text",level=3)
+        return None
+
+    if( len(raw) == 0 ):
+        return None
+    block = function_block(start)
+    if( block is not None ):
+        ret.function = block.function.print_name
+    ret.start = start
+    ret.end = raw[-1][0]
+
+    decoded = []
+    byte_tokens = current_arch.instruction.byte_tokens
+    for addr,length,text in raw:
+        offset = str(addr-start)
+        ibytes = byte_tokens( data[addr-start:addr-start+length] )
+        line = f"   {addr:#0x} <+{offset}>:\t{' '.join(ibytes)}\t{text}"
+        decoded.append( decoded_instruction( addr == pc, addr, offset, ibytes, text, line ) )
+    return decoded
+
+# Adds the decoded_instruction list to the listing, returns the number of instructions that are marked as current
+def add_decoded( ret, decoded ):
+    markers = 0
+    oldins = None
+    for dec in decoded:
+        ins = current_arch.instruction( dec, oldins, (ret.start,ret.end) )
+        if( ins.marked ):
+            markers += 1
+        ret.add(ins)
+        ret.start = min(ret.start,ins.address)
+        ret.end = max(ret.end,ins.address)
+        if( ins.marked ):
+            ret.marker = int(ins.address)
+
+        oldins = ins
+    return markers
+
+def parse_from_gdb( arg, fakedata = None, arch = None, fakeframe = None, cached = True, do_flow = True ):
+
+    vdb.log(f"parse_from_gdb(arg={arg}, fakedata, {arch=}, {fakeframe=}, {cached=}, {do_flow=})",level=5)
+    global parse_cache
+#    print(f"{len(parse_cache)=}")
+
+    key = arg
+
+    if( len(arg) == 0 ):
+        if( gdb.selected_thread() is None ):
+            return listing()
+
+#        gdb.execute(f"p $rip")
+        global last_working_pc
+        for pc in [ last_working_pc ] + pc_list:
+            try:
+#                key = gdb.execute(f"info symbol $rip",False,True)
+                key = gdb.execute(f"info symbol ${pc}",False,True)
+                last_working_pc = pc
+                if( key.startswith("No symbol matches") ):
+                    continue
+#                print("pc = '%s'" % pc )
+                break
+            except:
+                pass
+#        print("key = '%s'" % key )
+        key = re.sub(r" \+ [0-9]+","",key)
+
+#    print("arg = '%s'" % arg )
+#    print("key = '%s'" % key )
+
+    ret = None
+    if( not debug_registers.value and cached ):
+        ret = parse_cache.get(key,None)
+
+    if( fakeframe is not None ):
+        frame = fakeframe
+    else:
+        try:
+            frame = gdb.selected_frame()
+        except:
+            frame = fake_frame()
+
+#    print("ret = '%s'" % ret )
+    if( ret is not None and fakedata is None ):
+        ret.frame = frame
+        rebase_vars(ret,frame)
+        return fix_marker(ret,arg,frame,do_flow)
+#    vdb.util.bark() # print("BARK")
+#    print("key = '%s'" % (key,) )
+#    print("parse_cache = '%s'" % (parse_cache,) )
+
+
+    archname = configure_arch(arch)
+
+    pkey = None
+    if( fakedata is None and cached and not debug_registers.value ):
+        # configure_arch() only returns the name when it had to switch
+        pkey = persistent_key( arg, current_arch.name )
+
+    markers = 0
+    ret = load_persistent( pkey )
+    if( ret is None ):
+        ret = listing()
+        decoded = None
+        if( fakedata is not None ):
+            decoded = decode_text( ret, fakedata )
+        elif( engine.value != "text" ):
+            decoded = decode_native( ret, arg )
+        if( decoded is None ):
+            decoded = decode_text( ret, disassemble_text( arg ) )
+        markers = add_decoded( ret, decoded )
+        save_persistent( pkey, ret )
+    ret.frame = frame
+
     if( fakedata is None ):
         parse_cache[key] = ret
 
@@ -3048,7 +3742,31 @@ def parse_from_gdb( arg, fakedata = None, arch = None, fakeframe = None, cached
     return ret
 
 
-flow_vtable = {}
+def prefetch( arg, archname ):
+    """
+    Parses the function into the persistent parse cache only, nothing frame specific is done. The architecture is not
+    configured from here, when it is no longer archname nothing is done. Returns False if there already was an entry or
+    the function can't be cached.
+    """
+    if( current_arch is None or current_arch.name != archname ):
+        return False
+    pkey = persistent_key( arg, archname )
+    if( pkey is None or os.path.exists( vdb.cache.filename(pkey) ) ):
+        return False
+    ret = listing()
+    decoded = None
+    if( engine.value != "text" ):
+        decoded = decode_native( ret, arg )
+    if( decoded is None ):
+        decoded = decode_text( ret, disassemble_text( arg, quiet = True ) )
+    add_decoded( ret, decoded )
+    save_persistent( pkey, ret )
+    return True
+
+# The vt_flow_ functions of the current architecture. Mnemonics without their own function use the one with the longest
+# matching prefix
+flow_vtable = None
+flow_vtables = {} # per architecture module
 
 
 
@@ -3056,13 +3774,18 @@ def gen_vtable( ):
 #    vdb.util.bark() # print("BARK")
     global flow_vtable
 #    print(f"{current_arch=}")
+    flow_vtable = flow_vtables.get(current_arch.__name__,None)
+    if( flow_vtable is not None ):
+        return
+    flow_vtable = mnemonic_dispatch()
     start = "vt_flow_"
     for funname in dir(current_arch):
 #        print(f"{funname=}")
         if( funname.startswith(start) ):
             fun = getattr( current_arch, funname )
             funname = funname[len(start):]
-            flow_vtable[funname] = fun
+            flow_vtable.add( funname, fun, -len(funname) )
+    flow_vtables[current_arch.__name__] = flow_vtable
 #    print(f"{flow_vtable=}")
 
 
@@ -3111,61 +3834,36 @@ def current_registers( frame ):
 
 
 
-def register_flow( lng, frame : "gdb frame" ):
-    vdb.log(f"register_flow( {lng=}, {frame=} )",level=4)
-    global flow_vtable
-    if( len(flow_vtable) == 0 ):
-        gen_vtable()
-    if( len( lng.instructions) == 0 ):
-        return None
-
-    ins_addresses = {} # All instructions of this scope
-    for i in lng.instructions:
-        i.passes = 0
-        i.possible_in_register_sets = []
-        i.possible_out_register_sets = []
-        i.possible_in_flag_sets = []
-        i.possible_out_flag_sets = []
-        i.extra = []
-        i.reset_argspecs()
-        # Mark all bytes as belonging to the instruction (in case we load only one byte in the middle of it, because its
-        # just data not a real instruction)
-        for x in range(0,len(i.bytes)):
-            ins_addresses[int(i.address) + x] = i
-
-        # Will copy only ever on the very first call where we did not have a user defined reference
-        if( i.parsed_reference is None ):
-            i.parsed_reference = i.reference.copy()
-        i.reference = []
-
-    ins = lng.instructions[0]
-#    print("lng.var_addresses = '%s'" % (lng.var_addresses,) )
-    # Try to follow execution path to figure out possible register values (and maybe later flags)
-    possible_registers = lng.initial_registers.clone()
-#    print("possible_registers = '%s'" % (possible_registers,) )
-    possible_flags = flag_set()
+# The register and flag values that go into a block, the origins are irrelevant for the outcome
+def flow_state_key( possible_registers, possible_flags ):
+    return ( frozenset( (n,v) for n,(v,_) in possible_registers.values.items() ), frozenset(possible_flags.flags.items()) )
 
-    rbp = frame.read_register(current_arch.base_pointer)
-    if( rbp is not None ):
-        if( vdb.memory.mmap.accessible(rbp) ):
-            possible_registers.set( current_arch.base_pointer, rbp, origin="frame.bp" ,)
+def reset_flow( ins ):
+    ins.passes = 0
+    ins.possible_in_register_sets = []
+    ins.possible_out_register_sets = []
+    ins.possible_in_flag_sets = []
+    ins.possible_out_flag_sets = []
+    ins.extra = []
+    ins.reset_argspecs()
+    ins.loads_from = set()
 
-#    for ins in ret.instructions:
-    flowstack = [ (None,None,None) ]
-
-    passlimit = 2
-    next = None
-
-    # XXX make it perhaps possible to pre-populate it by an option so we can disable handling this way?
-    unhandled_mnemonics = set()
+    # Will copy only ever on the very first call where we did not have a user defined reference
+    if( ins.parsed_reference is None ):
+        ins.parsed_reference = ins.reference.copy()
+    ins.reference = []
 
+# Runs the instructions of one basic block with the given register and flag values. Returns the values at the end, or
+# None when the flow stopped inside the block.
+def flow_block( lng, bb, frame, possible_registers, possible_flags, unhandled_mnemonics ):
     # XXX Just need to figure out how to figure out best
     thumb_mode = True
 
-    # at the end we advance to the next instruction or get one from a stack of conditional jump points (flowstack)
-#    print(f"while ins {possible_registers=}")
-    while ins is not None:
-#        print("ins = '%s'" % (ins,) )
+    for ins in bb.instructions:
+        # We don't want to pass multiple times over the marked one as here we know exactly what the values are
+        if( ins.marked and ins.passes > 0 ):
+            return None
+
         # Simple protection against any kinds of endless loops
         # XXX Better would be to check (additionally?) if the register and flag sets are the same as in previous runs
         ins.passes += 1
@@ -3236,7 +3934,8 @@ def register_flow( lng, frame : "gdb frame" ):
 
         # XXX Refactor to have the register setting etc. just once
         # Check if we have a special function handling more than the basics
-        fun = flow_vtable.get(ins.mnemonic,None)
+        known = ins.mnemonic in flow_vtable
+        fun = flow_vtable.get(ins.mnemonic)
 
 
         def maybe_execute( ins, fun, possible_registers, possible_flags ):
@@ -3269,31 +3968,15 @@ def register_flow( lng, frame : "gdb frame" ):
             return possible_registers,possible_flags
 
         if( fun is not None ):
+            if( not known ):
+                best_candidate = flow_vtable.find(ins.mnemonic)[1]
+                if( best_candidate != ins.mnemonic ):
+                    vdb.log(f"Synthesized mnemonic {ins.mnemonic} from {best_candidate}, if their flow is not handled the same, create an additional one for {ins.mnemonic}",level=4)
             possible_registers, possible_flags = maybe_execute( ins, fun, possible_registers, possible_flags )
-        # There is none, check if there is any that can be synthesized from the table
+        # There is none that could be synthesized from the table either
         else:
-            if( ins.mnemonic not in unhandled_mnemonics ):
-                best_candidate = None
-                for mn,fun in flow_vtable.items():
-                    if( ins.mnemonic.startswith(mn) ):
-                        if( best_candidate is None ):
-                            best_candidate = mn
-                        elif( len(best_candidate) == len(mn) ):
-                            # Should not happen, this now would mean both are the same
-                            pass
-                        elif( len(mn) > len(best_candidate) ):
-                            best_candidate = mn
-                if( best_candidate is None ):
-                    ins.unhandled = True
-                    # Store for later to be quicker
-                    unhandled_mnemonics.add( ins.mnemonic )
-                else:
-                    fun = flow_vtable[best_candidate]
-                    vdb.log(f"Synthesized mnemonic {ins.mnemonic} from {best_candidate}, if their flow is not handled the same, create an additional one for {ins.mnemonic}",level=4)
-                    flow_vtable[ins.mnemonic] = fun
-                    possible_registers, possible_flags = maybe_execute( ins, fun, possible_registers, possible_flags )
-            else:
-                ins.unhandled = True
+            ins.unhandled = True
+            unhandled_mnemonics.add( ins.mnemonic )
 
         if( ins.unhandled ):
             ins.possible_out_register_sets.append( possible_registers.clone() )
@@ -3321,18 +4004,6 @@ def register_flow( lng, frame : "gdb frame" ):
             if( len(npregisters) ):
                 ins.possible_out_register_sets = npregisters
 
-        if( len(ins.targets) > 0 ):
-#            print("ins.targets = '%s'" % (ins.targets,) )
-#            print("ins.conditional_jump = '%s'" % (ins.conditional_jump,) )
-#            print("ins.call = '%s'" % (ins.call,) )
-#            ins.add_extra(f"targets {ins.targets}")
-            if( not ins.conditional_jump and not ins.call ):
-                next = None
-            for tga in ins.targets:
-                tgt = lng.by_addr.get(tga,None)
-                if( tgt is not None and tgt.passes < passlimit ):
-                    flowstack.append( (tgt,possible_registers.clone(), possible_flags.clone()) )
-
 #        if( len(ins.constants) > 0 ):
 #            for c in ins.constants:
 #                xc = vdb.util.xint(c)
@@ -3341,6 +4012,7 @@ def register_flow( lng, frame : "gdb frame" ):
 #                    ch = vdb.pointer.chain( xc, vdb.arch.pointer_size, 1, True, 1, False, asm_tailspec.value )
 #                    ins.reference.append(ch[0])
         printed_addrs = set()
+        var_expressions,var_addresses = lng.vars_at(ins.address)
 
 
 
@@ -3365,7 +4037,7 @@ def register_flow( lng, frame : "gdb frame" ):
 
                 # regardless of argspec we always output based on expression (since that works even if we don't have any
                 # register values)
-                av = lng.var_expressions.get(a,None)
+                av = var_expressions.get(a,None)
 #                if( av is not None ):
 #                    print(f"var_expressions.get({a}) =>  {av}")
                 extra.value += f", av = {av}"
@@ -3416,7 +4088,7 @@ def register_flow( lng, frame : "gdb frame" ):
                         printed_addrs.add(addr)
 
                         # Check if the memory address is known to host some (local) variable
-                        av = lng.var_addresses.get(addr,None)
+                        av = var_addresses.get(addr,None)
                         if( debug_all(ins) ):
                             print("###################")
                             print(f"{ins.address=:#0x}")
@@ -3524,32 +4196,125 @@ def register_flow( lng, frame : "gdb frame" ):
         if( debug_registers.value ):
             ins._gen_extra()
 
-        # Check if the next instruction would go over the pass limit
-        ins = ins.next
-        if( ins is not None and ins.passes >= passlimit ):
-            ins = None
+    return ( possible_registers, possible_flags )
 
-        # We don't want to pass multiple times over the marked one as here we know exactly what the values are
-        if( ins is not None and ins.marked and ins.passes > 0 ):
-            ins = None
+def visit_block( lng, bb, key, frame, possible_registers, possible_flags, unhandled_mnemonics ):
+    visit = [ key, possible_registers.clone(), possible_flags.clone(), None ]
+    bb.visits.append( visit )
+    vidx = len(bb.visits) - 1
 
-        while( ins is None ):
-            ins,possible_registers,possible_flags = flowstack.pop()
-            if( ins is None ): # marker for the flowstack being empty
-                break
-            if( ins.marked and ins.passes > 0 ):
-                ins = None
+    if( bb.reused and vidx < len(bb.history) and bb.history[vidx][0] == key ):
+        visit[3] = bb.history[vidx][1]
+    else:
+        if( bb.reused ):
+            # Something differs from the last flow, start over with this block and replay what it has seen so far
+            bb.reused = False
+            for ins in bb.instructions:
+                reset_flow(ins)
+            for v in bb.visits[:-1]:
+                v[3] = flow_block( lng, bb, frame, v[1].clone(), v[2].clone(), unhandled_mnemonics )
+        visit[3] = flow_block( lng, bb, frame, possible_registers, possible_flags, unhandled_mnemonics )
+
+    if( visit[3] is None ):
+        return None
+    return ( visit[3][0].clone(), visit[3][1].clone() )
+
+def register_flow( lng, frame : "gdb frame" ):
+    vdb.log(f"register_flow( {lng=}, {frame=} )",level=4)
+    global flow_vtable
+    if( flow_vtable is None ):
+        gen_vtable()
+    if( len( lng.instructions) == 0 ):
+        return None
+
+    # The annotations are about to change
+    lng.render_cache = {}
+
+    blocks = lng.cfg()
+
+    # Everything apart from the register and flag values that goes into the results. When any of it changes, no block
+    # can be reused.
+    token = ( frozenset(lng.var_addresses.items()), frozenset(lng.var_expressions.items()), id(xi_history) )
+    if( token != lng.flow_token ):
+        for bb in blocks:
+            bb.history = []
+        lng.flow_token = token
+
+    for bb in blocks:
+        bb.visits = []
+        bb.reused = True
+        marked = any( i.marked for i in bb.instructions )
+        # The marked instruction merges in the real register values, which are different every time
+        if( marked or bb.had_marker ):
+            bb.history = []
+        bb.had_marker = marked
+
+#    print("lng.var_addresses = '%s'" % (lng.var_addresses,) )
+    # Try to follow execution path to figure out possible register values (and maybe later flags)
+    possible_registers = lng.initial_registers.clone()
+#    print("possible_registers = '%s'" % (possible_registers,) )
+    possible_flags = flag_set()
+
+    rbp = frame.read_register(current_arch.base_pointer)
+    if( rbp is not None ):
+        if( vdb.memory.mmap.accessible(rbp) ):
+            possible_registers.set( current_arch.base_pointer, rbp, origin="frame.bp" ,)
+
+    # Simple protection against any kinds of endless loops, a block is passed at most this often
+    passlimit = 2
+
+    # XXX make it perhaps possible to pre-populate it by an option so we can disable handling this way?
+    unhandled_mnemonics = set()
+
+    # Worklist of blocks along with the values to flow them with. The fallthrough is pushed last, that way we follow the
+    # instructions as they are laid out first.
+    flowstack = [ ( blocks[0], possible_registers, possible_flags ) ]
+    while( len(flowstack) > 0 ):
+        bb,possible_registers,possible_flags = flowstack.pop()
+        if( len(bb.visits) >= passlimit ):
+            continue
+        # Already been here with exactly these values, nothing new to learn
+        key = flow_state_key( possible_registers, possible_flags )
+        if( any( v[0] == key for v in bb.visits ) ):
+            continue
+
+        out = visit_block( lng, bb, key, frame, possible_registers, possible_flags, unhandled_mnemonics )
+        if( out is None ):
+            continue
+        possible_registers, possible_flags = out
+        for sb in bb.successors:
+            flowstack.append( (sb,possible_registers.clone(), possible_flags.clone()) )
+
+    reused = 0
+    for bb in blocks:
+        if( bb.reused ):
+            if( len(bb.visits) != len(bb.history) or len(bb.visits) == 0 ):
+                # This time there were fewer visits (or none), the instructions still have the results of the others
+                for ins in bb.instructions:
+                    reset_flow(ins)
+                for v in bb.visits:
+                    v[3] = flow_block( lng, bb, frame, v[1].clone(), v[2].clone(), unhandled_mnemonics )
+            elif( len(bb.visits) > 0 ):
+                reused += 1
+        bb.history = [ ( v[0], v[3] ) for v in bb.visits ]
+    vdb.log(f"register_flow reused {reused} of {len(blocks)} basic blocks",level=5)
 
     # Flow is considered done, collect all info about wheere something loads from and check if its an instruction
     # XXX Check performance of everything
     # Now that we have the flow, go through all instructions again and figure out if any of htem loads something
+    ins_addresses = {} # All instructions of this scope
+    for ins in lng.instructions:
+        ins.loaded_from = set()
+        # Mark all bytes as belonging to the instruction (in case we load only one byte in the middle of it, because its
+        # just data not a real instruction)
+        for x in range(0,len(ins.bytes)):
+            ins_addresses[int(ins.address) + x] = ins
     for ins in lng.instructions:
         for lfrm in ins.loads_from:
             ins_at_load = ins_addresses.get(lfrm)
             if( ins_at_load is not None ):
                 ins_at_load.loaded_from.add( ins )
 
-    # while(ins) done
     if( debug_all() ):
         print("unhandled_mnemonics = '%s'" % (unhandled_mnemonics,) )
 
@@ -3597,74 +4362,24 @@ def parse_from( arg, fakedata = None, context = None, arch = None ):
 
 
 class callgrind_instruction:
+    """
+    The callgrind information of one address, summed up over all loaded files. These are only created on demand for the
+    range that is being displayed, see callgrind_range()
+    """
 
-    def __init__( self, line, previous ):
-        self.values = None
-        self.address = None
-        self.parse( line.split(), previous )
+    def __init__( self, address ):
+        self.address = address
+        self.values = {} # event name to value
         self.jumps = {}
 #        self._dump()
 
     def _dump( self ):
         print(f"@{self.address:#08x} : {self.values}")
 
-    def event( self, evidx ):
-        val = self.values.get(evidx,0)
-        return val
-
-    def value( self, evname ):
-        evidx = callgrind_eventmap.get(evname,None)
-        if( evidx is not None ):
-            return self.event(evidx)
-        else:
-            return 0
-
-    def add_synth( self, name, elist ):
-        global callgrind_eventmap
-        nni = callgrind_eventmap.get(name,None)
-        if( nni is None ):
-#            print("callgrind_eventmap = '%s'" % (callgrind_eventmap,) )
-            nni = len(callgrind_eventmap) + 2
-            callgrind_eventmap[name] = nni
-#            print("callgrind_eventmap = '%s'" % (callgrind_eventmap,) )
-
-        val = 0
-        for e in elist:
-            eidx = callgrind_eventmap.get(e,None)
-            if( eidx is None ):
-                vdb.util.log(f"Could not synthesize event {name}, at least event {e} is unavailable",level=4)
-                return None
-            v = self.event(eidx)
-#            print("e = '%s'" % (e,) )
-#            print("v = '%s'" % (v,) )
-            val += v
-#        print("val = '%s'" % (val,) )
-        if( val ):
-            self.values[nni] = val
+    def event( self, evname ):
+        val = self.values.get(evname,0)
         return val
 
-    def synthesize( self ):
-        self.add_synth( "L1m", [ "I1mr", "D1mr", "D1mw" ] )
-        self.add_synth( "L2m", [ "I2mr", "D2mr", "D2mw" ] )
-        self.add_synth( "LLm", [ "ILmr", "DLmr", "DLmw" ] )
-        self.add_synth( "Bm",  [ "Bim", "Bcm" ] )
-
-        global callgrind_eventmap
-        cidx = callgrind_eventmap.get("CEst",None)
-        if( cidx is None ):
-            cidx = len(callgrind_eventmap) + 2
-            callgrind_eventmap["CEst"] = cidx
-
-        cest = 0
-        cest += self.value( "Ir" )
-        cest += self.value( "Bm" )  * 10
-        cest += self.value( "L1m" ) * 10
-        cest += self.value( "Ge" )  * 20
-        cest += self.value( "L2m" ) * 100
-        cest += self.value( "LLm" ) * 100
-        if( cest ):
-            self.values[cidx] = cest
-
     class jump_info:
 
         def __init__( self ):
@@ -3685,146 +4400,313 @@ class callgrind_instruction:
             else:
                 return f"Jumped {self.jumped} of {self.executed} times to {self.target:#08x}"
 
-    def add_jump( self, j, ex, target, raw = None ):
-#        outof = outof.split("/")
-#        print("outof = '%s'" % (outof,) )
-#        print("target = '%s'" % (target,) )
-#        print("self.address = '%s'" % (self.address,) )
+    def add_jump( self, target, executed, jumped ):
         ji = self.jump_info()
-        if( target[0] == "+" ):
-            offset = int(target[1:])
-            ji.target = self.address + offset
-        elif( target[0] == "-" ):
-            offset = int(target[1:])
-            ji.target = self.address - offset
-        elif( target == "*" ):
-            ji.target = self.address
-        else:
-            ji.target = int(target,16)
-        ji.executed = int(ex)
-        if( j is not None ):
-            ji.jumped  = int(j)
-        ji.raw = raw
+        ji.target = target
+        ji.executed = executed
+        ji.jumped = jumped
         si = self.jumps.get(ji.target,None)
         if( si is not None ):
             si.merge(ji)
         else:
             self.jumps[ji.target] = ji
 
+# Events we synthesize (the same way kcachegrind does) when all of their parts are available
+callgrind_synth = [
+        ( "L1m", [ "I1mr", "D1mr", "D1mw" ] ),
+        ( "L2m", [ "I2mr", "D2mr", "D2mw" ] ),
+        ( "LLm", [ "ILmr", "DLmr", "DLmw" ] ),
+        ( "Bm",  [ "Bim", "Bcm" ] ),
+        ]
 
-    # This is the "previous" we ask for the next addr
-    def parse_address( self, addrstr ):
-        if( addrstr.startswith( "0x" ) ):
-            return int(addrstr,16)
-        elif( addrstr.startswith( "+" ) ):
-            return self.address + int(addrstr[1:])
-        elif( addrstr.startswith( "-" ) ):
-            return self.address - int(addrstr[1:])
-        else:
-            raise RuntimeError("Invalid address string " + addrstr)
+# The factors for the cycle estimation, missing events just don't count
+callgrind_cest = [ ( "Ir", 1 ), ( "Bm", 10 ), ( "L1m", 10 ), ( "Ge", 20 ), ( "L2m", 100 ), ( "LLm", 100 ) ]
 
-    def parse( self, vec, previous ):
-        if( previous is not None ):
-            self.address = previous.parse_address( vec[0] )
-        else:
-            self.address = self.parse_address( vec[0] )
-        self.values = {}
-        for i in range(1,len(vec)):
-            val = vec[i]
-            if( val == "*" ):
-                val = previous.values[i]
-            elif( val.startswith("+") ):
-                add = int(val[1:])
-                val = previous.values[i] + add
-            else:
-                val = int(val)
-            self.values[i] = val
-        self.synthesize()
+class callgrind_table:
+    """
+    All the information of one callgrind file, stored column wise. The addresses are sorted and the event columns as
+    well as the jump columns are in the same order, so the part for one function is found by bisecting. When it was
+    loaded from the index file the columns are views into the mapped file and only the pages that are used get read.
+    """
 
-    def get_next( self, cline ):
-        vec = cline.split()
-        next_addr = self.parse_address( vec[0] )
-        return get_instruction( next_addr )
+    def __init__( self, filename ):
+        self.filename = filename
+        self.events = []
+        self.addresses = array.array("Q")
+        self.columns = {}
+        self.jump_addresses = array.array("Q")
+        self.jump_targets = array.array("Q")
+        self.jump_executed = array.array("q")
+        self.jump_jumped = array.array("q") # -1 for unconditional jumps
+        self.mapping = None
+
+    def rows( self, start, end ):
+        lo = bisect.bisect_left( self.addresses, start )
+        hi = bisect.bisect_right( self.addresses, end, lo )
+        return range(lo,hi)
+
+    def jump_rows( self, start, end ):
+        lo = bisect.bisect_left( self.jump_addresses, start )
+        hi = bisect.bisect_right( self.jump_addresses, end, lo )
+        return range(lo,hi)
 
-    def merge( self, other ):
-        if( other.address != self.address ):
-            raise RuntimeError(f"Can not merge different addresses {self.address} and {other.address}")
-        for _,oj in other.jumps.items():
-            si = self.jumps.get(oj.target,None)
-            if( si is not None ):
-                si.merge(oj)
+    def synthesize( self ):
+        for name,elist in callgrind_synth:
+            if( name in self.columns ):
+                continue
+            parts = [ self.columns.get(e,None) for e in elist ]
+            if( None in parts ):
+                vdb.util.log(f"Could not synthesize event {name}, not all of {elist} are available",level=4)
+                continue
+            self.columns[name] = array.array("q", map(sum,zip(*parts)) )
+            self.events.append(name)
+
+        if( "CEst" not in self.columns ):
+            parts = [ ( self.columns[e], f ) for e,f in callgrind_cest if e in self.columns ]
+            if( len(parts) == 0 ):
+                cest = array.array("q", bytes( 8 * len(self.addresses) ) )
             else:
-                self.jumps[oj.target] = oj
+                factors = [ f for _,f in parts ]
+                cest = array.array("q", ( sum( v*f for v,f in zip(vals,factors) ) for vals in zip( *(c for c,_ in parts) ) ) )
+            self.columns["CEst"] = cest
+            self.events.append("CEst")
+
+    def all_columns( self ):
+        """
+        All columns in the order they are stored in the index file
+        """
+        ret = [ self.addresses ]
+        ret += [ self.columns[e] for e in self.events ]
+        ret += [ self.jump_addresses, self.jump_targets, self.jump_executed, self.jump_jumped ]
+        return ret
 
-        for oi,ov in other.values.items():
-            ov += self.values.get(oi,0)
-            self.values[oi] = ov
+# name to callgrind_table, so loading the same file again replaces it
+callgrind_data = {}
 
-        self.synthesize()
+def callgrind_event_names( ):
+    ret = set()
+    for t in callgrind_data.values():
+        ret.update(t.columns.keys())
+    return ret
 
-def get_instruction( addr ):
-    global callgrind_data
-    ci = callgrind_data.get(addr,None)
-    return ci
-
-def get_next( cline, ci ):
-    if( ci is not None ):
-        pci = ci.get_next(cline)
-        if( pci is None ):
-            return callgrind_instruction( cline, ci )
-
-    ci = callgrind_instruction( cline, ci )
-    pci = get_instruction( ci.address )
-    if( pci is not None ):
-        pci.merge(ci)
-        return pci
-    return ci
+def callgrind_range( start, end ):
+    """
+    Returns a dict of address to callgrind_instruction for all addresses in [start,end] that any of the loaded files
+    has information for.
+    """
+    ret = {}
+    for t in callgrind_data.values():
+        for r in t.rows(start,end):
+            addr = t.addresses[r]
+            ci = ret.get(addr,None)
+            if( ci is None ):
+                ci = callgrind_instruction(addr)
+                ret[addr] = ci
+            for ev,col in t.columns.items():
+                val = col[r]
+                if( val ):
+                    ci.values[ev] = ci.values.get(ev,0) + val
+        for r in t.jump_rows(start,end):
+            addr = t.jump_addresses[r]
+            ci = ret.get(addr,None)
+            if( ci is None ):
+                ci = callgrind_instruction(addr)
+                ret[addr] = ci
+            jumped = t.jump_jumped[r]
+            if( jumped < 0 ):
+                jumped = None
+            ci.add_jump( t.jump_targets[r], t.jump_executed[r], jumped )
+    return ret
 
-def load_callgrind( argv ):
-#    print("argv = '%s'" % (argv,) )
-    global callgrind_data
-    global callgrind_eventmap
-    if( argv[0] == "clear" ):
-        callgrind_data = {}
-        print("Cleared callgrind database")
-        return None
-    current_instruction = None
-    with open( argv[0], "r" ) as cf:
+def callgrind_position( pos, previous ):
+    if( pos.startswith( "0x" ) ):
+        return int(pos,16)
+    elif( pos == "*" ):
+        return previous
+    elif( pos.startswith( "+" ) ):
+        return previous + int(pos[1:])
+    elif( pos.startswith( "-" ) ):
+        return previous - int(pos[1:])
+    else:
+        return int(pos)
+
+def parse_callgrind( fname ):
+    """
+    Reads the callgrind file line by line into a new callgrind_table. Only the (deduplicated) rows per address are kept
+    while reading, at the end everything gets sorted by address.
+    """
+    ret = callgrind_table(fname)
+    npos = 1
+    instr = None # index of the instruction address in the positions
+    previous = None # position values of the last cost line
+
+    addresses = array.array("Q")
+    rowmap = {} # address to row while reading
+    columns = []
+    jumps = {} # ( address, target ) to [ executed, jumped ]
+
+    with open( fname, "r" ) as cf:
         for cfline in cf:
             cfline = cfline.rstrip()
             if( len(cfline) == 0 ):
                 continue
 
-            if( cfline.startswith("0x") ):
-                current_instruction = get_next( cfline, current_instruction )
-                callgrind_data[current_instruction.address] = current_instruction
-            elif( cfline[0] == "+" or cfline[0] == "-" ):
-                current_instruction = get_next( cfline, current_instruction )
-                callgrind_data[current_instruction.address] = current_instruction
-            elif( cfline.startswith("events:") ):
-                cfv = cfline.split()
-                for i in range( 1,len(cfv) ):
-                    callgrind_eventmap[cfv[i]] = i+1
-#                    print("cfv[i] = '%s'" % (cfv[i],) )
-            elif( cfline.startswith( "jcnd=" ) ):
-                cfline = cfline[5:]
-                vec = cfline.split()
-                oo = vec[0]
-                oo = oo.split("/")
-                current_instruction.add_jump( oo[0], oo[1], vec[1], cfline )
-            elif( cfline.startswith( "jump=" ) ):
-                cfline = cfline[5:]
+            if( instr is not None and ( cfline.startswith("0x") or cfline[0] in "+-*" ) ):
                 vec = cfline.split()
-                current_instruction.add_jump( None, vec[0], vec[1] )
+                if( previous is None ):
+                    previous = [ None ] * npos
+                previous = [ callgrind_position( p, pr ) for p,pr in zip(vec[:npos],previous) ]
+                addr = previous[instr]
+                row = rowmap.get(addr,None)
+                if( row is None ):
+                    row = len(addresses)
+                    rowmap[addr] = row
+                    addresses.append(addr)
+                    for col in columns:
+                        col.append(0)
+                # Trailing zero costs can be left out
+                for i,val in enumerate(vec[npos:]):
+                    columns[i][row] += int(val)
+            elif( cfline.startswith("positions:") ):
+                positions = cfline.split()[1:]
+                npos = len(positions)
+                if( "instr" in positions ):
+                    instr = positions.index("instr")
+                else:
+                    vdb.util.log(f"{fname} contains no instruction addresses (use --dump-instr=yes)",level=2)
+            elif( cfline.startswith("events:") ):
+                ret.events = cfline.split()[1:]
+                columns = [ array.array("q") for _ in ret.events ]
+#                print("ret.events = '%s'" % (ret.events,) )
+            elif( cfline.startswith( "jcnd=" ) or cfline.startswith( "jump=" ) ):
+                if( previous is None ):
+                    continue
+                vec = cfline[5:].split()
+                addr = previous[instr]
+                if( cfline[1] == "c" ):
+                    jumped,executed = vec[0].split("/")
+                    jumped = int(jumped)
+                else:
+                    executed = vec[0]
+                    jumped = -1
+                target = callgrind_position( vec[1], addr )
+                ji = jumps.get( (addr,target), None )
+                if( ji is None ):
+                    jumps[(addr,target)] = [ int(executed), jumped ]
+                else:
+                    ji[0] += int(executed)
+                    if( ji[1] >= 0 and jumped >= 0 ):
+                        ji[1] += jumped
             else:
 #                print("cfline = '%s'" % (cfline,) )
                 pass
 
+    order = sorted( range(len(addresses)), key = addresses.__getitem__ )
+    ret.addresses = array.array("Q", ( addresses[i] for i in order ) )
+    for ev,col in zip(ret.events,columns):
+        ret.columns[ev] = array.array("q", ( col[i] for i in order ) )
+    for (addr,target),(executed,jumped) in sorted(jumps.items()):
+        ret.jump_addresses.append(addr)
+        ret.jump_targets.append(target)
+        ret.jump_executed.append(executed)
+        ret.jump_jumped.append(jumped)
+    ret.synthesize()
+    return ret
+
+# The index is written in native byte order, so the magic tells which one it was
+callgrind_index_magic = b"VDBCGI" + sys.byteorder[0].encode() + b"\0"
+callgrind_index_version = 1
+callgrind_index_header = struct.Struct("<8sIQQQQI")
 
-#        while( cfline := cf.readline().rstrip() ):
-#            print("cfline = '%s'" % (cfline,) )
+def callgrind_index_name( fname ):
+    return fname + ".vdbidx"
 
-    print(f"Read information for {len(callgrind_data)} instructions from {argv[0]}")
+def save_callgrind_index( table, st ):
+    names = " ".join(table.events).encode()
+    header = callgrind_index_header.pack( callgrind_index_magic, callgrind_index_version, st.st_size, st.st_mtime_ns,
+            len(table.addresses), len(table.jump_addresses), len(names) )
+    pad = -( len(header) + len(names) ) % 8
+    iname = callgrind_index_name(table.filename)
+    try:
+        with open( iname + ".tmp", "wb" ) as f:
+            f.write(header)
+            f.write(names)
+            f.write(b"\0" * pad)
+            for col in table.all_columns():
+                col.tofile(f)
+        os.replace( iname + ".tmp", iname )
+    except OSError as e:
+        vdb.util.log(f"Could not write callgrind index {iname}: {e}",level=3)
+
+def load_callgrind_index( fname, st ):
+    """
+    Maps the index file of fname if it is still matching the file, returns None otherwise
+    """
+    iname = callgrind_index_name(fname)
+    try:
+        with open( iname, "rb" ) as f:
+            header = f.read( callgrind_index_header.size )
+            if( len(header) != callgrind_index_header.size ):
+                return None
+            magic,version,size,mtime,nrows,njumps,nlen = callgrind_index_header.unpack(header)
+            if( magic != callgrind_index_magic or version != callgrind_index_version ):
+                return None
+            if( size != st.st_size or mtime != st.st_mtime_ns ):
+                vdb.util.log(f"Callgrind index {iname} is outdated",level=3)
+                return None
+            names = f.read(nlen).decode().split()
+            mapping = mmap.mmap( f.fileno(), 0, access = mmap.ACCESS_READ )
+    except (OSError,ValueError,struct.error) as e:
+        vdb.util.log(f"Could not read callgrind index {iname}: {e}",level=3)
+        return None
+
+    mv = memoryview(mapping)
+    offset = callgrind_index_header.size + nlen
+    offset += -offset % 8
+    def take( fmt, n ):
+        nonlocal offset
+        ret = mv[offset:offset+8*n].cast(fmt)
+        offset += 8*n
+        return ret
+
+    ret = callgrind_table(fname)
+    ret.events = names
+    ret.mapping = mapping
+    ret.addresses = take("Q",nrows)
+    for ev in names:
+        ret.columns[ev] = take("q",nrows)
+    ret.jump_addresses = take("Q",njumps)
+    ret.jump_targets = take("Q",njumps)
+    ret.jump_executed = take("q",njumps)
+    ret.jump_jumped = take("q",njumps)
+    if( offset > len(mv) ):
+        vdb.util.log(f"Callgrind index {iname} is truncated",level=3)
+        return None
+    return ret
+
+def load_callgrind( argv ):
+#    print("argv = '%s'" % (argv,) )
+    global callgrind_data
+    invalidate_render_cache(None)
+    if( argv[0] == "clear" ):
+        callgrind_data = {}
+        print("Cleared callgrind database")
+        return None
+
+    fname = os.path.abspath(argv[0])
+    st = os.stat(fname)
+    table = None
+    if( callgrind_index.value ):
+        table = load_callgrind_index( fname, st )
+    if( table is None ):
+        table = parse_callgrind( fname )
+        if( callgrind_index.value ):
+            save_callgrind_index( table, st )
+    else:
+        vdb.util.log(f"Using callgrind index {callgrind_index_name(fname)}",level=3)
+    callgrind_data[fname] = table
+
+    print(f"Read information for {len(table.addresses)} instructions from {argv[0]}")
 
 function_vars = {}
 function_registers = {}
@@ -3880,11 +4762,19 @@ def disassemble( argv, flags, context ):
 
     if( "F" in flags ):
         print("Flushed disassembler parse cache")
+        flush_persistent()
         return invalidate_cache(None)
 
     if( "v" in flags ):
         return add_variable( argv )
 
+    if( "g" in flags ):
+        if( len(argv) == 0 ):
+            addr = vdb.util.gint(f"${last_working_pc}")
+        else:
+            addr = vdb.util.gint(" ".join(argv))
+        return vdb.asm.callgraph.show( addr )
+
     if( "d" in flags ):
         flags = flags.replace("d","")
         dotty = True
@@ -3928,6 +4818,8 @@ def disassemble( argv, flags, context ):
 
     try:
         asm_listing.print(asm_showspec.value, context,marked, source, full_source)
+        if( fakedata is None ):
+            vdb.asm.callgraph.queue_prefetch( asm_listing.start )
         if( dotty ):
             g = asm_listing.to_dot(asm_showspec_dot.value)
             oid = id(asm_listing)
@@ -3981,8 +4873,9 @@ dis/<N>     - Have N instructions of context before and after the current marker
 dis/+<N>    - Have N Instructions of context after the marker
 dis/-<N>    - Have N Instructions of context before the marker
 dis/<N>,<M> - Have N Instructions of context before and M after the Marker
-dis/F       - Flushes some internal caches
+dis/F       - Flushes some internal caches, including the persistent parse cache
 dis/c <CG>  - Loads callgrind information from file <CG>
+dis/g       - Shows the callers and callees of the function from the call graph index
 dis/v       - dis/v argv r1 99 tells the disassembler to assume that the variable argv is stored in register r1 with value 99
 dis/s       - Tries to output the source code location where possible
 
@@ -4001,7 +4894,7 @@ part of a function, unlike the disassemble command those are right away disassem
             global from_tty
             from_tty = self.from_tty
             argv,flags = self.flags(argv)
-            context = self.context( flags, "rdFcvsS" )
+            context = self.context( flags, "rdFcvsSg" )
 #            print(f"{context=}")
             disassemble( argv, flags, context )
         except gdb.error as e:
@@ -4014,6 +4907,8 @@ part of a function, unlike the disassemble command those are right away disassem
 
 Dis()
 
+import vdb.asm.callgraph
+
 # We only support it, silently try to force it
 try:
     gdb.execute("set disassembly-flavor att")
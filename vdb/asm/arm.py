@@ -253,12 +253,16 @@ class asm_arg(vdb.asm.asm_arg_base):
 class instruction( vdb.asm.instruction_base ):
 
     class_res = vdb.asm.instruction_base.compile_class_res( _arm_class_res )
-    class_cache = {}
     last_cmp_immediate = 1
 
-    def __init__( self, line, m, oldins, function_range ):
+    # gdb shows the bytes as little endian halfwords
+    @staticmethod
+    def byte_tokens( data ):
+        return [ f"{data[i+1]:02x}{data[i]:02x}" for i in range(0,len(data)-1,2) ]
+
+    def __init__( self, dec, oldins, function_range ):
         super().__init__()
-        self.parse(line,m,oldins, function_range)
+        self.parse(dec,oldins, function_range)
 
     def executes( self, flags ):
 #        self.add_extra(f"SUFFIX {self.conditional_suffix}")
@@ -270,10 +274,10 @@ class instruction( vdb.asm.instruction_base ):
         return (False,None)
 
     @vdb.overrides
-    def parse( self, line, m, oldins, function_range ):
+    def parse( self, dec, oldins, function_range ):
 #        vdb.util.bark() # print("BARK")
 
-        tokens = self.parse_common( line, m, oldins )
+        tokens = self.parse_common( dec, oldins )
 
         ibytes = []
         while( self.bytere2.match(tokens[0]) ):
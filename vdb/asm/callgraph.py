@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Whole program call graph. The text sections of every loaded objfile are scanned once in the background, directly from
+# the ELF file on disk so no gdb API is needed in the thread. The result only contains link time addresses and is
+# stored in the persistent cache per build-id, the load bias is figured out per session when it is first needed.
+
+import vdb
+import vdb.util
+import vdb.cache
+import vdb.config
+import vdb.event
+import vdb.asm
+import vdb.elf
+
+from vdb.elf import EM_386,EM_ARM,EM_X86_64,EM_AARCH64
+
+import gdb
+
+import os
+import time
+import struct
+import bisect
+import array
+import collections
+
+enabled         = vdb.config.parameter("vdb-asm-callgraph", True )
+prefetch_count  = vdb.config.parameter("vdb-asm-callgraph-prefetch", 3 )
+prefetch_budget = vdb.config.parameter("vdb-asm-callgraph-prefetch-budget", 0.05 )
+prefetch_max    = vdb.config.parameter("vdb-asm-callgraph-prefetch-max-size", 4096 )
+
+# Bump whenever call_graph changes in an incompatible way
+callgraph_cache_version = 1
+
+class call_graph:
+    """
+    Callers and callees of all functions of one objfile. Functions are referred to by their index into the sorted starts
+    """
+
+    def __init__( self ):
+        self.starts = array.array("Q")
+        self.ends = array.array("Q")
+        self.names = []
+        self.callees = {} # index => { index => number of call sites }
+        self.callers = {} # index => { index => number of call sites }
+        self.pie = False
+
+    def function_at( self, addr ):
+        idx = bisect.bisect_right( self.starts, addr ) - 1
+        if( idx < 0 or addr >= self.ends[idx] ):
+            return None
+        return idx
+
+    def add_call( self, caller, callee ):
+        ce = self.callees.setdefault(caller,{})
+        ce[callee] = ce.get(callee,0) + 1
+        cr = self.callers.setdefault(callee,{})
+        cr[caller] = cr.get(caller,0) + 1
+
+# The scanners yield ( offset, target ) for every direct call or jump in the code of one function. It is a linear sweep
+# looking for the opcodes, so for variable length instructions there can be false positives, we only keep those that
+# hit the start of a known function which filters almost all of them out.
+
+def scan_x86( code, start, endian, thumb ):
+    pos = 0
+    while( True ):
+        pos = code.find( b"\xe8", pos )
+        if( pos < 0 or pos + 5 > len(code) ):
+            break
+        rel = struct.unpack_from( "<i", code, pos + 1 )[0]
+        yield ( pos, start + pos + 5 + rel )
+        pos += 1
+    # Tail calls are the same just with jmp
+    pos = 0
+    while( True ):
+        pos = code.find( b"\xe9", pos )
+        if( pos < 0 or pos + 5 > len(code) ):
+            break
+        rel = struct.unpack_from( "<i", code, pos + 1 )[0]
+        yield ( pos, start + pos + 5 + rel )
+        pos += 1
+
+def scan_aarch64( code, start, endian, thumb ):
+    words = struct.unpack_from( f"{endian}{len(code)//4}I", code )
+    for i,w in enumerate(words):
+        op = w & 0xfc000000
+        # bl and b
+        if( op == 0x94000000 or op == 0x14000000 ):
+            imm = w & 0x3ffffff
+            if( imm & 0x2000000 ):
+                imm -= 0x4000000
+            yield ( i*4, start + i*4 + imm*4 )
+
+def scan_arm( code, start, endian, thumb ):
+    if( not thumb ):
+        words = struct.unpack_from( f"{endian}{len(code)//4}I", code )
+        for i,w in enumerate(words):
+            # bl and b, but not the unconditional space
+            if( ( w & 0x0e000000 ) == 0x0a000000 and ( w >> 28 ) != 0xf ):
+                imm = w & 0xffffff
+                if( imm & 0x800000 ):
+                    imm -= 0x1000000
+                yield ( i*4, start + i*4 + 8 + imm*4 )
+        return
+    hws = struct.unpack_from( f"{endian}{len(code)//2}H", code )
+    for i in range(len(hws)-1):
+        hw1 = hws[i]
+        hw2 = hws[i+1]
+        # bl, b.w (T4) and blx
+        if( ( hw1 & 0xf800 ) != 0xf000 or ( ( hw2 & 0xc000 ) != 0xc000 and ( hw2 & 0xd000 ) != 0x9000 ) ):
+            continue
+        s = ( hw1 >> 10 ) & 1
+        j1 = ( hw2 >> 13 ) & 1
+        j2 = ( hw2 >> 11 ) & 1
+        i1 = 1 ^ ( j1 ^ s )
+        i2 = 1 ^ ( j2 ^ s )
+        imm = ( s << 24 ) | ( i1 << 23 ) | ( i2 << 22 ) | ( ( hw1 & 0x3ff ) << 12 ) | ( ( hw2 & 0x7ff ) << 1 )
+        if( s ):
+            imm -= 1 << 25
+        yield ( i*2, start + i*2 + 4 + imm )
+
+scanners = {
+        EM_386 : scan_x86,
+        EM_X86_64 : scan_x86,
+        EM_AARCH64 : scan_aarch64,
+        EM_ARM : scan_arm,
+        }
+
+def build_graph( fname, task = None ):
+    elf = vdb.elf.elf_file.load(fname)
+    scanner = scanners.get(elf.machine,None)
+    if( scanner is None ):
+        raise ValueError(f"No call scanner for ELF machine {elf.machine}")
+
+    # Aliases share the same code, keep the first name
+    funcs = {}
+    for value,size,name in elf.functions():
+        start = value & ~1
+        if( start not in funcs ):
+            funcs[start] = ( value, size, name )
+    ret = call_graph()
+    ret.pie = ( elf.type == vdb.elf.ET_DYN )
+    for start in sorted(funcs):
+        _,size,name = funcs[start]
+        ret.starts.append(start)
+        ret.ends.append(start+max(size,1))
+        ret.names.append(name)
+
+    lookup = { s : i for i,s in enumerate(ret.starts) }
+    for idx,start in enumerate(ret.starts):
+        if( task is not None and idx % 1000 == 0 ):
+            task.set_progress(f"callgraph {os.path.basename(fname)} {idx*100//len(ret.starts)}%")
+        value,size,_ = funcs[start]
+        if( size == 0 ):
+            continue
+        code = elf.code( start, size )
+        if( code is None ):
+            continue
+        for _,target in scanner( code, start, elf.endian, value & 1 ):
+            tidx = lookup.get( target & ~1, None )
+            # Jumps within the function are not calls
+            if( tidx is None or tidx == idx ):
+                continue
+            ret.add_call( idx, tidx )
+    return ret
+
+# key (build-id or filename) => call_graph, in progress ones are None
+graphs = {}
+# key => load bias for this session
+biases = {}
+# ( runtime address, architecture ) of functions to parse into the persistent cache on idle prompts
+prefetch_queue = collections.deque()
+prefetch_posted = False
+
+def cache_name( key ):
+    return f"callgraph/{key}"
+
+def index_task( task, key, fname, build_id ):
+    ret = None
+    if( build_id is not None and vdb.vdb_dir is not None ):
+        try:
+            version,ret = vdb.cache.get_object( cache_name(key) )
+            if( version != callgraph_cache_version ):
+                ret = None
+        except FileNotFoundError:
+            pass
+        except Exception as e: # pylint: disable=broad-exception-caught
+            vdb.log(f"Ignoring broken call graph cache for {fname}: {e}",level=3)
+    if( ret is None ):
+        try:
+            ret = build_graph( fname, task )
+        except (OSError,ValueError,struct.error) as e:
+            vdb.log(f"Failed to build call graph of {fname}: {e}",level=4)
+            graphs.pop(key,None)
+            return
+        if( build_id is not None and vdb.vdb_dir is not None ):
+            try:
+                vdb.cache.save_object( cache_name(key), ( callgraph_cache_version, ret ) )
+            except OSError as e:
+                vdb.log(f"Failed to save call graph of {fname}: {e}",level=3)
+    graphs[key] = ret
+    vdb.log(f"Call graph of {fname}: {len(ret.starts)} functions, {len(ret.callers)} called",level=4)
+    # Listings rendered so far have no counts yet
+    gdb.post_event( lambda : vdb.asm.invalidate_render_cache(None) )
+
+def start_index( objfile ):
+    if( not enabled.value or vdb.texe is None ):
+        return
+    # Separate debug info files have no code
+    if( objfile.owner is not None or objfile.filename is None ):
+        return
+    key = vdb.elf.objfile_key(objfile)
+    biases.pop(key,None)
+    if( key in graphs ):
+        return
+    graphs[key] = None
+    vdb.util.async_task( index_task, key, objfile.filename, objfile.build_id ).start()
+
+@vdb.event.new_objfile()
+def new_objfile( ev ):
+    start_index( ev.new_objfile )
+
+@vdb.event.clear_objfiles()
+def clear_objfiles( ev ):
+    biases.clear()
+    prefetch_queue.clear()
+
+def load_bias( key, graph, objfile ):
+    ret = biases.get(key,None)
+    if( ret is not None ):
+        return ret
+    ret = 0
+    if( graph.pie ):
+        ret = None
+        # The first function gdb knows about tells where the file has been loaded to
+        for idx in range(min(len(graph.names),32)):
+            try:
+                sym = objfile.lookup_global_symbol( graph.names[idx] )
+                if( sym is None ):
+                    sym = objfile.lookup_static_symbol( graph.names[idx] )
+                if( sym is not None ):
+                    addr = int(sym.value().address)
+                else:
+                    addr = int(gdb.parse_and_eval(f"&'{graph.names[idx]}'"))
+                ret = addr - graph.starts[idx]
+                break
+            except (gdb.error,RuntimeError,TypeError,AttributeError):
+                pass
+        if( ret is None ):
+            return None
+    biases[key] = ret
+    return ret
+
+def lookup( addr ):
+    """
+    The ( call_graph, load bias, function index ) for the runtime address or None if that is not (yet) known
+    """
+    try:
+        objfile = vdb.elf.objfile_for_address( addr )
+    except (gdb.error,RuntimeError,AttributeError):
+        return None
+    if( objfile is None ):
+        return None
+    key = vdb.elf.objfile_key(objfile)
+    graph = graphs.get(key,None)
+    if( graph is None ):
+        return None
+    bias = load_bias( key, graph, objfile )
+    if( bias is None ):
+        return None
+    idx = graph.function_at( addr - bias )
+    if( idx is None ):
+        return None
+    return ( graph, bias, idx )
+
+def summary( addr ):
+    """
+    Caller and callee count of the function at addr for the disassembler header
+    """
+    if( not enabled.value ):
+        return ""
+    gi = lookup( addr )
+    if( gi is None ):
+        return ""
+    graph,_,idx = gi
+    return f" ({len(graph.callers.get(idx,{}))} callers, {len(graph.callees.get(idx,{}))} callees)"
+
+def show( addr ):
+    gi = lookup( addr )
+    if( gi is None ):
+        print(f"No call graph known (yet) for {addr:#0x}")
+        return
+    graph,bias,idx = gi
+    otbl = []
+    otbl.append( ["Direction","Address","Function","Call sites"] )
+    for what,entries in ( ( "caller", graph.callers ), ( "callee", graph.callees ) ):
+        for i,cnt in sorted( entries.get(idx,{}).items(), key = lambda x : -x[1] ):
+            otbl.append( [ what, f"{graph.starts[i]+bias:#0x}", graph.names[i], cnt ] )
+    print(f"Call graph of {graph.names[idx]}")
+    print(vdb.util.format_table(otbl))
+
+def queue_prefetch( addr ):
+    """
+    Remember the functions most likely to be disassembled next, those called most often from this one and the callers.
+    Parsing a big one would hold up the prompt for longer than any budget allows, they are left for when they are
+    actually disassembled.
+    """
+    count = prefetch_count.value
+    if( not count ):
+        return
+    gi = lookup( addr )
+    if( gi is None ):
+        return
+    graph,bias,idx = gi
+    maxsize = prefetch_max.value
+    def candidates( entries ):
+        ret = sorted( entries.get(idx,{}).items(), key = lambda x : -x[1] )
+        if( maxsize > 0 ):
+            ret = [ e for e in ret if graph.ends[e[0]] - graph.starts[e[0]] <= maxsize ]
+        return ret[:count]
+    callees = candidates( graph.callees )
+    callers = candidates( graph.callers )
+    prefetch_queue.clear()
+    archname = vdb.asm.current_arch.name
+    for i,_ in callees + callers:
+        prefetch_queue.append( ( graph.starts[i] + bias, archname ) )
+
+@vdb.event.before_prompt()
+def prefetch_idle( ):
+    # Nothing is done before the prompt is there, gdb runs the event once it is waiting for input
+    global prefetch_posted
+    if( len(prefetch_queue) == 0 or prefetch_posted ):
+        return
+    prefetch_posted = True
+    gdb.post_event( prefetch_run )
+
+def prefetch_run( ):
+    """
+    Works on the queue until vdb-asm-callgraph-prefetch-budget seconds are used up, the rest is left for the next prompt
+    """
+    global prefetch_posted
+    prefetch_posted = False
+    end = time.time() + prefetch_budget.fvalue
+    first = True
+    # At least one, otherwise a budget below the time for a single function would never get anywhere
+    while( len(prefetch_queue) > 0 and ( first or time.time() < end ) ):
+        first = False
+        addr,archname = prefetch_queue.popleft()
+        try:
+            if( vdb.asm.prefetch( f"{addr:#0x}", archname ) ):
+                vdb.log(f"Prefetched {addr:#0x} into the persistent parse cache",level=4)
+        except (gdb.error,gdb.MemoryError,RuntimeError,ValueError) as e:
+            vdb.log(f"Prefetching {addr:#0x} failed: {e}",level=4)
+
+try:
+    for o in gdb.objfiles():
+        start_index(o)
+except AttributeError: # No gdb
+    pass
+
+# vim: tabstop=4 shiftwidth=4 expandtab ft=python
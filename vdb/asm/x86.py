@@ -173,14 +173,12 @@ class asm_arg(vdb.asm.asm_arg_base):
 class instruction( vdb.asm.instruction_base ):
 
     class_res = vdb.asm.instruction_base.compile_class_res( _x86_class_res )
-    class_cache = {}
 
 
-    # line: the assembler text line
-    # m: the match of the linere regular expression
-    def __init__( self, line, m, oldins, function_range ):
+    # dec: the vdb.asm.decoded_instruction, no matter which engine produced it
+    def __init__( self, dec, oldins, function_range ):
         super().__init__()
-        self.parse(line,m,oldins)
+        self.parse(dec,oldins)
 
     jmpre = re.compile(r"^\*(0x[0-9a-fA-F]*)\(.*")
     last_cmp_immediate = 1
@@ -194,9 +192,9 @@ class instruction( vdb.asm.instruction_base ):
             return (False,True)
 
     @vdb.overrides
-    def parse( self, line, m, oldins ) -> "instruction":
-#        print(f"parse( {line=}, {m=}, {oldins=} )")
-        tokens = self.parse_common( line, m, oldins )
+    def parse( self, dec, oldins ) -> "instruction":
+#        print(f"parse( {dec=}, {oldins=} )")
+        tokens = self.parse_common( dec, oldins )
 
 #        print("tokens = '%s'" % tokens )
         # the dissamble version without <line+>
@@ -299,13 +297,13 @@ class instruction( vdb.asm.instruction_base ):
 #                    print("self.reference = '%s'" % self.reference )
             elif( tokens[tpos].startswith("<") ):
                 if( not self.jump ):
-                    print(f"{line=} has jump target annotation but was not detected any jumping/calling instruction previously")
+                    print(f"line={self.line!r} has jump target annotation but was not detected any jumping/calling instruction previously")
 #                    self.conditional_jump = True
 #                    print("TARGET ADD '%s'" % tokens[tpos-1])
                 self.target_name = " ".join(tokens[tpos:])
                 self.raw_target = " ".join(tokens[tpos:]) # And never change it anymore
             else:
-                print(f"{line=} has unknown annotation")
+                print(f"line={self.line!r} has unknown annotation")
 #            elif( self.mnemonic in conditional_jump_mnemonics ):
 
         # What kind of target do we jump to?
@@ -373,7 +371,7 @@ class instruction( vdb.asm.instruction_base ):
                     pass
 
         if( self.jump and len(self.targets) == 0 ):
-            print(f"WARNING {line=} has no targets")
+            print(f"WARNING line={self.line!r} has no targets")
 
         self.iclass = self.mnemonic_class( self.mnemonic )
 
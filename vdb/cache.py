@@ -5,6 +5,8 @@ import vdb
 import vdb.util
 
 import gdb
+import os
+import pickle
 import sys
 
 from typing import Dict
@@ -29,6 +31,26 @@ def save_string( cachename, data ):
     with open(filename(cachename),"w") as f:
         f.write(data)
 
+# Loads a pickled object, raises FileNotFoundError when there is none
+def get_object( cachename ):
+    with open(filename(cachename),"rb") as f:
+        return pickle.load(f)
+
+# Pickles the object, cachename may contain subdirectories. Written to a temporary file first so that a concurrently
+# running gdb never sees a half written file
+def save_object( cachename, data ):
+    fn = filename(cachename)
+    os.makedirs(os.path.dirname(fn),exist_ok = True)
+    tfn = f"{fn}.{os.getpid()}.tmp"
+    try:
+        with open(tfn,"wb") as f:
+            pickle.dump(data,f)
+        os.replace(tfn,fn)
+    finally:
+        # Only still there if something went wrong
+        if( os.path.exists(tfn) ):
+            os.unlink(tfn)
+
 def add_time( t: float, n: float ):
     ct = cumulative_time.get(n,0.0)
     ct += t
@@ -111,9 +133,17 @@ class re:
             re_cache.hits += 1
         return r.m
 
+# Caches of other modules that want their statistics shown by dump()
+registered = {}
+
+def register( name, entry ):
+    registered[name] = entry
+
 def dump( ):
     print(f"type_cache : {type_cache}")
     print(f"re_cache   : {re_cache}")
+    for name,entry in registered.items():
+        print(f"{name:<10} : {entry}")
 
     for k,v in cumulative_time.items():
         print(f"{k:<20} : {v}")
@@ -21,6 +21,10 @@ PARAM_ARRAY = 0x803
 
 execute_origin = None
 
+# Incremented whenever any parameter is successfully set, so caches of things derived from configuration (mostly
+# colours) can cheaply check if they are still up to date
+generation = 0
+
 def guess_gdb_type( p ):
 #    print("Guess type of %s is %s" % (p,type(p)))
     if( isinstance(p,bool) ): # a python bool is a python int too
@@ -216,6 +220,8 @@ class parameter(gdb.Parameter):
             vdb.print_exc()
             self.value = self.previous_value
             raise
+        global generation
+        generation += 1
         self.previous_value = self.value
         pval = self.value
         if isinstance(self.value, str):
@@ -22,16 +22,19 @@ def do_histogram( ):
 
     buckets = {}
     all_numeric = True
-    for ts in sorted(td.keys()):
-        tdata = td[ts]
-        for _,v in tdata.items():
-            try:
-                v = int(v)
-            except:
+    for _,idx in td.rows():
+        for col in td.columns.values():
+            v = col.get(idx)
+            if( v is None ):
+                continue
+            if( isinstance(v,str) ):
                 try:
-                    v = float(v)
+                    v = int(v)
                 except:
-                    all_numeric = False
+                    try:
+                        v = float(v)
+                    except:
+                        all_numeric = False
 
             num=buckets.get(v,0)
             num += 1
@@ -39,7 +42,11 @@ def do_histogram( ):
     
 #    print("all_numeric = '%s'" % all_numeric )
 #    print("buckets = '%s'" % buckets )
-    for b,n in sorted(buckets.items()):
+    if( all_numeric ):
+        buckets = sorted(buckets.items())
+    else:
+        buckets = sorted(buckets.items(), key = lambda x : str(x[0]))
+    for b,n in buckets:
         print("%s : %s" % (b,n) )
 
 
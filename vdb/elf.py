@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Minimal ELF reader, just the section headers and the symbol tables. Used where asking gdb is too slow or has to
+# happen outside of the gdb thread, everything in here works on link time addresses.
+
+import vdb
+import vdb.cache
+import vdb.event
+
+import gdb
+
+import struct
+import bisect
+import array
+import collections
+
+# The parts of an ELF file we need, enough to find the symbols and the code
+elf_section = collections.namedtuple("elf_section", [ "name", "type", "flags", "addr", "offset", "size", "link", "entsize" ] )
+
+SHT_SYMTAB = 2
+SHT_NOBITS = 8
+SHT_DYNSYM = 11
+SHF_ALLOC = 2
+SHF_EXECINSTR = 4
+STT_OBJECT = 1
+STT_FUNC = 2
+STT_GNU_IFUNC = 10
+ET_DYN = 3
+
+EM_386 = 3
+EM_ARM = 40
+EM_X86_64 = 62
+EM_AARCH64 = 183
+
+function_types = ( STT_FUNC, STT_GNU_IFUNC )
+
+class elf_file:
+
+    def __init__( self, data ):
+        if( data[:4] != b"\x7fELF" ):
+            raise ValueError("Not an ELF file")
+        self.data = data
+        self.is64 = ( data[4] == 2 )
+        self.endian = "<" if data[5] == 1 else ">"
+        if( self.is64 ):
+            hdr = struct.unpack_from( self.endian + "HHIQQQIHHHHHH", data, 16 )
+        else:
+            hdr = struct.unpack_from( self.endian + "HHIIIIIHHHHHH", data, 16 )
+        self.type = hdr[0]
+        self.machine = hdr[1]
+        shoff = hdr[5]
+        shentsize = hdr[10]
+        shnum = hdr[11]
+        shstrndx = hdr[12]
+
+        shfmt = self.endian + ( "IIQQQQIIQQ" if self.is64 else "IIIIIIIIII" )
+        raw = []
+        for i in range(shnum):
+            sh = struct.unpack_from( shfmt, data, shoff + i * shentsize )
+            raw.append(sh)
+        self.sections = []
+        if( shstrndx < len(raw) ):
+            stroff = raw[shstrndx][4]
+        else:
+            stroff = None
+        for sh in raw:
+            name = ""
+            if( stroff is not None ):
+                name = self.string( stroff + sh[0] )
+            self.sections.append( elf_section( name, sh[1], sh[2], sh[3], sh[4], sh[5], sh[6], sh[9] ) )
+
+    @classmethod
+    def load( cls, fname ):
+        with open(fname,"rb") as f:
+            return cls(f.read())
+
+    def string( self, offset ):
+        end = self.data.find( b"\0", offset )
+        return self.data[offset:end].decode("utf-8","replace")
+
+    def symbols( self, types ):
+        """
+        Yields ( value, size, name ) of all defined symbols of one of the types, value still has the thumb bit
+        """
+        symfmt = self.endian + ( "IBBHQQ" if self.is64 else "IIIBBH" )
+        symsize = struct.calcsize(symfmt)
+        for sec in self.sections:
+            if( sec.type not in ( SHT_SYMTAB, SHT_DYNSYM ) or sec.link >= len(self.sections) ):
+                continue
+            stroff = self.sections[sec.link].offset
+            count = sec.size // symsize
+            for sym in struct.iter_unpack( symfmt, self.data[sec.offset:sec.offset+count*symsize] ):
+                if( self.is64 ):
+                    st_name,st_info,_,st_shndx,st_value,st_size = sym
+                else:
+                    st_name,st_value,st_size,st_info,_,st_shndx = sym
+                if( ( st_info & 0xf ) not in types or st_shndx == 0 or st_value == 0 ):
+                    continue
+                yield ( st_value, st_size, self.string( stroff + st_name ) )
+
+    def functions( self ):
+        """
+        Yields ( value, size, name ) of all function symbols, value still has the thumb bit
+        """
+        return self.symbols( function_types )
+
+    def code( self, addr, size ):
+        """
+        The bytes at the link time address or None if they are not in an executable section of the file
+        """
+        for sec in self.sections:
+            if( sec.type == SHT_NOBITS or not ( sec.flags & SHF_EXECINSTR ) ):
+                continue
+            if( sec.addr <= addr and addr + size <= sec.addr + sec.size ):
+                off = sec.offset + addr - sec.addr
+                return self.data[off:off+size]
+        return None
+
+def objfile_key( objfile ):
+    if( objfile.build_id is not None ):
+        return objfile.build_id
+    return objfile.filename
+
+def objfile_for_address( addr ):
+    """
+    The objfile the address belongs to, for separate debug info files that is the one they belong to
+    """
+    try:
+        ret = gdb.current_progspace().objfile_for_address(addr)
+    except AttributeError: # Only available since gdb 13
+        ret = None
+        sal = gdb.find_pc_line(addr)
+        if( sal.symtab is not None ):
+            ret = sal.symtab.objfile
+    if( ret is not None and ret.owner is not None ):
+        ret = ret.owner
+    return ret
+
+# Bump whenever symbol_index changes in an incompatible way
+symtab_cache_version = 2
+
+class symbol_index:
+    """
+    The sized function and object symbols of one objfile, sorted by their link time address
+    """
+
+    def __init__( self ):
+        self.starts = array.array("Q")
+        self.sizes = array.array("Q")
+        self.names = []
+        self.pie = False
+        self.sections = {} # name => link time address of the loaded sections, to figure out the load bias
+        self.files = 0 # how many files (the objfile and its debug files) went into it
+        self.max_ends = None # highest end of all symbols up to that index
+
+    def __getstate__( self ):
+        ret = self.__dict__.copy()
+        ret["max_ends"] = None
+        return ret
+
+    def __len__( self ):
+        return len(self.starts)
+
+    def at( self, addr, name = None ):
+        """
+        Index of the symbol starting exactly at addr. If there are several the one called name wins, otherwise the
+        biggest. None if there is none.
+        """
+        idx = bisect.bisect_left( self.starts, addr )
+        ret = None
+        while( idx < len(self.starts) and self.starts[idx] == addr ):
+            if( self.names[idx] == name ):
+                return idx
+            if( ret is None or self.sizes[idx] > self.sizes[ret] ):
+                ret = idx
+            idx += 1
+        return ret
+
+    def containing( self, addr ):
+        """
+        Index of the symbol addr is in, the innermost one if they are nested and the biggest of those starting at the
+        same address. None if there is none.
+        """
+        if( self.max_ends is None ):
+            self.max_ends = array.array("Q")
+            mx = 0
+            for start,size in zip(self.starts,self.sizes):
+                mx = max( mx, start + size )
+                self.max_ends.append(mx)
+        idx = bisect.bisect_right( self.starts, addr ) - 1
+        ret = None
+        # Only as far back as some symbol might still reach addr
+        while( idx >= 0 and self.max_ends[idx] > addr ):
+            start = self.starts[idx]
+            if( ret is not None and start < self.starts[ret] ):
+                break
+            if( start + self.sizes[idx] > addr and ( ret is None or self.sizes[idx] > self.sizes[ret] ) ):
+                ret = idx
+            idx -= 1
+        return ret
+
+def build_symbol_index( fnames ):
+    syms = set()
+    ret = symbol_index()
+    for i,fname in enumerate(fnames):
+        elf = elf_file.load(fname)
+        if( i == 0 ):
+            ret.pie = ( elf.type == ET_DYN )
+            for sec in elf.sections:
+                if( ( sec.flags & SHF_ALLOC ) and len(sec.name) > 0 ):
+                    ret.sections[sec.name] = sec.addr
+        # Only code addresses have the thumb bit
+        thumb = ( elf.machine == EM_ARM )
+        for types,mask in ( ( function_types, ~1 if thumb else ~0 ), ( ( STT_OBJECT, ), ~0 ) ):
+            for value,size,name in elf.symbols( types ):
+                # Without a size we would not know more than gdb does
+                if( size == 0 ):
+                    continue
+                syms.add( ( value & mask, size, name ) )
+        ret.files += 1
+    for value,size,name in sorted(syms):
+        ret.starts.append(value)
+        ret.sizes.append(size)
+        ret.names.append(name)
+    return ret
+
+# key (build-id or filename) => symbol_index, None if there is none for that objfile
+symbol_indexes = {}
+
+def symtab_cache_name( key ):
+    return f"symtab/{key}"
+
+def get_symbol_index( objfile ):
+    """
+    The symbol index for the objfile, from the persistent cache if possible, otherwise read from the file and its
+    separate debug info files.
+    """
+    key = objfile_key(objfile)
+    try:
+        return symbol_indexes[key]
+    except KeyError:
+        pass
+
+    fnames = [ objfile.filename ]
+    for o in gdb.objfiles():
+        if( o.owner == objfile and o.filename is not None ):
+            fnames.append(o.filename)
+
+    ret = None
+    persist = ( objfile.build_id is not None and vdb.vdb_dir is not None )
+    if( persist ):
+        try:
+            version,ret = vdb.cache.get_object( symtab_cache_name(key) )
+            # The debug info file may have been installed since
+            if( version != symtab_cache_version or ret.files != len(fnames) ):
+                ret = None
+        except FileNotFoundError:
+            pass
+        except Exception as e: # pylint: disable=broad-exception-caught
+            vdb.log(f"Ignoring broken symbol table cache for {objfile.filename}: {e}",level=3)
+    if( ret is None ):
+        try:
+            ret = build_symbol_index( fnames )
+        except (OSError,ValueError,struct.error) as e:
+            vdb.log(f"Failed to read the symbol table of {objfile.filename}: {e}",level=4)
+        if( ret is not None and persist ):
+            try:
+                vdb.cache.save_object( symtab_cache_name(key), ( symtab_cache_version, ret ) )
+            except OSError as e:
+                vdb.log(f"Failed to save the symbol table of {objfile.filename}: {e}",level=3)
+    symbol_indexes[key] = ret
+    return ret
+
+@vdb.event.new_objfile()
+def new_objfile( ev ):
+    # A separate debug info file has more symbols for its owner
+    objfile = ev.new_objfile
+    if( objfile.owner is not None ):
+        objfile = objfile.owner
+    symbol_indexes.pop( objfile_key(objfile), None )
+
+# vim: tabstop=4 shiftwidth=4 expandtab ft=python
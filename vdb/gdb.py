@@ -64,6 +64,9 @@ class Command:
 class error(Exception):
     pass
 
+class MemoryError(error):
+    pass
+
 COMMAND_DATA = 0
 COMPLETE_EXPRESSION = 0
 PARAM_BOOLEAN = 0
@@ -82,12 +85,18 @@ class mock_event:
 
 class events:
     new_objfile = mock_event
+    free_objfile = mock_event
+    clear_objfiles = mock_event
     new_thread = mock_event
     stop = mock_event
+    exited = mock_event
     before_prompt = mock_event
     memory_changed = mock_event
     inferior_call = mock_event
     new_inferior = mock_event
+    breakpoint_created = mock_event
+    breakpoint_modified = mock_event
+    breakpoint_deleted = mock_event
 
 class mock_type:
 
@@ -115,6 +124,9 @@ def execute( *args, **kwargs ):
         with open(args[1], 'r') as myfile:
             data=myfile.read()
             return data
+    # like gdb does for names that are not mangled
+    if( args[0] == "demangle" ):
+        raise error(f"Can't demangle \"{args[1]}\"")
     data = mockdata.get(tuple(args),"")
     if( data is None ):
         raise error("NO ANSWER FOUND")
@@ -123,6 +135,9 @@ def execute( *args, **kwargs ):
 def selected_thread( ):
     return None
 
+def current_recording( ):
+    return None
+
 class Architecture:
 
     def name( self ):
@@ -133,6 +148,10 @@ class Frame:
     def architecture( self ):
         return Architecture()
 
+    # There is no process, so no registers either
+    def read_register( self, reg ):
+        raise ValueError(f"Bad register {reg}")
+
 def selected_frame( ):
     return Frame()
 
@@ -140,13 +159,39 @@ class Architecture:
     def name( self ):
         return "x86"
 
+# ( start, bytes ) that tests make readable, everything else fails like without a process
+inferior_memory = []
+
 class Inferior:
+    # There is no process, which gdb shows as pid 0 and no connection
+    pid = 0
+    connection = None
+
     def architecture( self ):
         return Architecture()
 
+    def read_memory( self, addr, count ):
+        for start,data in inferior_memory:
+            if( start <= addr and addr + count <= start + len(data) ):
+                return memoryview(data[addr-start:addr-start+count])
+        raise MemoryError(f"Cannot access memory at address {addr:#0x}")
+
 def selected_inferior( ):
     return Inferior()
 
+# No executable loaded either
+class Progspace:
+    filename = None
+
+    def objfiles( self ):
+        return []
+
+def current_progspace( ):
+    return Progspace()
+
+def objfiles( ):
+    return []
+
 class Value:
     def __init__( self, x ):
         self.x = x
@@ -158,6 +203,9 @@ def parse_and_eval( s ):
     print("s = '%s'" % s )
     return evaldict.get(s,0)
 
+def format_address( addr ):
+    return f"{addr:#x}"
+
 def string_to_argv( arg ):
     argv=shlex.split(arg)
     return argv
@@ -168,4 +216,11 @@ class FinishBreakpoint:
 class Breakpoint:
     pass
 
+def breakpoints( ):
+    return []
+
+class Function:
+    def __init__( self, *args, **kwargs ):
+        pass
+
 # vim: tabstop=4 shiftwidth=4 expandtab ft=python
@@ -663,6 +663,9 @@ def follow_track_lines( tvar, relative_ts ):
 #    print(f"{t=}")
 
 
+# Where in the track store the last fragment for the graph ended
+fragment_position = None
+
 def extract_track( xtvar, relative_ts, timeseries = False, fragments = True ):
 #    print(f"extract_track( {tvar=}, {relative_ts=}, {timeseries=} )"
     # extract_track( tvar=['VALUE'], relative_ts=False, timeseries=False )
@@ -676,8 +679,11 @@ def extract_track( xtvar, relative_ts, timeseries = False, fragments = True ):
     # XXX Instead of doing it this way, can we maybe quickly copy the data and stuff it into a queue and if there is
     # already something in the queue just replace that? That way we can "drop" updates in between. Before we try that
     # out, create some "FPS" measurements
+    global fragment_position
+    position = None
     if( fragments ):
-        vdb.track.tracking_data = {}
+        position = fragment_position
+        fragment_position = td.end()
 
     ts_offset = 0
     first = None
@@ -730,17 +736,14 @@ def extract_track( xtvar, relative_ts, timeseries = False, fragments = True ):
 #    print("ids = '%s'" % (ids,) )
     ret = []
     retts = []
-    # XXX This is getting nonlinearily expensive and makes the whole thing unsuitable for longer runs. The target has
-    # the ability to just add data, maybe we delete the tracking data here? But if we do, we cannot restart the
-    # graphing, so maybe make that an option, or possibly store all the fragments in a list and upon restarting send
-    # them all again?
-    # Or maybe we can structure track in a way that it can start at a different point. If dicts where trees this would
-    # be possible to start iterating based on a timestamp.
-
-    for stamp,ts in td.items():
-#        print("ts = '%s'" % (ts,) )
-        for id in ids:
-            point = ts.get(id,None)
+    # Only the rows added since the last fragment are looked at, the track store keeps them in order so there is no
+    # need to go through (or throw away) everything every time
+
+    columns = [ td.column(id) for id in ids ]
+    columns = [ col for col in columns if col is not None ]
+    for stamp,idx in td.rows(position):
+        for col in columns:
+            point = col.get(idx)
 #            print("point = '%s'" % (point,) )
             if( point is not None ):
                 if isinstance(point,list):
@@ -757,8 +760,7 @@ def extract_track( xtvar, relative_ts, timeseries = False, fragments = True ):
     return (ret,retts)
 
 
-    for ts in sorted(td.keys()):
-        kts = ts
+    for ts,idx in td.rows():
         ts = ts - ts_offset
         if( first == None ):
             if( relative_ts ):
@@ -768,9 +770,8 @@ def extract_track( xtvar, relative_ts, timeseries = False, fragments = True ):
 
         last = ts
         plotline = f"{ts:0.11f} "
-        tdata = td[kts]
         for id in ids:
-            point = tdata.get(id,None)
+            point = td.get(id,idx)
 
             if( point is None ):
                 plotline += " - "
@@ -17,6 +17,9 @@ import gdb
 import string
 import traceback
 import re
+import time
+import shlex
+import subprocess
 import intervaltree
 
 
@@ -27,14 +30,20 @@ repeat_header = vdb.config.parameter("vdb-hexdump-repeat-header",42)
 default_chaindepth = vdb.config.parameter("vdb-hexdump-default-chaindepth",3)
 default_align = vdb.config.parameter("vdb-hexdump-default-align",False)
 
+chunk_size    = vdb.config.parameter("vdb-hexdump-chunk-size",64*1024)
+pager         = vdb.config.parameter("vdb-hexdump-pager","less -R")
+file_colors   = vdb.config.parameter("vdb-hexdump-file-colors",False)
+progress_interval = vdb.config.parameter("vdb-hexdump-progress-interval",1.0)
+
 pc_separator = vdb.config.parameter("vdb-hexdump-pointer-chain-separator","|")
 row_format = vdb.config.parameter("vdb-hexdump-row-format", "{p}: {l}{t} {s}{pointer_string}{value_string}")
 
 
 color_list = vdb.config.parameter("vdb-hexdump-colors-symbols", "#f00;#0f0;#00f;#ff0;#f0f;#0ff" , gdb_type = vdb.config.PARAM_COLOUR_LIST )
 unknown_color = vdb.config.parameter("vdb-hexdump-colors-unknown-bytes", "#666666", gdb_type =vdb.config.PARAM_COLOUR )
+changed_color = vdb.config.parameter("vdb-hexdump-colors-changed-bytes", "#ff0,#600", gdb_type =vdb.config.PARAM_COLOUR )
 
-def print_header( ):
+def header_line( ):
     #pylint: disable=possibly-unused-variable
     plen = vdb.arch.pointer_size // 4
     rowf = row_format.value
@@ -46,7 +55,10 @@ def print_header( ):
     pointer_string = "POINTERS "
     value_string = "VALUES "
     rowh = rowf.format(**locals())
-    print(vdb.color.color(rowh,color_head.value))
+    return vdb.color.color(rowh,color_head.value)
+
+def print_header( ):
+    print(header_line())
 #    print(vdb.color.color(f'  {" "*plen}  0  1  2  3   4  5  6  7    8  9  A  B   C  D  E  F   01234567 89ABCDEF',color_head.value))
 
 annotation_tree = intervaltree.IntervalTree()
@@ -84,9 +96,86 @@ def tile_format( cnt, t, l ):
         l += " "
     return (t,l)
 
-def hexdump( addr, xlen = -1, pointers = False, chaindepth = -1, values = False, symbols = True, align = None, uncached = False, sparse = False ):
-
-    vdb.log(f"hexdump( {addr=:#0x}, {xlen=}, {pointers=}, {chaindepth=}, {values=}, {symbols=}, {align=}, {uncached=}, {sparse=})",level=6)
+def row_pointers( dc, step ):
+    """
+    The pointer sized words of a row, without those that have unreadable bytes
+    """
+    ret = []
+    for poffset in range(0,16,step):
+#        print("poffset = '%s'" % poffset )
+#        print("step = '%s'" % step )
+        pbytes = dc[poffset:poffset+step]
+        if( isinstance(pbytes,vdb.memory.sparse_buffer) and not pbytes.all_valid() ):
+            continue
+        # XXX get byteorder from global
+        ret.append( int.from_bytes(pbytes,"little") )
+    return ret
+
+def annotation_runs( start, end, symtree ):
+    """
+    Splits [start,end) into ( start, end, name ) runs, name being what get_annotation() has for all of their bytes (or
+    None). Between the bounds of the intervals that does not change, so it is looked up only once per run.
+    """
+    bounds = { start, end }
+    for tree in ( annotation_tree, symtree ):
+        for iv in tree.overlap( start, end ):
+            if( iv.begin > start ):
+                bounds.add( iv.begin )
+            if( iv.end < end ):
+                bounds.add( iv.end )
+    bounds = sorted(bounds)
+    ret = []
+    for rstart,rend in zip(bounds,bounds[1:]):
+        name = None
+        for x in get_annotation( rstart, symtree ):
+            name = x[2]
+            break
+        ret.append( ( rstart, rend, name ) )
+    return ret
+
+def find_run( runs, xaddr, idx ):
+    """
+    Index of the run xaddr is in, searching forward from idx
+    """
+    idx = max(idx,0)
+    while( runs[idx][1] <= xaddr ):
+        idx += 1
+    return idx
+
+# The character shown for every byte value in the text column
+ascii_table = bytes( c if ( chr(c) in string.printable and chr(c) not in "\t\n\r\v\f" ) else ord(".") for c in range(256) )
+
+# colour => the escape sequences vdb.color.color() puts before and after the text
+color_wraps = {}
+
+def color_wrap( cs ):
+    ret = color_wraps.get(cs,None)
+    if( ret is None ):
+        pre,post = vdb.color.color("\0",cs).split("\0")
+        ret = ( pre, post )
+        color_wraps[cs] = ret
+    return ret
+
+def color_cells( cells, width, cs ):
+    """
+    The same as colouring every cell of width characters on its own and concatenating them
+    """
+    pre,post = color_wrap(cs)
+    if( len(pre) == 0 and len(post) == 0 ):
+        return cells
+    if( width == 1 ):
+        return pre + ( post + pre ).join(cells) + post
+    # hex cells all end with the only space in them
+    return pre + cells[:-1].replace(" ", " " + post + pre) + " " + post
+
+def hexdump_lines( addr, xlen = -1, pointers = False, chaindepth = -1, values = False, symbols = True, align = None, uncached = False, sparse = False, diff = False, progress = None ):
+    """
+    Yields the lines of the hexdump. Memory is read and rendered vdb-hexdump-chunk-size bytes at a time, so nothing
+    depends on the size of the range but the time it takes. progress is called with the number of bytes done after every
+    chunk.
+    """
+
+    vdb.log(f"hexdump( {addr=:#0x}, {xlen=}, {pointers=}, {chaindepth=}, {values=}, {symbols=}, {align=}, {uncached=}, {sparse=}, {diff=})",level=6)
     if( align is None ):
         align = default_align.value
 
@@ -94,10 +183,6 @@ def hexdump( addr, xlen = -1, pointers = False, chaindepth = -1, values = False,
         chaindepth = default_chaindepth.value
     if( xlen == -1):
         xlen = default_sizes.get(addr,default_len.value)
-    if( symbols ):
-        symtree = vdb.memory.get_symbols(addr,xlen)
-    else:
-        symtree = intervaltree.IntervalTree()
 
     suppress = 0 # amount of bytes at the beginning to leave out
     if( align ): # needs to align to 16 bytes
@@ -107,9 +192,20 @@ def hexdump( addr, xlen = -1, pointers = False, chaindepth = -1, values = False,
         xlen += suppress
 
     olen = xlen
+    chunk = max( chunk_size.value // 16 * 16, 16 )
+    clen = min( xlen, chunk )
 
 #    print(f"hexdump reads {addr:#0x} {uncached=}, {sparse=}")
-    data = vdb.memory.read_u(uncached,addr,xlen,partial=True,sparse = sparse)
+    data = vdb.memory.read_u(uncached,addr,clen,partial=True,sparse = sparse)
+    # In sparse mode one chunk can be completely unreadable while later ones are not
+    if( data is None and sparse ):
+        probe = addr + clen
+        while( probe < addr + xlen ):
+            plen = min( chunk, addr + xlen - probe )
+            if( vdb.memory.read_u(uncached,probe,plen,partial=True,sparse = sparse) is not None ):
+                data = vdb.memory.sparse_buffer( bytearray(clen), bytearray(clen) )
+                break
+            probe += plen
 #    print(f"{type(data)=}")
 #    if( data is not None ):
 #        print(f"{data.tobytes()=}")
@@ -121,11 +217,15 @@ def hexdump( addr, xlen = -1, pointers = False, chaindepth = -1, values = False,
         if( data is not None ):
             data = None
             while(data is None ):
-                xlen -= 1
-                data = vdb.memory.read_u(uncached,addr,xlen)
+                clen -= 1
+                data = vdb.memory.read_u(uncached,addr,clen)
+            xlen = clen
     if( data is None ):
-        print(f"Can not access memory at {addr:#0x}")
+        yield f"Can not access memory at {addr:#0x}"
         return
+    # The partial read can already end within the first chunk
+    if( len(data) < clen ):
+        xlen = len(data)
 #    print(f"{type(data)=}")
 #    print(f"{type(data[0])=}")
 
@@ -139,142 +239,250 @@ def hexdump( addr, xlen = -1, pointers = False, chaindepth = -1, values = False,
 
     rowf = row_format.value
 
+    snap = None
+    if( diff ):
+        snap = vdb.memory.last_snapshot()
+        if( snap is None ):
+            yield "No snapshot to compare against, take one with the snapshot command first"
+
     if( len(data) > 0 ):
-        vdb.memory.print_legend( )
-    #pylint: disable=possibly-unused-variable
-    while(len(data) > 0 ):
-#        print(f"{data=}")
-        dc = data[:16]
-#        print(f"{dc=}")
-        data = data[16:]
-#        print(f"{dc.tobytes()=}")
-#        print(f"{data.tobytes()=}")
-        p,_,_,_,_ = vdb.pointer.color(xaddr,vdb.arch.pointer_size)
-        cnt = 0
-        l = ""
-        t = ""
-        s = ""
-        pointer_string=""
-        value_string=""
-        parr = []
-        step = vdb.arch.pointer_size // 8
-        # XXX Suppress the output of the pointers also when at least one of their bytes is suppressed
+        yield from vdb.memory.legend_lines( )
+    caddr = addr
+    while( True ):
+        if( symbols ):
+            symtree = vdb.memory.get_symbols(caddr+suppress,len(data)-suppress)
+        else:
+            symtree = intervaltree.IntervalTree()
+        changed = None
+        if( snap is not None ):
+            changed = snap.compare( caddr, data.tobytes() )
+        # The pointer chains of the whole chunk in one go
+        chained = {}
         if( pointers ):
-            for poffset in range(0,16,step):
-#                print("poffset = '%s'" % poffset )
-#                print("step = '%s'" % step )
-                pbytes = dc[poffset:poffset+step]
-                # XXX get byteorder from global
-                pint = int.from_bytes(pbytes,"little")
-#                print("pint = '%s'" % pint )
-                ps,pu = vdb.pointer.chain( pint, vdb.arch.pointer_size, chaindepth, test_for_ascii = False )
-                if( not pu ):
-                    pointer_string += ps
-                    pointer_string += pc_separator.value
-
-#        print(f"{type(dc)=}")
-#        print(f"{type(dc[0])=}")
-        for d in dc:
-#            vdb.util.inspect(dc)
-#            vdb.util.inspect(d)
-#            if( isinstance(d,int) ):
-#                d=d.to_bytes()
-#            print(f"{type(d)=}")
-#            print(f"1{d=}")
-#            d = bytes(d)
-#            print(f"2{d=}")
-            if( suppress ):
-                suppress -= 1
-                l += "   "
-                t += " "
-                cnt += 1
-                t,l = tile_format(cnt,t,l)
-                continue
-#            xs = symtree[xaddr+cnt]
-#            print("")
-#            print(f"xaddr = {int(xaddr):#0x}" if xaddr is not None else "xaddr = None")
-#            print(f"{cnt=}")
-            xs = get_annotation( xaddr + cnt, symtree )
-#            print(f"{xs=}")
-            nsym = None
-            for x in xs:
-#                print("x[0] = '%s'" % x[0] )
-#                print("x[1] = '%s'" % x[1] )
-#                print("xaddr = '%s'" % xaddr )
-                nsym = x[2]
-                break
-
-#            nm = gdb.parse_and_eval(f"(void*)({xaddr+cnt})")
-#            m=symre.match(str(nm))
-#            if( m ):
-            if( nsym is not None ):
-#                print("m.group(0) = '%s'" % m.group(0) )
-#                print("m.group(1) = '%s'" % m.group(1) )
-#                nsym = m.group(1)
-                nsym = vdb.shorten.symbol(nsym)
-#                print("nsym = '%s'" % nsym )
-                if( current_symbol != nsym ):
-                    if( nsym ):
-                        next_color += 1
-                        next_color %= len(color_list.elements)
-                        sym_color = color_list.elements[next_color]
-                        s += vdb.color.color(nsym,sym_color)
-                        s += " "
-                        if( values ):
-#                            print("nsym = '%s'" % nsym )
-#                            value = gdb.execute(f"p {nsym}",False,True)
-                            try:
-                                value = gdb.parse_and_eval(f"{nsym}")
-                            except:
-                                value = ""
-                            value = str(value)
-#                            print("value = '%s'" % value )
-                            if( len(value) > 0 and value[-1] == "\n" ):
-                                value = value[:-1]
-                            if( len(value) > 0 and value.find("\n") == -1 ):
-                                value_string += vdb.color.color(value,sym_color)
-                                value_string += " "
+            step = vdb.arch.pointer_size // 8
+            pints = []
+            for poff in range(0,len(data),16):
+                pints += row_pointers( data[poff:poff+16], step )
+            chained = dict( zip( pints, vdb.pointer.chains( pints, vdb.arch.pointer_size, chaindepth, test_for_ascii = False ) ) )
+        # All row addresses at once, they are sorted so that is just one walk over the memory map
+        row_regions = vdb.memory.mmap.classify( range(caddr,caddr+len(data),16) )
+        row = 0
+        runs = annotation_runs( caddr + suppress, caddr + len(data), symtree )
+        run_idx = 0
+        current_run = -1
+        full = data.tobytes()
+        mask = None
+        if( isinstance(data,vdb.memory.sparse_buffer) and not data.all_valid() ):
+            mask = data.mask
+        doff = 0
+        #pylint: disable=possibly-unused-variable
+        while( doff < len(data) ):
+            dc = data[doff:doff+16]
+            raw = full[doff:doff+16]
+            p,_,_,_,_ = vdb.pointer.color(xaddr,vdb.arch.pointer_size,row_regions[row])
+            row += 1
+            l = ""
+            t = ""
+            s = ""
+            pointer_string=""
+            value_string=""
+            parr = []
+            step = vdb.arch.pointer_size // 8
+            # XXX Suppress the output of the pointers also when at least one of their bytes is suppressed
+            if( pointers ):
+                for pint in row_pointers( dc, step ):
+                    ps,pu = chained[pint]
+                    if( not pu ):
+                        pointer_string += ps
+                        pointer_string += pc_separator.value
+
+            # Cut the row into pieces that have the same colour and readability and don't cross a tile, each is then
+            # rendered in one go
+            rlen = len(raw)
+            suppress = min(suppress,rlen)
+            cuts = set(range(4,rlen,4))
+            cuts.add(suppress)
+            cuts.add(rlen)
+            while( run_idx < len(runs) and runs[run_idx][1] < xaddr + rlen ):
+                cuts.add( runs[run_idx][1] - xaddr )
+                run_idx += 1
+            rvalid = None
+            if( mask is not None ):
+                rvalid = mask[doff:doff+16]
+                if( rvalid.count(0) == 0 ):
+                    rvalid = None
+            rchanged = None
+            if( changed is not None ):
+                rchanged = changed[doff:doff+16]
+                if( rchanged.count(0) == rlen ):
+                    rchanged = None
+            for rmask in ( rvalid, rchanged ):
+                if( rmask is not None ):
+                    for i in range(1,rlen):
+                        if( rmask[i] != rmask[i-1] ):
+                            cuts.add(i)
+
+            cnt = 0
+            for end in sorted(cuts):
+                if( end <= cnt ):
+                    continue
+                if( cnt < suppress ):
+                    l += "   " * ( end - cnt )
+                    t += " " * ( end - cnt )
+                    cnt = end
+                    t,l = tile_format(cnt,t,l)
+                    continue
+                run = find_run( runs, xaddr + cnt, current_run )
+                if( run != current_run ):
+                    current_run = run
+                    nsym = runs[run][2]
+                    if( nsym is not None ):
+                        nsym = vdb.shorten.symbol(nsym)
+                        if( current_symbol != nsym ):
+                            if( nsym ):
+                                next_color += 1
+                                next_color %= len(color_list.elements)
+                                sym_color = color_list.elements[next_color]
+                                s += vdb.color.color(nsym,sym_color)
+                                s += " "
+                                if( values ):
+                                    try:
+                                        value = gdb.parse_and_eval(f"{nsym}")
+                                    except:
+                                        value = ""
+                                    value = str(value)
+                                    if( len(value) > 0 and value[-1] == "\n" ):
+                                        value = value[:-1]
+                                    if( len(value) > 0 and value.find("\n") == -1 ):
+                                        value_string += vdb.color.color(value,sym_color)
+                                        value_string += " "
+                            else:
+                                sym_color = None
+                            current_symbol = nsym
                     else:
                         sym_color = None
-                    current_symbol = nsym
-            else:
-                sym_color = None
-                current_symbol = None
-
-            if( d == ... ):
-                if( sym_color is None ):
-                    sym_color = unknown_color.value
-                l += vdb.color.color("?? ",sym_color)
-                t += vdb.color.color("?",sym_color)
-            else:
-                d = int.from_bytes(d,"little")
-                l += vdb.color.color(f"{d:02x} ",sym_color)
-                c = chr(d)
-                if( c in string.printable and not ( c in "\t\n\r\v\f") ):
-                    t += vdb.color.color(c,sym_color)
+                        current_symbol = None
+
+                byte_color = sym_color
+                if( rchanged is not None and rchanged[cnt] ):
+                    byte_color = changed_color.value
+                if( rvalid is not None and not rvalid[cnt] ):
+                    if( byte_color is None ):
+                        byte_color = unknown_color.value
+                    l += color_cells( "?? " * ( end - cnt ), 3, byte_color )
+                    t += color_cells( "?" * ( end - cnt ), 1, byte_color )
                 else:
-                    t += vdb.color.color(".",sym_color)
-            cnt += 1
-            t,l = tile_format(cnt,t,l)
-        cnt = (16-cnt)
-        t,l = spacer_format(cnt,t,l)
-        if( line % repeat_header.value == 0 ):
-            print_header()
-        line += 1
+                    piece = raw[cnt:end]
+                    l += color_cells( piece.hex(" ") + " ", 3, byte_color )
+                    t += color_cells( piece.translate(ascii_table).decode("latin-1"), 1, byte_color )
+                cnt = end
+                t,l = tile_format(cnt,t,l)
+            suppress = 0
+            cnt = (16-cnt)
+            t,l = spacer_format(cnt,t,l)
+            if( line % repeat_header.value == 0 ):
+                yield header_line()
+            line += 1
 #        print("len(t) = '%s'" % len(t) )
-        print(rowf.format(**locals()))
-#        print("dc = '%s'" % dc )
-#        print("len(dc) = '%s'" % len(dc) )
-#        print("data = '%s'" % data )
-#        print("len(data) = '%s'" % len(data) )
-        xaddr += 16
+            yield rowf.format(**locals())
+            doff += 16
+            xaddr += 16
+        done = caddr + len(data) - addr
+        if( progress is not None ):
+            progress( done )
+        if( done >= xlen or len(data) < clen ):
+            break
+        caddr += len(data)
+        clen = min( chunk, addr + xlen - caddr )
+        data = vdb.memory.read_u(uncached,caddr,clen,partial=True,sparse = sparse)
+        if( data is None and sparse ):
+            data = vdb.memory.sparse_buffer( bytearray(clen), bytearray(clen) )
+        if( data is None or len(data) == 0 ):
+            xlen = done
+            break
+        if( len(data) < clen ):
+            xlen = done + len(data)
 #    print("data = '%s'" % data )
 
 #    print("HEXDUMP")
 #    print("addr = '%s'" % addr )
 #    print("xlen = '%s'" % xlen )
     if( olen != xlen ):
-        print(f"Could only access {xlen} of {olen} requested bytes")
+        yield f"Could only access {xlen} of {olen} requested bytes"
+
+def hexdump( addr, xlen = -1, pointers = False, chaindepth = -1, values = False, symbols = True, align = None, uncached = False, sparse = False, diff = False ):
+    for line in hexdump_lines( addr, xlen, pointers, chaindepth, values, symbols, align, uncached, sparse, diff ):
+        print(line)
+
+class dump_progress:
+    """
+    Called by hexdump_lines() after every chunk, shows how far it got at most every vdb-hexdump-progress-interval seconds
+    """
+
+    def __init__( self, total, show = True ):
+        self.total = total
+        self.show = show
+        self.done = 0
+        self.start = time.time()
+        self.last = self.start
+        self.shown = False
+
+    def rate( self ):
+        return self.done / max( time.time() - self.start, 1e-6 )
+
+    def __call__( self, done ):
+        self.done = done
+        now = time.time()
+        if( not self.show or now - self.last < progress_interval.fvalue ):
+            return
+        self.last = now
+        dsz,dsuf = vdb.util.num_suffix( done )
+        rsz,rsuf = vdb.util.num_suffix( self.rate() )
+        print(f"\rhexdump: {dsz:.1f}{dsuf}B ({done*100//max(self.total,1)}%) {rsz:.1f}{rsuf}B/s ",end="",flush=True)
+        self.shown = True
+
+    def summary( self ):
+        dsz,dsuf = vdb.util.num_suffix( self.done )
+        rsz,rsuf = vdb.util.num_suffix( self.rate() )
+        return f"{dsz:.1f}{dsuf}B in {time.time()-self.start:.3f}s ({rsz:.1f}{rsuf}B/s)"
+
+def stream_hexdump( fname, addr, xlen = -1, **kwargs ):
+    """
+    Writes the hexdump to the file or, without one, through vdb-hexdump-pager. Rows are only rendered when the output
+    takes them, so the memory needed is the same for any size.
+    """
+    if( xlen == -1):
+        xlen = default_sizes.get(addr,default_len.value)
+    if( fname is not None ):
+        progress = dump_progress( xlen )
+        with open(fname,"w",encoding="utf-8") as f:
+            for line in hexdump_lines( addr, xlen, progress = progress, **kwargs ):
+                if( not file_colors.value ):
+                    line = vdb.color.strip(line)
+                f.write(line)
+                f.write("\n")
+        if( progress.shown ):
+            print()
+        print(f"Wrote hexdump of {progress.summary()} to {fname}")
+        return
+
+    # The pager owns the terminal, no progress until it is done
+    progress = dump_progress( xlen, show = False )
+    proc = subprocess.Popen( shlex.split(pager.value), stdin = subprocess.PIPE, encoding = "utf-8" )
+    try:
+        # Writing blocks while the pager has enough, so we never render far ahead of what is being looked at
+        for line in hexdump_lines( addr, xlen, progress = progress, **kwargs ):
+            proc.stdin.write(line)
+            proc.stdin.write("\n")
+    except BrokenPipeError: # quit the pager early
+        pass
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        proc.wait()
+    print(f"Dumped {progress.summary()}")
 
 def annotate_range( addr, length, name ):
     annotation_tree[addr:addr+length] = name
@@ -372,11 +580,25 @@ def call_hexdump( argv, flags ):
     sparse,flags = vdb.util.extract_flag(flags,"s",sparse)
     values,flags = vdb.util.extract_flag(flags,"v",values)
     align,flags = vdb.util.extract_flag(flags,"a",align)
+    diff,flags = vdb.util.extract_flag(flags,"d",False)
+    tofile,flags = vdb.util.extract_flag(flags,"f",False)
+    paged,flags = vdb.util.extract_flag(flags,"l",False)
 
     if( len(flags) > 0 ):
         print(f"Unknown flags {flags}")
         return
 
+    fname = None
+    if( tofile ):
+        fname = argv[0]
+        argv = argv[1:]
+
+    def dump( daddr, dlen ):
+        if( fname is None and not paged ):
+            hexdump(daddr,dlen,pointers=pointers,chaindepth=chainlen,values=values,align=align,uncached=uncached,sparse=sparse,diff=diff)
+        else:
+            stream_hexdump(fname,daddr,dlen,pointers=pointers,chaindepth=chainlen,values=values,align=align,uncached=uncached,sparse=sparse,diff=diff)
+
     # XXX Generally we want suport in the command parser to get any two addresses or lengths plus evaluation of the
     # arguments. Then use that facility everywhere.
     # addr,addr support (no spaces please)
@@ -406,7 +628,7 @@ def call_hexdump( argv, flags ):
                 section = vdb.memory.mmap.find_section( argv[0] )
                 if( section is None ):
                     raise RuntimeError(f"Now idea what {argv[0]} is")
-                hexdump(section.start,section.size,pointers=pointers,chaindepth=chainlen,values=values,align=align,uncached=uncached, sparse = sparse)
+                dump(section.start,section.size)
                 return None
                 pass
 #            print(f"{obj=}")
@@ -436,7 +658,7 @@ def call_hexdump( argv, flags ):
                 olen = dtype.sizeof
 #            print(f"{olen=}")
 
-            hexdump(oaddr,olen,pointers=pointers,chaindepth=chainlen,values=values,align=align,uncached=uncached,sparse=sparse)
+            dump(oaddr,olen)
         elif( len(argv) == 2 ):
             try:
                 addr = vdb.util.gint(f"(void*){argv[0]}")
@@ -446,7 +668,7 @@ def call_hexdump( argv, flags ):
                     raise RuntimeError(f"Now idea what {argv[0]} is")
                 addr = section.start
             xlen = vdb.util.gint(str(argv[1]))
-            hexdump(addr,xlen,pointers=pointers,chaindepth=chainlen,values=values,align=align,uncached=uncached,sparse=sparse)
+            dump(addr,xlen)
         else:
             print(cmd_hexdump.__doc__)
     return
@@ -467,6 +689,9 @@ hexdump/v                                   - In case of annotated known variabl
 hexdump/a                                   - Output addresses 16 byte aligned
 hexdump/u                                   - Do not cache any memory reads
 hexdump/s                                   - Sparse mode, try to read over access errors and display as much as you can
+hexdump/d                                   - Highlight the bytes that changed since the last memory snapshot (see snapshot)
+hexdump/f <file> ...                        - Write the hexdump to the file instead, for ranges of any size
+hexdump/l                                   - Show the hexdump through vdb-hexdump-pager
 
 hexdump annotate <varname>                  - annotates the variable <varname> according to the type information known to gdb
 hexdump annotate <addres> <type>            - annotates the given address like a variable of type <type>
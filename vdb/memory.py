@@ -5,11 +5,20 @@ import vdb.config
 import vdb.color
 import vdb.util
 import vdb.arch
+import vdb.cache
+import vdb.event
+import vdb.elf
 import vdb
 
 import gdb
 import intervaltree
 import struct
+import collections
+import bisect
+import heapq
+import hashlib
+import datetime
+import os
 
 import traceback
 import colors
@@ -56,6 +65,27 @@ test_write = vdb.config.parameter("vdb-memory-test-write-access", True )
 default_colorspec = vdb.config.parameter("vdb-memory-default-colorspec","smAa")
 null_range = vdb.config.parameter("vdb-memory-null-range",4096)
 
+def flush_cache_param( _ ):
+    memory_cache.flush()
+
+cache_enabled   = vdb.config.parameter("vdb-memory-cache", True, on_set = flush_cache_param )
+cache_page_size = vdb.config.parameter("vdb-memory-cache-page-size", 4096, on_set = flush_cache_param )
+cache_size      = vdb.config.parameter("vdb-memory-cache-size", 16*1024*1024 )
+
+def set_user_policy( _ ):
+    parse_user_policy()
+
+user_policy     = vdb.config.parameter("vdb-memory-cache-policy", "", on_set = set_user_policy )
+proc_fastpath   = vdb.config.parameter("vdb-memory-proc-fastpath", True )
+hole_granularity = vdb.config.parameter("vdb-memory-hole-granularity", 1 )
+overlay_file    = vdb.config.parameter("vdb-memory-overlay-file", "overlay_memory" )
+elf_symbols     = vdb.config.parameter("vdb-memory-elf-symbols", True )
+max_snapshots   = vdb.config.parameter("vdb-memory-snapshots", 8 )
+max_diff_lines  = vdb.config.parameter("vdb-memory-snapshot-diff-lines", 200 )
+search_chunk    = vdb.config.parameter("vdb-memory-search-chunk-size", 4*1024*1024 )
+search_overlap  = vdb.config.parameter("vdb-memory-search-regex-overlap", 4096 )
+search_max      = vdb.config.parameter("vdb-memory-search-max-results", 1000 )
+
 
 class access_type(Enum):
     ACCESS_RO = auto()
@@ -248,6 +278,17 @@ def section_color( sec ):
     co=color_configs.get(sec,None)
     return co
 
+def param_color( param ):
+    """
+    The colour a parameter is set to, None for an unset one
+    """
+    if( param is None ):
+        return None
+    ret = param.value
+    if( ret is None or len(ret) == 0 ):
+        return None
+    return ret
+
 valid_colorspec="Aams"
 
 def check_colorspec( colorspec ):
@@ -257,7 +298,7 @@ def check_colorspec( colorspec ):
                 raise RuntimeError("'%s' is not allowed in colorspecs" % c )
 
 
-def print_legend( colorspec = "Aasm" ):
+def legend_lines( colorspec = "Aasm" ):
     if( colorspec is None ):
         colorspec = default_colorspec.value
     legends = []
@@ -287,14 +328,20 @@ def print_legend( colorspec = "Aasm" ):
             if( co is not None and len(co) > 0 ):
                 legends.append( vdb.color.color(f"[{cs}]",co) )
 
+    ret = []
     s=""
     for l in legends:
         if( colors.ansilen(s) > 120 ):
-            print(s)
+            ret.append(s)
             s=""
         s += " "
         s += l
-    print(s)
+    ret.append(s)
+    return ret
+
+def print_legend( colorspec = "Aasm" ):
+    for l in legend_lines( colorspec ):
+        print(l)
 
 default_region_prefixes = [
         ( ".bss" , memory_type.BSS ),
@@ -306,121 +353,159 @@ default_region_prefixes = [
         ( ".fini", memory_type.CODE ),
 ]
 
-overlay_memory = intervaltree.IntervalTree()
+# Memory overlays replace what is read from the inferior, either with other data or by marking it unreadable. They are
+# kept in the order they were added (later ones win) and flattened into disjoint segments for applying them.
+overlays = [] # ( start, end, bytes or None )
 
-class MemoryLayer:
-    def __init__( self, data ):
-        # XXX At this point convert to something compatible if necessary
-        self.data = data
-
-    def __len__( self ):
-        return len(self.data)
-
-    def __getitem__( self, key ):
-        return self.data[key]
+class overlay_segment:
+    def __init__( self, start, end ):
+        self.start = start
+        self.end = end
+        self.data = bytearray(end-start)
+        self.kind = bytearray(end-start) # 0 no overlay, 1 data, 2 unreadable
+        self.runs = [] # ( start, end, kind ) of the parts that are overlayed
 
-class MemoryStack:
-    def __init__( self ):
-        self.layers = []
+overlay_cache = None # ( starts, segments ), None when it needs to be rebuilt
+overlays_loaded = False
 
-    def __getitem__( self, key ):
-#        print(f"{type(key)=}")
-#        print(f"Stack read {key}")
-        if( isinstance(key,slice) ):
-            start,stop,step = key.indices(len(self))
-            ret = []
-            contains_empty_bytes = False
-            for i in range(start,stop,step):
-                if( self[i] == ... ):
-                    contains_empty_bytes = True
-                ret.append( self[i] )
-            if( contains_empty_bytes ):
-                return MemoryLayer( ret )
-            else:
-                ret=b"".join(ret)
-                return memoryview(ret).cast("c")
-        for l in self.layers:
-            ret = l[key]
-            if( ret is not None ):
-#                vdb.util.inspect(ret)
-                if( isinstance(ret,int) ):
-#                    xx = ret.to_bytes(1)
-                    return ret.to_bytes(1)
-                else:
-                    return ret
+run_re = re.compile(rb"\x00+|\x01+|\x02+")
 
-    def __len__( self ):
-        if( len(self.layers) == 0 ):
-            return 0
-        return len(self.layers[0])
-
-    def cast( self, castto ):
-        numbytes = struct.calcsize(castto)
-#        print(f"{numbytes=}")
-#        print(f"{castto=}")
-#        print(f"{len(self)=}")
-
-
-    def add_layer( self, new_layer ):
-        if( not isinstance(new_layer,MemoryLayer) ):
-            new_layer = MemoryLayer( new_layer )
-        if( len(self.layers) > 0 ):
-            if( len(self.layers[0]) != len(new_layer) ):
-                raise RuntimeError(f"All memory layers must have the same size (existing: {len(self.layers[0])}, new: {len(new_layer)})")
-        self.layers.append( new_layer )
-
-
-def overlay_read( addr, num ):
-#    print(f"overlay_read( {addr:#0x}, {num} )")
-    # lazy loading, we might want to make this filename configureable
-    if( len(overlay_memory) == 0 ):
+def overlay_segments( ):
+    global overlay_cache
+    global overlays_loaded
+    # lazy loading, only once
+    if( not overlays_loaded ):
+        overlays_loaded = True
         try:
-            with open("overlay_memoryory","rb") as f:
-                overlay_memory.update( pickle.load(f) )
+            load_overlays( overlay_file.value )
         except FileNotFoundError:
             pass
-
-    lower = int(addr)
-    upper = addr + int(num)
-
-    intervals = overlay_memory[lower:upper]
-
-    if( len(intervals) == 0 ):
-        return None
-
-    ret = [ None ] * num
-
-    # XXX Not sure if flattening it always is a good idea, or of building a stack is faster. Maybe we can also keep a
-    # cache of flattened ones that gets invalidated on adding overlays?
-    for i in range(lower,upper):
-        index = i - int(addr)
-        om = overlay_memory[i]
-        if( len(om) == 0 ):
+        except (OSError,ValueError,struct.error) as e:
+            print(f"Failed to load memory overlays from {overlay_file.value}: {e}")
+    if( overlay_cache is not None ):
+        return overlay_cache
+
+    segments = []
+    order = sorted( range(len(overlays)), key = lambda i : overlays[i][0] )
+    cluster = []
+    cend = None
+    for i in order + [ None ]:
+        if( i is not None and cend is not None and overlays[i][0] <= cend ):
+            cluster.append(i)
+            cend = max(cend,overlays[i][1])
             continue
-        omd = next(iter(om))
-        if( omd.data is None ):
-            ret[index] = ...
-        else:
-            ret[index] = 42
-#        print(f"{index=}")
-#        print(f"{omd.begin=:#0x}")
-#        print(f"{omd.end=:#0x}")
-#        print(f"{omd.data}")
-#        print(f"{i=:#0x}")
-#        print(f"{omd=}")
-
-    return ret
+        if( len(cluster) > 0 ):
+            seg = overlay_segment( overlays[cluster[0]][0], cend )
+            for ci in sorted(cluster):
+                ostart,oend,odata = overlays[ci]
+                if( odata is None ):
+                    seg.kind[ostart-seg.start:oend-seg.start] = b"\x02" * ( oend - ostart )
+                else:
+                    seg.data[ostart-seg.start:oend-seg.start] = odata
+                    seg.kind[ostart-seg.start:oend-seg.start] = b"\x01" * ( oend - ostart )
+            for m in run_re.finditer(seg.kind):
+                if( seg.kind[m.start()] != 0 ):
+                    seg.runs.append( ( seg.start + m.start(), seg.start + m.end(), seg.kind[m.start()] ) )
+            segments.append(seg)
+        if( i is not None ):
+            cluster = [ i ]
+            cend = overlays[i][1]
+    overlay_cache = ( [ seg.start for seg in segments ], segments )
+    return overlay_cache
 
 def add_overlay( addr, data, length = None ):
     # If we want to set something to unreadable, use data None and give a length
     if( length is None ):
         length = len(data)
+    if( data is not None ):
+        data = bytes(data[:length])
 
     lower = int(addr)
     upper = lower + length
     # 1:3 is data at addr 1 and 2, not 3
-    overlay_memory[lower:upper] = data
+    overlays.append( ( lower, upper, data ) )
+    global overlay_cache
+    overlay_cache = None
+    # Those have the overlays already applied
+    memory_cache.fallback = {}
+
+def clear_overlays( ):
+    global overlay_cache
+    overlays.clear()
+    overlay_cache = None
+    memory_cache.fallback = {}
+
+# The overlay file is a header followed by records of start, length and kind. Kind 1 is followed by the data, kind 2 is
+# unreadable memory.
+overlay_magic = b"VDBOVL\x01\x00"
+overlay_record = struct.Struct("<QQB")
+
+def save_overlays( fname ):
+    with open(fname,"wb") as f:
+        f.write(overlay_magic)
+        for start,end,data in overlays:
+            if( data is None ):
+                f.write( overlay_record.pack( start, end-start, 2 ) )
+            else:
+                f.write( overlay_record.pack( start, end-start, 1 ) )
+                f.write( data )
+
+def load_overlays( fname ):
+    with open(fname,"rb") as f:
+        raw = f.read()
+    if( raw[:len(overlay_magic)] != overlay_magic ):
+        raise ValueError("Not a vdb memory overlay file")
+    pos = len(overlay_magic)
+    while( pos < len(raw) ):
+        start,length,kind = overlay_record.unpack_from( raw, pos )
+        pos += overlay_record.size
+        if( kind == 1 ):
+            add_overlay( start, raw[pos:pos+length] )
+            pos += length
+        else:
+            add_overlay( start, None, length )
 
+def apply_overlay( addr, count, result ):
+    """
+    Puts the overlays onto the read result, which can also be a sparse_buffer. Returns the result unchanged when there
+    are no overlays for the range.
+    """
+    if( len(overlays) == 0 and overlays_loaded ):
+        return result
+    starts,segments = overlay_segments()
+    if( len(starts) == 0 ):
+        return result
+    end = addr + count
+    idx = max( bisect.bisect_right( starts, addr ) - 1, 0 )
+    hits = []
+    while( idx < len(segments) and segments[idx].start < end ):
+        if( segments[idx].end > addr ):
+            hits.append(segments[idx])
+        idx += 1
+    if( len(hits) == 0 ):
+        return result
+
+    if( isinstance(result,sparse_buffer) ):
+        data = bytearray(result.data)
+        mask = bytearray(result.mask)
+    else:
+        data = bytearray(result.tobytes())
+        mask = bytearray(b"\x01") * count
+    for seg in hits:
+        for rstart,rend,kind in seg.runs:
+            rstart = max(rstart,addr)
+            rend = min(rend,end)
+            if( rstart >= rend ):
+                continue
+            if( kind == 1 ):
+                data[rstart-addr:rend-addr] = seg.data[rstart-seg.start:rend-seg.start]
+                mask[rstart-addr:rend-addr] = b"\x01" * ( rend - rstart )
+            else:
+                data[rstart-addr:rend-addr] = bytes( rend - rstart )
+                mask[rstart-addr:rend-addr] = bytes( rend - rstart )
+    if( mask.count(0) == 0 ):
+        return memoryview(bytes(data)).cast("c")
+    return sparse_buffer( data, mask )
 
 def read_var( ptr, ctype ):
     ret = gdb.parse_and_eval( f"*(({ctype})({ptr}))" )
@@ -433,16 +518,572 @@ def read_u( uncached, ptr, count = 1, partial = False, sparse = False ):
         return read( ptr, count, partial, sparse = sparse)
 
 
-# XXX Do that caching manually and have a "volatile blacklist" feature that we mainly will use for peripherals
-@vdb.util.memoize( [gdb.events.stop, gdb.events.memory_changed, gdb.events.inferior_call,gdb.events.new_objfile,gdb.events.new_inferior] )
+class cache_policy(Enum):
+    CACHED   = auto() # never changes on its own (code, flash, rodata), kept across stops
+    STOP     = auto() # normal RAM, read once per stop
+    UNCACHED = auto() # peripherals and the like, every read goes to the target
+
+# The more restrictive policy wins when ranges overlap
+policy_order = [ cache_policy.CACHED, cache_policy.STOP, cache_policy.UNCACHED ]
+
+policy_names = {
+        "cached"   : cache_policy.CACHED,
+        "stop"     : cache_policy.STOP,
+        "uncached" : cache_policy.UNCACHED,
+        }
+
+# [start:end] => ( policy, origin ), anything not in here is cache_policy.STOP
+policy_ranges = intervaltree.IntervalTree()
+
+def set_policy( origin, ranges, policy ):
+    """
+    Replaces all ranges that came from origin (e.g. "svd") with the list of ( start, end ) ranges
+    """
+    for iv in [ iv for iv in policy_ranges if iv.data[1] == origin ]:
+        policy_ranges.remove(iv)
+    for start,end in ranges:
+        if( end > start ):
+            policy_ranges[start:end] = ( policy, origin )
+    memory_cache.flush("policy change")
+
+def get_policy( addr, count = 1 ):
+    """
+    The policy for the whole range, the most restrictive one of all that overlap it
+    """
+    if( len(policy_ranges) == 0 ):
+        return cache_policy.STOP
+    ivs = policy_ranges[addr:addr+max(count,1)]
+    if( len(ivs) == 0 ):
+        return cache_policy.STOP
+    ret = None
+    covered = 0
+    for iv in ivs:
+        pol = iv.data[0]
+        if( ret is None or policy_order.index(pol) > policy_order.index(ret) ):
+            ret = pol
+        covered += min(iv.end,addr+count) - max(iv.begin,addr)
+    # Only partly covered by cached ranges, the rest is normal memory
+    if( ret == cache_policy.CACHED and covered < count ):
+        ret = cache_policy.STOP
+    return ret
+
+# vdb-memory-cache-policy is a comma separated list of <start>-<end>=<policy>
+def parse_user_policy( ):
+    ranges = {}
+    for entry in user_policy.value.split(","):
+        entry = entry.strip()
+        if( len(entry) == 0 ):
+            continue
+        try:
+            rng,pol = entry.split("=")
+            start,end = rng.split("-")
+            ranges.setdefault( policy_names[pol.strip()], [] ).append( ( int(start,0), int(end,0) ) )
+        except (ValueError,KeyError):
+            print(f"Ignoring invalid memory cache policy '{entry}', expected <start>-<end>=cached|stop|uncached")
+    for pol in policy_order:
+        set_policy( f"user-{pol.name}", ranges.get(pol,[]), pol )
+
+def normalize_address( ptr ):
+    if( isinstance(ptr,str) ):
+        addr=vdb.util.gint(ptr)
+    else:
+        addr=ptr
+    # Get the adderss into range of 2**<ptrsizeinbits>
+    while( addr < 0 ):
+        addr += 2** vdb.arch.pointer_size
+    addr=int(addr)
+    addr &= ( 2 ** vdb.arch.pointer_size - 1 )
+    return addr
+
+class proc_memory:
+    """
+    Reads the memory of a local native inferior directly from /proc/<pid>/mem. The mapped ranges from /proc/<pid>/maps
+    tell which reads can be done here, the rest (unmapped or not readable, which gdb can still force) is left to gdb.
+    """
+
+    def __init__( self ):
+        self.pid = None
+        self.fd = None
+        self.checked = False
+        self.starts = None
+        self.ends = None
+        self.readable_starts = None
+        self.readable_ends = None
+        self.breakpoints = None
+        self.buffer = bytearray(64*1024)
+
+    def close( self ):
+        if( self.fd is not None ):
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+        self.fd = None
+        self.pid = None
+
+    def reset( self ):
+        """
+        Whether it is usable and the mappings can change with every stop
+        """
+        self.checked = False
+        self.starts = None
+        self.ends = None
+        self.readable_starts = None
+        self.readable_ends = None
+        self.breakpoints = None
+
+    def target_pid( self ):
+        if( self.checked ):
+            return self.pid
+        self.checked = True
+        pid = None
+        try:
+            inf = gdb.selected_inferior()
+            # Replaying a recording or a core file have their own idea of the memory contents
+            if( inf.pid > 0 and inf.connection.type == "native" and gdb.current_recording() is None ):
+                pid = inf.pid
+        except (AttributeError,gdb.error,RuntimeError):
+            pass
+        if( pid != self.pid ):
+            self.close()
+            if( pid is not None ):
+                try:
+                    self.fd = os.open( f"/proc/{pid}/mem", os.O_RDONLY )
+                    self.pid = pid
+                except OSError as e:
+                    vdb.log(f"Not using /proc/{pid}/mem: {e}",level=4)
+        return self.pid
+
+    @staticmethod
+    def add_range( starts, ends, start, end ):
+        # merge adjacent ones so a range check is just one lookup
+        if( len(ends) > 0 and ends[-1] == start ):
+            ends[-1] = end
+        else:
+            starts.append(start)
+            ends.append(end)
+
+    def load_maps( self ):
+        self.starts = []
+        self.ends = []
+        self.readable_starts = []
+        self.readable_ends = []
+        with open(f"/proc/{self.pid}/maps") as f:
+            for line in f:
+                rng,perms,_ = line.split(None,2)
+                start,end = rng.split("-")
+                start = int(start,16)
+                end = int(end,16)
+                self.add_range( self.starts, self.ends, start, end )
+                if( perms[0] == "r" ):
+                    self.add_range( self.readable_starts, self.readable_ends, start, end )
+
+    def readable( self, addr, count ):
+        if( self.starts is None ):
+            self.load_maps()
+        idx = bisect.bisect_right( self.readable_starts, addr ) - 1
+        return ( idx >= 0 and addr + count <= self.readable_ends[idx] )
+
+    def runs( self, start, end ):
+        if( self.starts is None ):
+            self.load_maps()
+        ret = []
+        idx = max( bisect.bisect_right( self.starts, start ) - 1, 0 )
+        while( idx < len(self.starts) and self.starts[idx] < end ):
+            rstart = max( self.starts[idx], start )
+            rend = min( self.ends[idx], end )
+            if( rstart < rend ):
+                ret.append( ( rstart, rend ) )
+            idx += 1
+        return ret
+
+    def breakpoint_addresses( self ):
+        if( self.breakpoints is None ):
+            self.breakpoints = []
+            try:
+                for bp in gdb.breakpoints():
+                    if( bp.type != gdb.BP_BREAKPOINT or not bp.enabled ):
+                        continue
+                    for loc in bp.locations:
+                        if( loc.enabled and loc.address is not None ):
+                            self.breakpoints.append( int(loc.address) )
+            except AttributeError: # no locations before gdb 13, we can't tell
+                self.breakpoints = None
+                return None
+            self.breakpoints.sort()
+        return self.breakpoints
+
+    def read( self, addr, count ):
+        """
+        The memory or None if gdb should be asked instead
+        """
+        if( self.target_pid() is None ):
+            return None
+        # Inserted breakpoints would show up in the data, gdb knows what was there originally
+        bps = self.breakpoint_addresses()
+        if( bps is None ):
+            return None
+        try:
+            # gdb can read mappings without read permission (FOLL_FORCE) and has the proper error for the rest
+            if( not self.readable( addr, count ) ):
+                return None
+            if( len(self.buffer) < count ):
+                self.buffer = bytearray(count)
+            mv = memoryview(self.buffer)
+            done = 0
+            while( done < count ):
+                n = os.preadv( self.fd, [ mv[done:count] ], addr + done )
+                if( n <= 0 ):
+                    return None
+                done += n
+            ret = bytearray(mv[:count])
+        except (OSError,OverflowError) as e: # offsets are signed, from 2**63 on gdb has to do it
+            vdb.log(f"Reading /proc/{self.pid}/mem at {addr:#0x} failed: {e}",level=5)
+            return None
+        idx = bisect.bisect_left( bps, addr - 4 )
+        while( idx < len(bps) and bps[idx] < addr + count ):
+            bp = bps[idx]
+            b0 = max(bp,addr)
+            b1 = min(bp+4,addr+count)
+            try:
+                ret[b0-addr:b1-addr] = gdb.selected_inferior().read_memory(b0, b1-b0).tobytes()
+            except gdb.error:
+                pass
+            idx += 1
+        return memoryview(ret).cast("c")
+
+proc_mem = proc_memory()
+
+@vdb.event.stop()
+@vdb.event.inferior_call()
+@vdb.event.new_inferior()
+@vdb.event.breakpoint_created()
+@vdb.event.breakpoint_modified()
+@vdb.event.breakpoint_deleted()
+def reset_proc_memory( _ev ):
+    proc_mem.reset()
+
+@vdb.event.exited()
+def close_proc_memory( _ev ):
+    proc_mem.reset()
+    proc_mem.close()
+
+# Reads straight from the inferior, everything else is built on top of this. Raises gdb.error if not all can be read
+def raw_read( addr, count ):
+    if( proc_fastpath.value ):
+        ret = proc_mem.read( addr, count )
+        if( ret is not None ):
+            return ret
+    return gdb.selected_inferior().read_memory(addr, count)
+
+class page_cache:
+    """
+    Caches the inferior memory in pages, any range is served from the pages it touches. Pages are fetched in as few
+    reads as possible and evicted least recently used first once there are more than vdb-memory-cache-size bytes.
+    """
+
+    def __init__( self ):
+        self.pages = collections.OrderedDict() # page number => bytes or None when it can't be read as a whole
+        self.constant = set() # pages that are kept across stops
+        self.page_size = None
+        self.stats = vdb.cache.cache_entry()
+        self.stats.cache = self.pages
+        self.fallback = {} # results of reads that could not be served from whole pages
+
+    def flush( self, _ev = None ):
+        if( len(self.pages) or len(self.fallback) ):
+            vdb.log(f"Flushing memory cache due to {_ev}",level=5)
+        self.pages.clear()
+        self.constant.clear()
+        self.fallback = {}
+        self.page_size = cache_page_size.value
+
+    def stop_flush( self, _ev = None ):
+        """
+        Drops everything except the pages of ranges with cache_policy.CACHED
+        """
+        if( len(self.constant) == 0 ):
+            return self.flush(_ev)
+        vdb.log(f"Flushing non constant memory cache pages due to {_ev}",level=5)
+        for pg in [ p for p in self.pages if p not in self.constant ]:
+            del self.pages[pg]
+        self.fallback = {}
+
+    def invalidate( self, addr, length ):
+        if( self.page_size is None ):
+            return
+        first = addr // self.page_size
+        last = ( addr + max(length,1) - 1 ) // self.page_size
+        if( last - first < len(self.pages) ):
+            for pg in range(first,last+1):
+                self.pages.pop(pg,None)
+                self.constant.discard(pg)
+        else:
+            for pg in [ p for p in self.pages if first <= p <= last ]:
+                del self.pages[pg]
+                self.constant.discard(pg)
+        # These can't be easily related to the pages, but are rarely used anyways
+        self.fallback = {}
+
+    def fetch( self, first, last ):
+        """
+        Reads all missing pages in the range, consecutive ones in one go
+        """
+        ps = self.page_size
+        pg = first
+        while( pg <= last ):
+            if( pg in self.pages ):
+                pg += 1
+                continue
+            run = pg
+            while( run <= last and run not in self.pages ):
+                run += 1
+            self.stats.misses += run - pg
+            self.fetch_run( pg, run )
+            pg = run
+
+        maxpages = max( cache_size.value // ps, last - first + 1 )
+        while( len(self.pages) > maxpages ):
+            pg,_ = self.pages.popitem(last=False)
+            self.constant.discard(pg)
+
+    def fetch_run( self, first, end ):
+        ps = self.page_size
+        try:
+            data = raw_read( first * ps, ( end - first ) * ps ).tobytes()
+            for i in range(first,end):
+                self.pages[i] = data[(i-first)*ps:(i-first+1)*ps]
+        except gdb.error:
+            if( end - first == 1 ):
+                self.pages[first] = None
+                return
+            # Some page in between is not readable, find out which
+            mid = ( first + end ) // 2
+            self.fetch_run( first, mid )
+            self.fetch_run( mid, end )
+
+    def get( self, addr, count ):
+        """
+        The bytes in the range or None if not all of it is in pages that can be read as a whole
+        """
+        if( self.page_size is None or self.page_size != cache_page_size.value ):
+            self.flush()
+        ps = self.page_size
+        if( count <= 0 or addr + count > 2 ** vdb.arch.pointer_size ):
+            return None
+        first = addr // ps
+        last = ( addr + count - 1 ) // ps
+        # Whole pages are read, so they must not touch anything that may not be read more often than asked for
+        policy = get_policy( first * ps, ( last + 1 - first ) * ps )
+        if( policy == cache_policy.UNCACHED ):
+            return None
+        self.fetch( first, last )
+        if( policy == cache_policy.CACHED ):
+            self.constant.update( range(first,last+1) )
+        chunks = []
+        for pg in range(first,last+1):
+            data = self.pages.get(pg,None)
+            if( data is None ):
+                return None
+            self.pages.move_to_end(pg)
+            chunks.append(data)
+        self.stats.hits += 1
+        off = addr - first * ps
+        if( len(chunks) == 1 ):
+            return chunks[0][off:off+count]
+        return b"".join(chunks)[off:off+count]
+
+memory_cache = page_cache()
+vdb.cache.register( "memory_cache", memory_cache.stats )
+
+@vdb.event.stop()
+@vdb.event.inferior_call()
+def stop_flush_memory_cache( ev ):
+    memory_cache.stop_flush( ev )
+
+@vdb.event.new_objfile()
+@vdb.event.new_inferior()
+def flush_memory_cache( ev ):
+    memory_cache.flush( ev )
+
+@vdb.event.memory_changed()
+def memory_changed( ev ):
+    memory_cache.invalidate( int(ev.address), int(ev.length) )
+
 def read( ptr, count = 1, partial = False, spec = None, sparse = False ):
-    ret = read_uncached(ptr,count,partial,sparse)
+    """
+    Like read_uncached, but served from the memory cache where possible.
+    """
+    ret = None
+    if( cache_enabled.value ):
+        addr = normalize_address(ptr)
+        data = memory_cache.get( addr, count )
+        if( data is not None ):
+            ret = apply_overlay( addr, count, memoryview(data).cast("c") )
+        elif( get_policy( addr, count ) == cache_policy.UNCACHED ):
+            ret = read_uncached(addr,count,partial,sparse)
+        else:
+            # Ranges not fully readable, those need the probing of read_uncached
+            key = ( addr, count, partial, sparse )
+            ret = memory_cache.fallback.get(key,memory_cache)
+            if( ret is memory_cache ):
+                ret = read_uncached(addr,count,partial,sparse)
+                memory_cache.fallback[key] = ret
+    else:
+        ret = read_uncached(ptr,count,partial,sparse)
     if( spec is not None ):
         ret = struct.unpack( spec, ret )[0]
     return ret
 
-# XXX Feature idea: dont use memoryview but our own thing (might be interval tree based) that supports "inaccessible"
-# for a byte, so that at least hexdump and maybe others can display that
+class sparse_buffer:
+    """
+    Memory of which not all bytes could be read. Indexing gives the byte, or ... for those that could not be read.
+    """
+
+    def __init__( self, data, mask ):
+        self.data = data # bytearray, 0 where unreadable
+        self.mask = mask # bytearray, 1 for every readable byte
+
+    def __len__( self ):
+        return len(self.data)
+
+    def __getitem__( self, key ):
+        if( isinstance(key,slice) ):
+            return sparse_buffer( self.data[key], self.mask[key] )
+        if( self.mask[key] ):
+            return self.data[key].to_bytes(1,"little")
+        return ...
+
+    def __iter__( self ):
+        for i in range(len(self.data)):
+            yield self[i]
+
+    # For int.from_bytes() and the like, the unreadable bytes are 0
+    def __bytes__( self ):
+        return bytes(self.data)
+
+    def tobytes( self ):
+        return bytes(self.data)
+
+    def all_valid( self ):
+        return self.mask.count(0) == 0
+
+    def runs( self ):
+        """
+        Yields ( start, end, valid ) for all ranges of only readable or only unreadable bytes
+        """
+        pos = 0
+        while( pos < len(self.mask) ):
+            valid = self.mask[pos]
+            if( valid ):
+                end = self.mask.find( 0, pos )
+            else:
+                end = self.mask.find( 1, pos )
+            if( end < 0 ):
+                end = len(self.mask)
+            yield ( pos, end, bool(valid) )
+            pos = end
+
+def subtract_ranges( start, end, holes ):
+    ret = []
+    pos = start
+    for hs,he in sorted(holes):
+        if( hs > pos ):
+            ret.append( ( pos, min(hs,end) ) )
+        pos = max(pos,he)
+        if( pos >= end ):
+            break
+    if( pos < end ):
+        ret.append( ( pos, end ) )
+    return ret
+
+def readable_runs( addr, count ):
+    """
+    Splits the range into the ( start, end ) runs that might be readable, leaving out all that is known not to be. For
+    local processes the mappings are exact, otherwise we know what the memory map knows, the rest has to be tried.
+    """
+    end = addr + count
+    if( proc_fastpath.value and proc_mem.target_pid() is not None ):
+        try:
+            return proc_mem.runs( addr, end )
+        except OSError:
+            pass
+    holes = []
+    # Don't parse it from here, reads happen all the time
+    for iv in mmap.regions[addr:end]:
+        r = iv.data
+        if( r.atype in ( access_type.ACCESS_INACCESSIBLE, access_type.ACCESS_INV ) ):
+            holes.append( ( max(r.start,addr), min(r.end,end) ) )
+    return subtract_ranges( addr, end, holes )
+
+def split_point( start, end ):
+    """
+    Where to halve a range that could not be read, None when it can't be split any further. Each edge of a hole is found
+    in a logarithmic number of reads, but every piece of the hole itself is tried on its own. Embedded targets change
+    readability at any byte, so by default we go down to single bytes. Local processes only do at page boundaries, there
+    we stop at pages.
+    """
+    gran = max( hole_granularity.value, 1 )
+    if( proc_fastpath.value and proc_mem.target_pid() is not None ):
+        gran = max( gran, os.sysconf("SC_PAGE_SIZE") )
+    mid = ( start + end ) // 2 // gran * gran
+    if( mid <= start ):
+        mid += gran
+    if( mid >= end ):
+        return None
+    return mid
+
+def read_prefix( start, end ):
+    """
+    As many bytes as can be read from start on, one read if all is readable, otherwise halving until the end is found
+    """
+    try:
+        return raw_read( start, end - start ).tobytes()
+    except gdb.error:
+        mid = split_point( start, end )
+        if( mid is None ):
+            return b""
+        first = read_prefix( start, mid )
+        if( len(first) < mid - start ):
+            return first
+        return first + read_prefix( mid, end )
+
+def read_into( start, end, base, data, mask ):
+    try:
+        data[start-base:end-base] = raw_read( start, end - start ).tobytes()
+        mask[start-base:end-base] = b"\x01" * ( end - start )
+    except gdb.error:
+        mid = split_point( start, end )
+        if( mid is None ):
+            return
+        read_into( start, mid, base, data, mask )
+        read_into( mid, end, base, data, mask )
+
+def read_partial( addr, count ):
+    ret = bytearray()
+    for start,end in readable_runs( addr, count ):
+        if( start != addr + len(ret) ):
+            break
+        got = read_prefix( start, end )
+        ret += got
+        if( len(got) < end - start ):
+            break
+    if( len(ret) == 0 ):
+        return None
+    return memoryview(bytes(ret)).cast("c")
+
+def read_sparse( addr, count ):
+    data = bytearray(count)
+    mask = bytearray(count)
+    for start,end in readable_runs( addr, count ):
+        read_into( start, end, addr, data, mask )
+    valid = count - mask.count(0)
+    if( valid == 0 ):
+        return None
+    if( valid == count ):
+        return memoryview(bytes(data)).cast("c")
+    return sparse_buffer( data, mask )
+
 def read_uncached( ptr, count = 1, partial = False, sparse = False ):
     """Reads some memory from the inferior
 
@@ -450,110 +1091,35 @@ def read_uncached( ptr, count = 1, partial = False, sparse = False ):
         ptr: The address to start reading from.
         count: Number of bytes to read.
         partial: If True, allow reading partial data if the memory is not fully accessible.
+        sparse: If True, read all that is accessible within the range
 
     Returns:
         A memoryview object containing the data read from memory. If partial is False and the memory is not fully
-        accessible, a gdb.error will be raised. If partial is True and the memory is not fully accessible all bytes
-        accessible from the pointer on will be returned.
+        accessible, None is returned. If partial is True and the memory is not fully accessible all bytes accessible
+        from the pointer on will be returned. If sparse is True a sparse_buffer of the whole range is returned, with
+        the bytes that could not be read marked as such.
 
         Memory overlays will be honoured.
     """
 #    print(f"read_uncached({ptr:#0x}, {count}, {partial}, {sparse})")
     result = None
-    if( isinstance(ptr,str) ):
-        addr=vdb.util.gint(ptr)
-    else:
-        addr=ptr
+    addr = normalize_address(ptr)
 
     try:
-        # Get the adderss into range of 2**<ptrsizeinbits>
-        while( addr < 0 ):
-            addr += 2** vdb.arch.pointer_size
-        addr=int(addr)
-#        if( addr.bit_length() > vdb.arch.pointer_size ):
-        addr &= ( 2 ** vdb.arch.pointer_size - 1 )
-
 #        print(f"gdb...read_memory({addr:#0x},{count})")
-        result = gdb.selected_inferior().read_memory(addr, count)
+        result = raw_read(addr, count)
     except gdb.error:
-#        vdb.print_exc()
 #        print(f"{partial=} {sparse=} {addr:#0x} {count}")
+        # Split it up along what we know of the memory layout and read each part in one go, only where that is not
+        # enough we look for the exact boundaries
         if( sparse ):
-            # We should read the whole range and then just overlay all the stuff on each other. The most efficient way
-            # is probably some binary search kind of thing
-            # The one byte requested was not there
-            if( count == 1 ):
-                return None
-            first_addr = addr
-            first_len = count // 2
-            second_addr = addr + first_len
-            second_len = count - first_len
-            first_part = read_uncached( first_addr, first_len, False, True )
-            second_part = read_uncached( second_addr, second_len, False, True )
-
-#            print(f"{first_part=}")
-#            print(f"{second_part=}")
-            # Now how do we combine them?
-            # Both None? whole block none
-            if( first_part is None and second_part is None ):
-                return None
-
-#            print(f"{isinstance(first_part,memoryview)=}")
-#            print(f"{isinstance(second_part,memoryview)=}")
-            # Both memory? concat them, if all is readable the end result will be a memoryview always
-            if( isinstance(first_part,memoryview) and isinstance(second_part,memoryview) ):
-                firstb = r0.tobytes()
-                secondb = second.tobytes()
-                allbytes = firstb+secondb
-                return memoryview(allbytes).cast("c")
-
-            ret = []
-            if( first_part is not None ):
-                ret += list(first_part)
-            else:
-                ret += [...] * first_len
-            if( second_part is not None ):
-                ret += list(second_part)
-            else:
-                ret += [...] * second_len
-            return ret
-
+            result = read_sparse( addr, count )
         elif( partial ):
-            if( count == 1 ):
-                return None
-            cnt0 = count // 2
-            cnt1 = count-cnt0
-            r0 = read_uncached( ptr, cnt0, partial=True, sparse = sparse )
-#            if( r0 is None ):
-#                print(f"{r0=}")
-#            else:
-#                print(f"{r0.tobytes()=}")
-            if( r0 is None ): # then not even a single byte could be read
-                return None
-            if( len(r0) >= cnt0 ):
-                r1 = read_uncached( ptr + cnt0, cnt1, partial=True, sparse = sparse )
-                if( r1 is not None ):
-                    r0b = r0.tobytes()
-                    r1b = r1.tobytes()
-                    allbytes = r0b+r1b
-#                    print(f"{type(allbytes)=}")
-                    return memoryview(allbytes).cast("c")
-                else:
-                    return r0
-            else:
-                return r0
+            result = read_partial( addr, count )
 
-    ovmem = overlay_read( addr, count )
-#    print(f"{result=}")
-#    print(f"{ovmem=}")
-    if( ovmem is None ):
-        ret = result
-    else:
-        ret = MemoryStack()
-        ret.add_layer( MemoryLayer(ovmem) )
-        ret.add_layer( MemoryLayer(result) )
-#    print(f"{ret=}")
-    return ret
+    if( result is None ):
+        return None
+    return apply_overlay( addr, len(result), result )
 
 def write( ptr, buf ):
     if( isinstance(ptr,str) ):
@@ -564,6 +1130,7 @@ def write( ptr, buf ):
         gdb.selected_inferior().write_memory( addr, buf )
     except gdb.error:
         pass
+    memory_cache.invalidate( addr, len(buf) )
 
 def memset( ptr, val, size ):
     if( isinstance(ptr,str) ):
@@ -582,6 +1149,7 @@ def memset( ptr, val, size ):
 #    print("ptr = '%s'" % (ptr,) )
 #    print("buf = '%s'" % (buf,) )
     gdb.selected_inferior().write_memory( ptr, buf )
+    memory_cache.invalidate( ptr, len(buf) )
 
 
 
@@ -613,8 +1181,19 @@ class memory_region:
             else:
                 self.atype = access_type.ACCESS_INACCESSIBLE
         self._test_prefixes()
+        self.snapshot()
         # TODO figure out how to find out executable, and also if executalbe is always RO
 
+    def snapshot( self ):
+        """
+        Remembers what the region is without the information of the mappings and threads, a parse starts from there
+        """
+        self.base_state = ( self.file, self.mtype, self.procline )
+
+    def restore( self ):
+        self.file, self.mtype, self.procline = self.base_state
+        self.threads = set()
+
     def is_unknown( self ):
         return self.start == 0 and self.end == 0 and self.section is None and self.file is None
 
@@ -702,6 +1281,20 @@ def thread_print( threads ):
         rlist.append( f"{thr.num} LWP {thr.ptid} '{thr.name}'" )
     return ",".join(rlist)
 
+# Sections that are never written to after being loaded
+constant_sections = { ".interp", ".hash", ".gnu.hash", ".dynsym", ".dynstr", ".gnu.version", ".gnu.version_r", ".rodata",
+                      ".eh_frame_hdr", ".eh_frame", ".gcc_except_table", ".ARM.exidx", ".ARM.extab" }
+
+def section_in( tree, start, end ):
+    for mm in tree[start:end]:
+        mm = mm[2]
+        if( mm.start == start and mm.end == end ):
+            return mm
+    return None
+
+# A section line of "info files", the file is missing for the executable
+info_files_re = re.compile("(0x[0-9a-fA-F]*) - (0x[0-9a-fA-F]*) is (.*?)(?: in (.*))?$")
+
 class memory_map:
 
     def __init__( self ):
@@ -709,6 +1302,21 @@ class memory_map:
         self.parsed_version = 0
         self.needed_version = 1
         self.unknown = memory_region(0,0,None,None)
+        # Goes up whenever the regions change, so users of them can tell cheaply if they need to do something
+        self.generation = 0
+        self.static_regions = None # the sections of all objfiles, None when they need to be read again
+        self.static_cache = {} # ( start, end, section, file ) => ( memory_region, objfile name )
+        self.static_pid = None
+        self.null_region = None
+        self.mappings = None # ( start, end, file, line ) of the mappings as of the last parse
+        self.mapping_text = None
+        self.mapping_cache = {} # mapping => memory_region
+        self.stack_key = None
+        self.seg_starts = [] # start of each segment, sorted
+        self.seg_regions = [] # the innermost region of each segment or None
+        self.seg_generation = None
+        self.region_colors = {} # memory_region => ( mcolor, acolor, scolor )
+        self.colors_generation = None
 
     def lazy_parse( self ):
         if( self.needed_version > self.parsed_version ):
@@ -717,54 +1325,91 @@ class memory_map:
 
     def section( self, start, end ):
         self.lazy_parse()
-#        mskey = memory_region(start,end,None,None)
-        mms = self.regions[start:end]
-#        mm = bisect.bisect_left( self.regions,mskey )
-#        if( mm < 0 or mm >= len(self.regions) ):
-#            return None
-#        mm = self.regions[mm]
-        for mm in mms :
-            mm = mm[2]
-            if( mm.start == start and mm.end == end ):
-                return mm
-        return None
+        return section_in( self.regions, start, end )
 
 
+    def build_segments( self ):
+        """
+        Flattens the (overlapping) regions into sorted, non overlapping segments that each know the innermost region,
+        so finding the region of an address is a single bisect
+        """
+        starts = []
+        regions = []
+        ivs = sorted( self.regions, key = lambda iv : iv.begin )
+        bounds = sorted( set( iv.begin for iv in ivs ) | set( iv.end for iv in ivs ) )
+        active = []
+        nxt = 0
+        for b in bounds:
+            while( nxt < len(ivs) and ivs[nxt].begin <= b ):
+                iv = ivs[nxt]
+                heapq.heappush( active, ( iv.data.size, iv.begin, nxt, iv.end, iv.data ) )
+                nxt += 1
+            while( len(active) > 0 and active[0][3] <= b ):
+                heapq.heappop( active )
+            mm = None
+            if( len(active) > 0 ):
+                mm = active[0][4]
+            if( len(regions) > 0 and regions[-1] is mm ):
+                continue
+            starts.append(b)
+            regions.append(mm)
+        self.seg_starts = starts
+        self.seg_regions = regions
+        self.seg_generation = self.generation
+
     def find( self, addr, mm = None ):
 #        print(f"find(0x{addr:x})")
         if( mm is not None ):
             return mm
         self.lazy_parse()
-#        print("len(self.regions) = '%s'" % len(self.regions) )
-#        print("addr = '%s'" % addr )
-#        mmi = bisect.bisect_left( self.regions, addr )
-#        mmi = bisect.bisect_right( self.regions, memory_key(addr) )
-
-        mms = self.regions[addr]
-
-        candidates = []
-        for mm in mms:
-            mm = mm[2]
-#            mm = self.regions[mmi]
-#            print("mm = '%s'" % mm )
-#            print("type(mm.start) = '%s'" % type(mm.start) )
-#            print("type(addr) = '%s'" % type(addr) )
-#            print(f"0x{mm.start:x} <= 0x{addr:x} = {mm.start<=addr}")
-#            print(f"0x{addr:x} <= 0x{mm.start:x} = {addr<=mm.start}")
-            if( mm.start <= addr <= mm.end ):
-                candidates.append(mm)
-            if( mm.start > addr ):
-                break
-
-#        print("candidates = '%s'" % candidates )
-        if( len(candidates) == 0 ):
+        if( self.seg_generation != self.generation ):
+            self.build_segments()
+        idx = bisect.bisect_right( self.seg_starts, addr ) - 1
+        if( idx < 0 ):
             return None
+        return self.seg_regions[idx]
 
-        mr = candidates[0]
-        for c in candidates:
-            if( mr.size > c.size ):
-                mr = c
-        return mr
+    def classify( self, addrs ):
+        """
+        The regions of a whole list of addresses at once, None for those not in any region. For sorted addresses this is
+        just one walk over the segments.
+        """
+        self.lazy_parse()
+        if( self.seg_generation != self.generation ):
+            self.build_segments()
+        starts = self.seg_starts
+        regions = self.seg_regions
+        n = len(starts)
+        ret = [None] * len(addrs)
+        idx = 0 # number of segment starts <= addr
+        for i,addr in enumerate(addrs):
+            # Mostly the address is in the same segment as the previous one or in the next one
+            if( idx < n and starts[idx] <= addr ):
+                idx += 1
+                if( idx < n and starts[idx] <= addr ):
+                    idx = bisect.bisect_right( starts, addr, idx )
+            elif( idx > 0 and starts[idx-1] > addr ):
+                idx = bisect.bisect_right( starts, addr, 0, idx )
+            if( idx > 0 ):
+                ret[i] = regions[idx-1]
+        return ret
+
+    def colors_of( self, mm ):
+        """
+        The ( mcolor, acolor, scolor ) of the region, computed once per generation of the map and of the settings. For
+        stacks the memory type colour depends on the selected thread, that is left to get_mcolor.
+        """
+        gen = ( self.generation, vdb.config.generation )
+        if( self.colors_generation != gen ):
+            self.region_colors = {}
+            self.colors_generation = gen
+        ret = self.region_colors.get(mm,None)
+        if( ret is None ):
+            ret = ( param_color( colormap.get(mm.mtype,None) ),
+                    param_color( access_colors.get(mm.atype,None) ),
+                    param_color( section_color(mm.section) ) )
+            self.region_colors[mm] = ret
+        return ret
 
 
     def get_asciicolor( self, addr ):
@@ -821,15 +1466,10 @@ class memory_map:
         mm = self.find(addr,mm)
         ret = None
         if( mm is not None ):
-            mtype = mm.mtype
-            if( mtype == memory_type.FOREIGN_STACK ):
-                if( gdb.selected_thread() in  mm.threads ):
-                    mtype = memory_type.OWN_STACK
-            ret = colormap.get(mtype,None)
-            if( ret is not None ):
-                ret = ret.value
-                if( len(ret) == 0 ):
-                    ret = None
+            if( mm.mtype == memory_type.FOREIGN_STACK and gdb.selected_thread() in mm.threads ):
+                ret = param_color( colormap.get(memory_type.OWN_STACK,None) )
+            else:
+                ret = self.colors_of(mm)[0]
 #        print("ret = '%s'" % ret )
 #        print("mm.mtype = '%s'" % mm.mtype )
         return ( ret, mm )
@@ -841,11 +1481,7 @@ class memory_map:
         mm = self.find(addr,mm)
         ret = None
         if( mm is not None ):
-            ret = access_colors.get(mm.atype,None)
-            if( ret is not None ):
-                ret = ret.value
-                if( len(ret) == 0 ):
-                    ret = None
+            ret = self.colors_of(mm)[1]
         return ( ret, mm )
 
 
@@ -856,12 +1492,7 @@ class memory_map:
         mm = self.find(addr,mm)
         ret = None
         if( mm is not None ):
-#            ret = color_configs.get(mm.section,None)
-            ret = section_color(mm.section)
-            if( ret is not None ):
-                ret = ret.value
-                if( len(ret) == 0 ):
-                    ret = None
+            ret = self.colors_of(mm)[2]
 #        print("ret = '%s'" % ret )
 #        print("mm.section = '%s'" % mm.section )
         return ( ret, mm )
@@ -909,14 +1540,49 @@ class memory_map:
     def add_region( self, mm ):
         self.regions[mm.start:mm.end+1] = mm
 
-    def parse( self ):
-        self.regions.clear()
+    def invalidate( self, objfile = None ):
+        """
+        Forget the sections of the objfile, or of all of them, they are read again on the next parse
+        """
+        self.static_regions = None
+        if( objfile is None ):
+            self.static_cache.clear()
+            self.mapping_cache.clear()
+            self.mappings = None
+            self.mapping_text = None
+            return
+        for key in [ k for k,v in self.static_cache.items() if v[1] == objfile ]:
+            del self.static_cache[key]
+
+    def static_region( self, start, end, section, file, owner ):
+        key = ( start, end, section, file )
+        mr = self.static_cache.get(key,None)
+        if( mr is None ):
+            mr = memory_region( start, end, section, file )
+            self.static_cache[key] = ( mr, owner )
+        else:
+            mr = mr[0]
+        return mr
 
+    def read_static( self ):
+        """
+        The sections of all objfiles. They only change when objfiles come and go, the regions of the ones that are
+        still there are taken from the cache.
+        """
+        pid = gdb.selected_inferior().pid
+        # A process, or no process anymore, sees different access rights
+        if( pid != self.static_pid ):
+            self.static_cache.clear()
+            self.mapping_cache.clear()
+            self.null_region = None
+            self.static_pid = pid
+        tree = intervaltree.IntervalTree()
+
+        exe = gdb.current_progspace().filename
         info_files = gdb.execute("info files",False,True)
-        fre = re.compile("(0x[0-9a-fA-F]*) - (0x[0-9a-fA-F]*) is (.*?)(?: in (.*))?$")
         for info in info_files.splitlines():
             info=info.strip()
-            m = fre.match(info)
+            m = info_files_re.match(info)
             if( m ):
                 start=int(m.group(1),16)
                 end=int(m.group(2),16)
@@ -925,60 +1591,23 @@ class memory_map:
                 size=end-start
                 if( ignore_empty.value and size == 0 ):
                     continue
-                mr = memory_region( start, end, section, file )
+                owner = file
+                if( owner is None ):
+                    owner = exe
+                mr = self.static_region( start, end, section, file, owner )
                 mr.fileline = info
-                self.add_region( mr )
-        nullr = memory_region( 0, 0x1000, None, None )
-        nullr.atype = access_type.ACCESS_INV
-        nullr.mtype = memory_type.NULL
-        self.add_region(nullr)
-#        self.regions.sort()
-        try:
-            info_proc_mapping = gdb.execute("info proc mapping",False,True)
-            mre = re.compile(r"(0x[0-9a-fA-F]*)\s*(0x[0-9a-fA-F]*)\s*(0x[0-9a-fA-F]*)\s*(0x[0-9a-fA-F]*)\s*(.*)")
-
+                tree[mr.start:mr.end+1] = mr
 
-            for mapping in info_proc_mapping.splitlines():
-                mapping=mapping.strip()
-                m = mre.match(mapping)
-#            print("mapping = '%s'" % mapping )
-#            print("m = '%s'" % m )
-                if( m ):
-                    start=int(m.group(1),16)
-                    end=int(m.group(2),16)
-                    file=m.group(5)
-                    mm = self.section(start,end)
-                    size = end-start
-                    if( ignore_empty.value and size == 0 ):
-                        continue
-                    if( mm is None ):
-                        mm = memory_region( start, end, None, file )
-                        self.add_region(mm)
-                    mm.procline = mapping
-                    if( len(file) > 0 and mm.file is None ):
-                        mm.file = file
-                    if( file.startswith("/SYSV00000000 (deleted)") ):
-                        mm.mtype = memory_type.SHM
-                    elif( file.endswith( "[stack]") ):
-                        mm.mtype = memory_type.FOREIGN_STACK
-                    elif( file.endswith( "[heap]") ):
-                        mm.mtype = memory_type.HEAP
-                    elif( file.endswith( "[vsyscall]") ):
-                        mm.mtype = memory_type.CODE
-                    elif( file.endswith( "[vdso]") ):
-                        mm.mtype = memory_type.CODE
-        except gdb.error as e:
-            es = str(e)
-            if( es.find("Can't determine the current process's PID: you must name one.") == -1 ):
-                print(f"info proc mapping: {e}")
-
-#        self.regions += map_regions
-#        self.regions.sort()
         maint_sections = gdb.execute("maint info sections ALLOBJ",False,True)
         sre = re.compile(r".*(0x[0-9a-fA-F]*)->(0x[0-9a-fA-F]*)\s*at\s*(0x[0-9a-fA-F]*):\s*(.*?)\s\s*(.*)")
-#        sec_regions = []
+        ore = re.compile(r"(?:Exec|Object|Core) file:\s*`?(.*?)'?(?:, file type .*)?$")
+        owner = exe
         for sec in maint_sections.splitlines():
             sec = sec.strip()
+            m = ore.match(sec)
+            if( m ):
+                owner = m.group(1)
+                continue
             m = sre.match(sec)
             if( m ):
                 start = int(m.group(1),16)
@@ -993,14 +1622,16 @@ class memory_map:
                 if( ignore_empty.value and size == 0 ):
                     continue
 #                print(f"{start} {end} {section} {rest} {size}")
-                mm = self.section(start,end)
+                mm = section_in( tree, start, end )
                 if( mm is None ):
-                    mm = memory_region( start, end, section, None )
-                    self.add_region(mm)
-                else:
-                    if( mm.section is not None and mm.section != section ):
-                        mm.section += f"[{section}]"
-                        print(f"Section mismatch, previous {mm.section}, new {section}")
+                    mm = self.static_region( start, end, section, None, owner )
+                    tree[mm.start:mm.end+1] = mm
+                # Already known from a previous parse
+                if( mm.maintline is not None ):
+                    continue
+                if( mm.section is not None and mm.section != section ):
+                    mm.section += f"[{section}]"
+                    print(f"Section mismatch, previous {mm.section}, new {section}")
                 mm.maintline = sec
 #                print("mm = '%s'" % mm )
 #                if( "LOAD" not in rest ):
@@ -1012,17 +1643,114 @@ class memory_map:
                 if( ( mm.atype is None or mm.atype == access_type.ACCESS_RW ) and "READONLY" in rest ):
                     mm.atype = access_type.ACCESS_RO
 #                    mm.mtype = memory_type.HEAP
-#        print("sec_regions = '%s'" % sec_regions )
-#        self.regions += sec_regions
-#        self.regions.sort()
+
+        if( self.null_region is None ):
+            nullr = memory_region( 0, 0x1000, None, None )
+            nullr.atype = access_type.ACCESS_INV
+            nullr.mtype = memory_type.NULL
+            nullr.snapshot()
+            self.null_region = nullr
+        self.static_regions = [ iv.data for iv in tree ] + [ self.null_region ]
+
+    def read_mappings( self ):
+        """
+        The list of ( start, end, file, line ) of the mappings of the process. For local ones straight from /proc, when
+        that did not change since the last time the previous list is returned.
+        """
+        pid = None
+        if( proc_fastpath.value ):
+            pid = proc_mem.target_pid()
+        if( pid is not None ):
+            try:
+                with open(f"/proc/{pid}/maps") as f:
+                    text = f.read()
+                if( text == self.mapping_text and self.mappings is not None ):
+                    return self.mappings
+                ret = []
+                for line in text.splitlines():
+                    parts = line.split(None,5)
+                    if( len(parts) < 5 ):
+                        continue
+                    start,end = parts[0].split("-")
+                    file = ""
+                    if( len(parts) > 5 ):
+                        file = parts[5].strip()
+                    ret.append( ( int(start,16), int(end,16), file, line ) )
+                self.mapping_text = text
+                return ret
+            except (OSError,ValueError) as e:
+                vdb.log(f"Not using /proc/{pid}/maps: {e}",level=4)
+        self.mapping_text = None
+        ret = []
+        try:
+            info_proc_mapping = gdb.execute("info proc mapping",False,True)
+            mre = re.compile(r"(0x[0-9a-fA-F]*)\s*(0x[0-9a-fA-F]*)\s*(0x[0-9a-fA-F]*)\s*(0x[0-9a-fA-F]*)\s*(.*)")
+
+            for mapping in info_proc_mapping.splitlines():
+                mapping=mapping.strip()
+                m = mre.match(mapping)
+#            print("mapping = '%s'" % mapping )
+#            print("m = '%s'" % m )
+                if( m ):
+                    ret.append( ( int(m.group(1),16), int(m.group(2),16), m.group(5), mapping ) )
+        except gdb.error as e:
+            es = str(e)
+            if( es.find("Can't determine the current process's PID: you must name one.") == -1 ):
+                print(f"info proc mapping: {e}")
+        return ret
+
+    def rebuild( self, mappings ):
+        """
+        Puts the regions of the sections and mappings together, regions that are still the same are reused
+        """
+        for r in self.regions:
+            r[2].restore()
+        self.regions = intervaltree.IntervalTree()
+        for mr in self.static_regions:
+            mr.restore()
+            self.add_region( mr )
+
+        mapping_cache = {}
+        for mapping in mappings:
+            start,end,file,line = mapping
+            size = end-start
+            if( ignore_empty.value and size == 0 ):
+                continue
+            mm = section_in( self.regions, start, end )
+            if( mm is None ):
+                mm = self.mapping_cache.get(mapping,None)
+                if( mm is None ):
+                    mm = memory_region( start, end, None, file )
+                mapping_cache[mapping] = mm
+                self.add_region(mm)
+            mm.procline = line
+            if( len(file) > 0 and mm.file is None ):
+                mm.file = file
+            if( file.startswith("/SYSV00000000 (deleted)") ):
+                mm.mtype = memory_type.SHM
+            elif( file.endswith( "[stack]") ):
+                mm.mtype = memory_type.FOREIGN_STACK
+            elif( file.endswith( "[heap]") ):
+                mm.mtype = memory_type.HEAP
+            elif( file.endswith( "[vsyscall]") ):
+                mm.mtype = memory_type.CODE
+            elif( file.endswith( "[vdso]") ):
+                mm.mtype = memory_type.CODE
+        self.mapping_cache = mapping_cache
+        self.mappings = mappings
+
+    def find_stacks( self ):
+        """
+        The ( region, thread ) pairs of regions that contain the stack pointer of a thread
+        """
+        ret = []
         selected_thread = gdb.selected_thread()
         if( selected_thread is None ):
-            return
+            return ret
         selected_frame = None
         try:
             # check if any is a stack
             selected_frame = gdb.selected_frame()
-            own_stack_mm = None
             for thread in gdb.selected_inferior().threads():
                 thread.switch()
                 f = gdb.selected_frame()
@@ -1032,10 +1760,7 @@ class memory_map:
                 for mm in mms:
                     mm = mm[2]
                     if( mm ):
-                        # We set always foreign stack here, the actual code returning proper colours will in that moment
-                        # check if its the own stack. Or at least try to
-                        mm.mtype = memory_type.FOREIGN_STACK
-                        mm.threads.add( thread )
+                        ret.append( ( mm, thread ) )
         except gdb.error:
 #            vdb.print_exc()
             pass
@@ -1047,6 +1772,58 @@ class memory_map:
                 pass
             if( selected_frame is not None ):
                 selected_frame.select()
+        return ret
+
+    def parse( self, stacks = True ):
+        """
+        Brings the map up to date. Sections are only read again when objfiles changed, mappings are compared to the
+        previous ones. Whenever the regions change the generation goes up.
+        """
+        changed = False
+        if( gdb.selected_inferior().pid != self.static_pid ):
+            self.static_regions = None
+        if( self.static_regions is None ):
+            self.read_static()
+            changed = True
+        mappings = self.read_mappings()
+        if( mappings != self.mappings ):
+            changed = True
+        if( changed ):
+            self.rebuild( mappings )
+        elif( not stacks ):
+            return False
+
+        stack_regions = self.find_stacks()
+        stack_key = [ ( id(mm), thread.num ) for mm,thread in stack_regions ]
+        if( stack_key != self.stack_key ):
+            if( not changed ):
+                self.rebuild( mappings )
+                changed = True
+            self.stack_key = stack_key
+        for mm,thread in stack_regions:
+            # We set always foreign stack here, the actual code returning proper colours will in that moment
+            # check if its the own stack. Or at least try to
+            mm.mtype = memory_type.FOREIGN_STACK
+            mm.threads.add( thread )
+
+        if( changed ):
+            self.generation += 1
+            self.update_policy()
+        return changed
+
+    def update_policy( self ):
+        """
+        Code and read only sections of the objfiles do not change while the inferior runs, cache them across stops. Read
+        only data that the dynamic loader relocates (.data.rel.ro, .got) is not part of this.
+        """
+        ranges = []
+        for r in self.regions:
+            r = r[2]
+            if( r.section is None or r.size == 0 ):
+                continue
+            if( r.mtype == memory_type.CODE or r.section in constant_sections ):
+                ranges.append( ( r.start, r.end ) )
+        set_policy( "mmap", ranges, cache_policy.CACHED )
 
     def find_section( self, section ):
 #        vdb.util.bark() # print("BARK")
@@ -1103,12 +1880,28 @@ def run_start():
     global last_run_start
     last_run_start += 1
 
-# might be a bottleneck for some situations
+@vdb.event.new_objfile()
+def mmap_new_objfile( ev ):
+    mmap.static_regions = None
+
+@vdb.event.free_objfile()
+def mmap_free_objfile( ev ):
+    mmap.invalidate( ev.objfile.filename )
+
+@vdb.event.clear_objfiles()
+def mmap_clear_objfiles( ev ):
+    mmap.invalidate()
+
 @vdb.event.stop()
 def maybe_refresh( _ ):
     global mmap
     global last_refresh_at
     if( last_refresh_at == last_run_start ):
+        # Only once it has been used, and only what is cheap to check: objfiles loaded since or local mappings
+        if( mmap.parsed_version == 0 ):
+            return
+        if( mmap.static_regions is None or ( proc_fastpath.value and proc_mem.target_pid() is not None ) ):
+            mmap.parse( stacks = False )
         return
     t0 = time.time()
     mmap.parse()
@@ -1133,6 +1926,129 @@ def is_sym_at( addr, symbol ):
             return True
     return False
 
+# objfile key => load bias for this session
+sym_biases = {}
+# ( file, section ) => runtime start address of the loaded sections, as "info files" shows them
+sym_sections = None
+# linkage name => what gdb shows with asm-demangle on
+sym_demangled = {}
+
+@vdb.event.new_objfile()
+def sym_new_objfile( ev ):
+    global sym_sections
+    objfile = ev.new_objfile
+    if( objfile.owner is not None ):
+        objfile = objfile.owner
+    sym_biases.pop( vdb.elf.objfile_key(objfile), None )
+    sym_sections = None
+
+@vdb.event.clear_objfiles()
+def sym_clear_objfiles( ev ):
+    global sym_cache
+    global sym_name_cache
+    global sym_sections
+    sym_biases.clear()
+    sym_sections = None
+    # Everything may be loaded somewhere else next time
+    sym_cache = intervaltree.IntervalTree()
+    sym_name_cache = intervaltree.IntervalTree()
+
+def section_starts( ):
+    global sym_sections
+    if( sym_sections is None ):
+        sym_sections = {}
+        exe = gdb.current_progspace().filename
+        for line in gdb.execute("info files",False,True).splitlines():
+            m = info_files_re.match(line.strip())
+            if( m ):
+                owner = m.group(4)
+                if( owner is None ):
+                    owner = exe
+                sym_sections.setdefault( ( owner, m.group(3) ), int(m.group(1),16) )
+    return sym_sections
+
+def sym_index( addr ):
+    """
+    The ( symbol index, load bias ) for the objfile of the address, None if there is none or we can't tell where it has
+    been loaded to. PIE objects are moved as a whole, so any loaded section tells how far.
+    """
+    if( not elf_symbols.value ):
+        return None
+    try:
+        objfile = vdb.elf.objfile_for_address( addr )
+    except (gdb.error,RuntimeError,AttributeError):
+        return None
+    if( objfile is None or objfile.filename is None ):
+        return None
+    index = vdb.elf.get_symbol_index( objfile )
+    if( index is None or len(index) == 0 ):
+        return None
+    key = vdb.elf.objfile_key(objfile)
+    bias = sym_biases.get(key,None)
+    if( bias is None ):
+        if( index.pie ):
+            try:
+                starts = section_starts()
+            except gdb.error:
+                return None
+            for name in sorted( index.sections, key = lambda n : n != ".text" ):
+                start = starts.get( ( objfile.filename, name ), None )
+                if( start is not None ):
+                    bias = start - index.sections[name]
+                    break
+            # Not loaded (yet), maybe next time
+            if( bias is None ):
+                return None
+        else:
+            bias = 0
+        sym_biases[key] = bias
+    return ( index, bias )
+
+def elf_sym_name( name ):
+    if( not name.startswith("_Z") ):
+        return name
+    try:
+        if( not gdb.parameter("print asm-demangle") ):
+            return name
+    except RuntimeError:
+        return name
+    ret = sym_demangled.get(name,None)
+    if( ret is None ):
+        try:
+            ret = gdb.execute(f"demangle {name}",False,True).strip()
+        except gdb.error:
+            ret = name
+        sym_demangled[name] = ret
+    return ret
+
+def elf_sym( addr ):
+    """
+    The ( start, size, name ) of the symbol addr is in, looked up in the ELF symbol table of its objfile. None if that
+    does not know it.
+    """
+    si = sym_index( addr )
+    if( si is None ):
+        return None
+    index,bias = si
+    idx = index.containing( addr - bias )
+    if( idx is None ):
+        return None
+    return ( index.starts[idx] + bias, index.sizes[idx], elf_sym_name( index.names[idx] ) )
+
+def elf_sym_size( start_addr, symbol ):
+    """
+    The size of the symbol gdb calls symbol at start_addr, from the ELF symbol table of its objfile. None if that does
+    not know it.
+    """
+    si = sym_index( start_addr )
+    if( si is None ):
+        return None
+    index,bias = si
+    idx = index.at( start_addr - bias, symbol )
+    if( idx is None ):
+        return None
+    return index.sizes[idx]
+
 # Gets a replication of the gdb symbol string from cache
 def get_gdb_sym_string( addr ):
     addr = int(addr)
@@ -1201,6 +2117,11 @@ def get_gdb_sym( addr ):
         for x in xs:
             return x[2]
     else:
+        # The symbol table has start and size in one lookup, gdb is only asked for what it does not know
+        tpl = elf_sym( addr )
+        if( tpl is not None ):
+            sym_cache[tpl[0]:tpl[0]+tpl[1]] = tpl
+            return tpl
         xaddr = addr
 #        nm = gdb.parse_and_eval(f"(void*)({xaddr})")
         nm = gdb.format_address(xaddr)
@@ -1221,19 +2142,23 @@ def get_gdb_sym( addr ):
 #            print("symsize = '%s'" % (symsize,) )
 
             # Now we are at the beginning of the symbol and know to the passed address where it is, but we don't really
-            # know where the end is
-            last_addr = start_addr + symsize - 1 # last known address that belongs to the symbol
-            # This is a bit slow but we cache things, maybe thats ok then
-            offset = 8
-            # Start with bigger steps for functions
-            if( symbol.find("(") != -1 ):
-                offset += 64
-
-            while( offset > 0 ):
-                while( is_sym_at( last_addr + offset, symbol ) ):
-                    last_addr += offset
-                offset //= 2
-            symsize = (last_addr - start_addr) + 1
+            # know where the end is. The symbol table usually does, as long as the address is really within it.
+            elfsize = elf_sym_size( start_addr, symbol )
+            if( elfsize is not None and elfsize >= symsize ):
+                symsize = elfsize
+            else:
+                last_addr = start_addr + symsize - 1 # last known address that belongs to the symbol
+                # This is a bit slow but we cache things, maybe thats ok then
+                offset = 8
+                # Start with bigger steps for functions
+                if( symbol.find("(") != -1 ):
+                    offset += 64
+
+                while( offset > 0 ):
+                    while( is_sym_at( last_addr + offset, symbol ) ):
+                        last_addr += offset
+                    offset //= 2
+                symsize = (last_addr - start_addr) + 1
 
 #            print("start_addr = '0x%x'" % (start_addr,) )
 #            print("last_addr = '0x%x'" % (last_addr,) )
@@ -1246,6 +2171,8 @@ def get_gdb_sym( addr ):
             return tpl
     return (None,None,None)
 
+symbolless_types = ( memory_type.HEAP, memory_type.OWN_STACK, memory_type.FOREIGN_STACK )
+
 def get_symbols( addr, xlen ):
 #    print(f"get_symbols({addr=},{xlen=})")
 #    vdb.util.bark(-1) # print("BARK")
@@ -1255,6 +2182,13 @@ def get_symbols( addr, xlen ):
 
     recnt = 0
     while xaddr >= addr:
+        # There are no symbols on the heap and the stacks, skip them in one go instead of asking gdb for every byte
+        mm = mmap.find(xaddr)
+        if( mm is not None and mm.mtype in symbolless_types and mm.section is None ):
+            for iv in extra_symbols.overlap( max(mm.start,addr), xaddr+1 ):
+                ret[iv.begin:iv.end] = iv.data[2]
+            xaddr = mm.start - 1
+            continue
         start,size,name = get_gdb_sym(xaddr)
 #        print("start = '%s'" % (start,) )
 #        print("size = '%s'" % (size,) )
@@ -1276,6 +2210,646 @@ def get_symbols( addr, xlen ):
     return ret
 
 
+# Snapshots of memory, to find out what changed between two stops. Memory is kept in pages with a hash each, a page that
+# hashes the same as in the previous snapshot is shared with it so only changed pages take up memory.
+
+snapshot_page_size = 4096
+snapshot_chunk_size = 1024*1024
+
+class memory_snapshot:
+
+    def __init__( self ):
+        self.id = vdb.util.next_id("snapshot")
+        self.time = time.time()
+        self.ranges = []
+        self.pages = {} # page address => bytes or None if not readable
+        self.hashes = {} # page address => digest
+        self.stored = 0 # pages not shared with the previous snapshot
+
+    def size( self ):
+        return len(self.pages) * snapshot_page_size
+
+    def add_page( self, addr, data, prev ):
+        if( data is None ):
+            self.pages[addr] = None
+            return
+        h = hashlib.blake2b( data, digest_size = 16 ).digest()
+        if( prev is not None and prev.hashes.get(addr,None) == h ):
+            data = prev.pages[addr]
+        else:
+            self.stored += 1
+        self.pages[addr] = data
+        self.hashes[addr] = h
+
+    def capture( self, start, end, prev ):
+        """
+        Reads start to end (page aligned) in big chunks, where a chunk cannot be read it goes page by page
+        """
+        self.ranges.append( ( start, end ) )
+        for rstart,rend in readable_runs( start, end-start ):
+            rstart -= rstart % snapshot_page_size
+            addr = rstart
+            while( addr < rend ):
+                cend = min( addr + snapshot_chunk_size, rend )
+                cend += (-cend) % snapshot_page_size
+                try:
+                    data = raw_read( addr, cend-addr ).tobytes()
+                    for off in range(0,cend-addr,snapshot_page_size):
+                        self.add_page( addr+off, data[off:off+snapshot_page_size], prev )
+                except gdb.MemoryError:
+                    for paddr in range(addr,cend,snapshot_page_size):
+                        try:
+                            data = raw_read( paddr, snapshot_page_size ).tobytes()
+                        except gdb.MemoryError:
+                            data = None
+                        self.add_page( paddr, data, prev )
+                addr = cend
+
+    def compare( self, addr, data ):
+        """
+        A mask for the bytes of data (the memory at addr): 1 where it differs from this snapshot, 0 where it is the
+        same or was not captured
+        """
+        ret = bytearray(len(data))
+        page = addr - ( addr % snapshot_page_size )
+        while( page < addr + len(data) ):
+            old = self.pages.get(page,None)
+            if( old is not None ):
+                s = max(page,addr)
+                e = min(page+snapshot_page_size,addr+len(data))
+                if( data[s-addr:e-addr] != old[s-page:e-page] ):
+                    for i in range(s,e):
+                        if( data[i-addr] != old[i-page] ):
+                            ret[i-addr] = 1
+            page += snapshot_page_size
+        return ret
+
+class snapshot_diff:
+
+    def __init__( self, old, new ):
+        self.old = old
+        self.new = new
+        self.ranges = [] # ( start, end ) of changed bytes
+        self.changed_bytes = 0
+        self.pages_compared = 0
+        self.pages_changed = 0
+        self.compute()
+
+    def compute( self ):
+        old = self.old
+        new = self.new
+        ranges = []
+        for page in sorted( new.pages.keys() & old.pages.keys() ):
+            self.pages_compared += 1
+            o = old.pages[page]
+            n = new.pages[page]
+            if( o is n ):
+                continue
+            if( o is None or n is None ):
+                # became readable or unreadable, all of it counts
+                ranges.append( ( page, page+snapshot_page_size ) )
+                self.pages_changed += 1
+                continue
+            if( old.hashes[page] == new.hashes[page] ):
+                continue
+            self.pages_changed += 1
+            ranges += changed_runs( o, n, page )
+        # Merge what touches across words and pages
+        for s,e in ranges:
+            self.changed_bytes += e - s
+            if( len(self.ranges) > 0 and self.ranges[-1][1] == s ):
+                self.ranges[-1] = ( self.ranges[-1][0], e )
+            else:
+                self.ranges.append( ( s, e ) )
+
+    def attributed( self ):
+        """
+        The changed ranges split up at symbol boundaries, as ( start, end, symbol string or None )
+        """
+        ret = []
+        for start,end in self.ranges:
+            pos = start
+            while( pos < end ):
+                sstart,ssize,sname = get_gdb_sym( pos )
+                if( sstart is None ):
+                    ret.append( ( pos, end, None ) )
+                    break
+                send = min( end, sstart + ssize )
+                if( pos == sstart ):
+                    ret.append( ( pos, send, sname ) )
+                else:
+                    ret.append( ( pos, send, f"{sname}+{pos-sstart}" ) )
+                pos = send
+        return ret
+
+def changed_runs( old, new, base ):
+    """
+    The ( start, end ) runs where the two equally sized pages differ. Compares word wise first and only looks at the
+    bytes of words that differ.
+    """
+    ret = []
+    ow = memoryview(old).cast("Q")
+    nw = memoryview(new).cast("Q")
+    for w in [ i for i in range(len(ow)) if ow[i] != nw[i] ]:
+        for b in range(w*8,w*8+8):
+            if( old[b] != new[b] ):
+                if( len(ret) > 0 and ret[-1][1] == base+b ):
+                    ret[-1][1] += 1
+                else:
+                    ret.append( [ base+b, base+b+1 ] )
+    return [ ( s, e ) for s,e in ret ]
+
+# id => memory_snapshot, oldest first
+snapshots = collections.OrderedDict()
+
+def mapped_ranges( writable = False ):
+    """
+    The ( start, end ) of all readable or only the writable memory. For local processes taken from /proc, otherwise
+    from the memory map
+    """
+    ret = []
+    pid = None
+    if( proc_fastpath.value ):
+        pid = proc_mem.target_pid()
+    if( pid is not None ):
+        try:
+            with open(f"/proc/{pid}/maps") as f:
+                for line in f:
+                    parts = line.split()
+                    if( parts[1][0] != "r" or ( writable and parts[1][1] != "w" ) ):
+                        continue
+                    start,end = parts[0].split("-")
+                    ret.append( ( int(start,16), int(end,16) ) )
+            return ret
+        except (OSError,ValueError) as e:
+            vdb.log(f"Not using /proc/{pid}/maps: {e}",level=4)
+    if( writable ):
+        atypes = ( access_type.ACCESS_RW, )
+    else:
+        atypes = ( access_type.ACCESS_RO, access_type.ACCESS_RW, access_type.ACCESS_EX, access_type.ACCESS_UNKNOWN )
+    mmap.lazy_parse()
+    for iv in sorted(mmap.regions):
+        r = iv.data
+        if( r.atype not in atypes or r.size == 0 ):
+            continue
+        if( len(ret) > 0 and r.start <= ret[-1][1] ):
+            ret[-1] = ( ret[-1][0], max(ret[-1][1],r.end) )
+        else:
+            ret.append( ( r.start, r.end ) )
+    return ret
+
+def writable_ranges( ):
+    return mapped_ranges( writable = True )
+
+def take_snapshot( ranges = None ):
+    """
+    Captures the given ( start, end ) ranges or all writable memory into a new snapshot
+    """
+    if( ranges is None ):
+        ranges = writable_ranges()
+    prev = None
+    if( len(snapshots) > 0 ):
+        prev = next(reversed(snapshots.values()))
+    ret = memory_snapshot()
+    for start,end in ranges:
+        start -= start % snapshot_page_size
+        end += (-end) % snapshot_page_size
+        ret.capture( start, end, prev )
+    snapshots[ret.id] = ret
+    while( len(snapshots) > max_snapshots.value ):
+        snapshots.popitem(last = False)
+    return ret
+
+def last_snapshot( ):
+    if( len(snapshots) == 0 ):
+        return None
+    return next(reversed(snapshots.values()))
+
+def diff_snapshots( old = None, new = None ):
+    """
+    The snapshot_diff between the two snapshots (ids or objects), by default the last two
+    """
+    if( isinstance(old,int) ):
+        old = snapshots[old]
+    if( isinstance(new,int) ):
+        new = snapshots[new]
+    if( old is None or new is None ):
+        ls = list(snapshots.values())
+        if( len(ls) < 2 ):
+            raise RuntimeError("Need at least two snapshots to compare")
+        if( new is None ):
+            new = ls[-1]
+        if( old is None ):
+            old = ls[ls.index(new)-1]
+    return snapshot_diff( old, new )
+
+def print_snapshot_diff( diff, limit = None ):
+    otbl = []
+    otbl.append( [ "Start", "End", "Bytes", "Symbol" ] )
+    attr = diff.attributed()
+    for start,end,sym in attr[:limit]:
+        s,_,_,_ = mmap.color(start)
+        otbl.append( [ s, f"{end:#0x}", end-start, vdb.util.nstr(sym) ] )
+    print(vdb.util.format_table(otbl))
+    if( limit is not None and len(attr) > limit ):
+        print(f"... {len(attr)-limit} more")
+    print(f"{diff.changed_bytes} bytes changed in {len(diff.ranges)} ranges, {diff.pages_changed} of {diff.pages_compared} pages differ (snapshot {diff.old.id} => {diff.new.id})")
+
+def print_snapshots( ):
+    otbl = []
+    otbl.append( [ "ID", "Time", "Ranges", "Captured", "Stored" ] )
+    for sid,snap in snapshots.items():
+        sz,suf = vdb.util.num_suffix( snap.size() )
+        ssz,ssuf = vdb.util.num_suffix( snap.stored * snapshot_page_size )
+        otbl.append( [ sid, datetime.datetime.fromtimestamp(snap.time), len(snap.ranges), f"{sz:.1f}{suf}B", f"{ssz:.1f}{ssuf}B" ] )
+    print(vdb.util.format_table(otbl))
+
+def parse_ranges( argv ):
+    """
+    <addr> <len> or <addr>,<addr2> pairs into ( start, end ) ranges
+    """
+    ret = []
+    i = 0
+    while( i < len(argv) ):
+        if( "," in argv[i] ):
+            a0,a1 = argv[i].split(",")
+            start = vdb.util.gint(a0)
+            end = vdb.util.gint(a1)
+            i += 1
+        else:
+            if( i + 1 >= len(argv) ):
+                raise RuntimeError(f"Missing length for {argv[i]}")
+            start = vdb.util.gint(argv[i])
+            end = start + vdb.util.gint(argv[i+1])
+            i += 2
+        ret.append( ( start, end ) )
+    return ret
+
+class cmd_snapshot(vdb.command.command):
+    """
+Takes snapshots of memory and shows what changed between them
+
+snapshot                            - snapshot of all writable memory
+snapshot <addr> <len>|<addr>,<addr2> - snapshot of just these ranges (can be repeated)
+snapshot list                       - list the snapshots taken so far
+snapshot diff [<id1> [<id2>]]       - what changed between the two snapshots, by default the last two
+snapshot del <id>                   - forget the snapshot
+snapshot clear                      - forget all snapshots
+
+Use hexdump/d to see the bytes that changed since the last snapshot.
+"""
+
+    def __init__ (self):
+        super().__init__ ("snapshot", gdb.COMMAND_DATA)
+
+    def do_invoke (self, argv ):
+        self.dont_repeat()
+
+        if( len(argv) == 0 ):
+            t0 = time.time()
+            snap = take_snapshot()
+            t1 = time.time()
+            print(f"Took snapshot {snap.id} of {snap.size()} bytes ({snap.stored} new pages) in {t1-t0:.3f}s")
+            return
+        match argv[0]:
+            case "list":
+                print_snapshots()
+            case "diff":
+                ids = [ int(a) for a in argv[1:3] ]
+                print_snapshot_diff( diff_snapshots( *ids ), limit = max_diff_lines.value )
+            case "del":
+                snapshots.pop( int(argv[1]), None )
+            case "clear":
+                snapshots.clear()
+            case _:
+                snap = take_snapshot( parse_ranges( argv ) )
+                print(f"Took snapshot {snap.id} of {snap.size()} bytes ({snap.stored} new pages)")
+
+cmd_snapshot()
+
+class search_pattern:
+    """
+    What memory search looks for. Candidates are found by the literal (bytes.find is a lot faster than any regex) or the
+    regex, the value then starts offset bytes before the candidate and has to pass check if there is one.
+    """
+
+    def __init__( self, desc ):
+        self.desc = desc
+        self.literal = None
+        self.regex = None
+        self.offset = 0
+        self.length = None # None for regexes, their matches can have any length
+        self.align = 1
+        self.check = None
+        self.byteorder = "little"
+        self.pointer = False
+
+    def use_literal( self, literal, offset = 0 ):
+        """
+        Searches for the literal starting offset bytes into the value. Runs of zero bytes make bytes.find crawl through
+        memory that is mostly zero, so we look for the rest and check the zeros afterwards.
+        """
+        core = literal.strip(b"\0")
+        if( len(core) < 2 or core == literal ):
+            self.literal = literal
+            self.offset = offset
+            return
+        lead = len(literal) - len(literal.lstrip(b"\0"))
+        self.literal = core
+        self.offset = offset + lead
+        check = self.check
+        self.check = lambda b : b[offset:offset+len(literal)] == literal and ( check is None or check(b) )
+
+    def overlap( self ):
+        """
+        How many bytes a chunk has to overlap with the next one to not miss matches that cross the boundary
+        """
+        if( self.length is None ):
+            return search_overlap.value
+        return self.length - 1
+
+    def candidates( self, data ):
+        if( self.literal is not None ):
+            pos = data.find( self.literal )
+            while( pos >= 0 ):
+                yield pos
+                pos = data.find( self.literal, pos + 1 )
+        else:
+            for m in self.regex.finditer( data ):
+                yield m.start()
+
+    def find( self, data, base ):
+        """
+        Yields ( offset, length ) of all matches in data, which starts at the address base
+        """
+        if( self.length is None ):
+            for m in self.regex.finditer( data ):
+                yield ( m.start(), m.end() - m.start() )
+            return
+        for pos in self.candidates( data ):
+            pos -= self.offset
+            if( pos < 0 or pos + self.length > len(data) ):
+                continue
+            if( ( base + pos ) % self.align != 0 ):
+                continue
+            if( self.check is not None and not self.check( data[pos:pos+self.length] ) ):
+                continue
+            yield ( pos, self.length )
+
+def bytes_pattern( data, desc = None ):
+    if( len(data) == 0 ):
+        raise RuntimeError("Nothing to search for")
+    ret = search_pattern( desc or data.hex() )
+    ret.length = len(data)
+    ret.use_literal( data )
+    return ret
+
+def int_pattern( value, size, byteorder = "little", aligned = False ):
+    ret = bytes_pattern( value.to_bytes( size, byteorder, signed = ( value < 0 ) ), f"int{size*8} {value}" )
+    ret.byteorder = byteorder
+    if( aligned ):
+        ret.align = size
+    return ret
+
+def pointer_pattern( lo, hi, size, byteorder = "little" ):
+    """
+    Values in [lo,hi). The bytes all of them have in common are the literal, the byte after them is narrowed down by a
+    character class and the check does the rest.
+    """
+    if( lo >= hi ):
+        raise RuntimeError(f"Empty pointer range {lo:#0x},{hi:#0x}")
+    ret = search_pattern( f"pointer {lo:#0x},{hi:#0x}" )
+    ret.length = size
+    ret.align = size
+    ret.byteorder = byteorder
+    ret.pointer = True
+    blo = lo.to_bytes( size, "big" )
+    bhi = (hi-1).to_bytes( size, "big" )
+    common = 0
+    while( common < size and blo[common] == bhi[common] ):
+        common += 1
+    if( common == size ):
+        ret.use_literal( blo if byteorder == "big" else blo[::-1] )
+        return ret
+    ret.check = lambda b : lo <= int.from_bytes( b, byteorder ) < hi
+    if( common > 0 ):
+        if( byteorder == "big" ):
+            ret.use_literal( blo[:common] )
+        else:
+            ret.use_literal( blo[:common][::-1], size - common )
+    else:
+        cls = b"[" + re.escape(blo[:1]) + b"-" + re.escape(bhi[:1]) + b"]"
+        ret.regex = re.compile( cls, re.DOTALL )
+        if( byteorder != "big" ):
+            ret.offset = size - 1
+    return ret
+
+def regex_pattern( expr ):
+    ret = search_pattern( f"regex {expr}" )
+    ret.regex = re.compile( expr.encode("utf-8"), re.DOTALL )
+    return ret
+
+def readable_pieces( start, end ):
+    """
+    The ( addr, bytes ) of the readable parts of the range. One read if possible, otherwise halving down to pages and
+    joining what belongs together again
+    """
+    try:
+        return [ ( start, raw_read( start, end - start ).tobytes() ) ]
+    except gdb.error:
+        if( end - start <= snapshot_page_size ):
+            return []
+    mid = start + ( ( end - start ) // 2 ) // snapshot_page_size * snapshot_page_size
+    if( mid <= start ):
+        mid = start + snapshot_page_size
+    ret = readable_pieces( start, mid )
+    for addr,data in readable_pieces( mid, end ):
+        if( len(ret) > 0 and ret[-1][0] + len(ret[-1][1]) == addr ):
+            ret[-1] = ( ret[-1][0], ret[-1][1] + data )
+        else:
+            ret.append( ( addr, data ) )
+    return ret
+
+class memory_search:
+    """
+    Scans the ranges (by default all readable memory) for the pattern in chunks of vdb-memory-search-chunk-size bytes.
+    Each read overlaps the next chunk by what the pattern needs so nothing at the boundaries is missed, matches are only
+    reported by the chunk they start in.
+    """
+
+    def __init__( self, pattern, ranges = None ):
+        self.pattern = pattern
+        if( ranges is None ):
+            ranges = mapped_ranges()
+        self.ranges = ranges
+        self.scanned = 0
+        self.matches = 0
+        self.time = 0.0
+
+    def run( self, max_results = None ):
+        """
+        Yields ( addr, data ) of the matches as they are found
+        """
+        t0 = time.time()
+        try:
+            chunk = max( search_chunk.value, snapshot_page_size )
+            overlap = self.pattern.overlap()
+            last_end = 0
+            for rstart,rend in self.ranges:
+                for start,end in readable_runs( rstart, rend - rstart ):
+                    pos = start
+                    while( pos < end ):
+                        limit = min( pos + chunk, end )
+                        for base,data in readable_pieces( pos, min( limit + overlap, end ) ):
+                            for off,mlen in self.pattern.find( data, base ):
+                                addr = base + off
+                                # The next chunk will find it, regex matches must not overlap the previous one
+                                if( addr >= limit or addr < last_end ):
+                                    continue
+                                if( self.pattern.length is None ):
+                                    last_end = addr + mlen
+                                self.matches += 1
+                                yield ( addr, data[off:off+mlen] )
+                                if( max_results and self.matches >= max_results ):
+                                    self.scanned += addr - pos
+                                    return
+                        self.scanned += limit - pos
+                        pos = limit
+        finally:
+            self.time += time.time() - t0
+
+    def source( self ):
+        pid = None
+        if( proc_fastpath.value ):
+            pid = proc_mem.target_pid()
+        if( pid is not None ):
+            return f"/proc/{pid}/mem"
+        return "gdb"
+
+    def summary( self ):
+        sz,suf = vdb.util.num_suffix( self.scanned )
+        rate,rsuf = vdb.util.num_suffix( self.scanned / max( self.time, 1e-6 ) )
+        return f"{self.matches} matches for {self.pattern.desc}, scanned {sz:.1f}{suf}B in {self.time:.3f}s ({rate:.1f}{rsuf}B/s via {self.source()})"
+
+def print_match( addr, data, pattern ):
+    s,_,_,_ = mmap.color(addr)
+    line = [ s ]
+    sym = get_gdb_sym_string( addr )
+    if( sym is not None ):
+        line.append(sym)
+    if( pattern.pointer ):
+        val = int.from_bytes( data, pattern.byteorder )
+        vs,_,_,_ = mmap.color(val)
+        line.append( f"=> {vs}" )
+        vsym = get_gdb_sym_string( val )
+        if( vsym is not None ):
+            line.append(vsym)
+    else:
+        line.append( data[:16].hex(" ") + ( " ..." if len(data) > 16 else "" ) )
+    print(" ".join(line))
+
+def parse_search( argv, flags ):
+    """
+    <kind> <what> [ranges] into the search_pattern and the ranges, None for all readable memory
+    """
+    if( len(argv) < 2 ):
+        raise RuntimeError("memory search needs what to search for")
+    byteorder = "big" if "b" in flags else "little"
+    kind = argv[0]
+    what = argv[1]
+    psize = vdb.arch.pointer_size // 8
+    match kind:
+        case "bytes":
+            pattern = bytes_pattern( bytes.fromhex( what ) )
+        case "string":
+            pattern = bytes_pattern( what.encode("utf-8"), f"string {what}" )
+        case "int8" | "int16" | "int32" | "int64":
+            pattern = int_pattern( vdb.util.gint(what), int(kind[3:]) // 8, byteorder, "a" in flags )
+        case "pointer":
+            if( "," in what ):
+                lo,hi = what.split(",")
+                pattern = pointer_pattern( vdb.util.gint(lo), vdb.util.gint(hi), psize, byteorder )
+            else:
+                lo = vdb.util.gint(what)
+                pattern = pointer_pattern( lo, lo+1, psize, byteorder )
+        case "regex":
+            pattern = regex_pattern( what )
+        case _:
+            raise RuntimeError(f"Unknown search kind {kind}")
+    ranges = None
+    if( len(argv) > 2 ):
+        ranges = parse_ranges( argv[2:] )
+    return ( pattern, ranges )
+
+def extract_max_results( argv ):
+    ret = search_max.value
+    retargv = []
+    i = 0
+    while( i < len(argv) ):
+        if( argv[i].startswith("--max-results=") ):
+            ret = int(argv[i].split("=",1)[1])
+        elif( argv[i] == "--max-results" and i + 1 < len(argv) ):
+            i += 1
+            ret = int(argv[i])
+        else:
+            retargv.append(argv[i])
+        i += 1
+    return ( ret, retargv )
+
+class cmd_memory(vdb.command.command):
+    """
+Searches the memory of the inferior
+
+memory search <kind> <what> [<addr> <len>|<addr>,<addr2> ...] [--max-results <n>]
+
+kinds:
+bytes <hex>              - a byte sequence like 48656c6c6f
+string <text>            - the UTF-8 encoded text
+int8|int16|int32|int64 <value> - an integer of that size
+pointer <addr>           - pointer sized values equal to addr, always aligned
+pointer <addr>,<addr2>   - pointer sized values in the range [addr,addr2), always aligned
+regex <expression>       - python regular expression on the bytes
+
+Without ranges all readable memory is scanned. At most --max-results (default vdb-memory-search-max-results, 0 for no
+limit) matches are shown.
+
+flags (e.g. memory/ab search):
+a                        - only naturally aligned integers
+b                        - big endian integers and pointers
+"""
+
+    def __init__ (self):
+        super().__init__ ("memory", gdb.COMMAND_DATA)
+        self.needs_parameters = True
+
+    def do_invoke (self, argv ):
+        self.dont_repeat()
+
+        argv,flags = self.flags(argv)
+        sub = argv[0]
+        if( "/" in sub ):
+            sub,sflags = sub.split("/",1)
+            flags += sflags
+        match sub:
+            case "search":
+                max_results,argv = extract_max_results( argv[1:] )
+                pattern,ranges = parse_search( argv, flags )
+                search = memory_search( pattern, ranges )
+                try:
+                    for addr,data in search.run( max_results ):
+                        print_match( addr, data, pattern )
+                except KeyboardInterrupt:
+                    print("Interrupted")
+                if( max_results and search.matches >= max_results ):
+                    print(f"Stopped after {max_results} matches")
+                print(search.summary())
+            case _:
+                print(f"Unknown subcommand {sub}")
+                print(self.__doc__)
+
+cmd_memory()
+
+
 class cmd_memset(vdb.command.command):
     """
 Sets some memory to some value
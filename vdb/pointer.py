@@ -8,6 +8,8 @@ import vdb.vmmap
 import vdb.util
 import vdb.asm
 import vdb.arch
+import vdb.cache
+import vdb.event
 
 import gdb
 
@@ -16,6 +18,7 @@ import re
 import math
 import struct
 import sys
+import collections
 from enum import Enum,auto
 
 mod=sys.modules[__name__]
@@ -28,10 +31,73 @@ arrow_infinity = vdb.config.parameter("vdb-pointer-arrow-infinity", " ↔ " )
 ellipsis = vdb.config.parameter("vdb-pointer-ellipsis", "…" )
 
 min_ascii = vdb.config.parameter("vdb-pointer-min-ascii", 3 )
+gap = vdb.config.parameter("vdb-pointer-batch-gap", 4096 )
+cache_size = vdb.config.parameter("vdb-pointer-cache-size", 16384 )
 max_exponents = vdb.config.parameter("vdb-pointer-max-exponents", "-6,15", gdb_type = vdb.config.PARAM_ARRAY )
 
 
 
+class render_cache:
+    """
+    Remembers rendered pointers until the next stop or memory change, the registers, backtrace, disassembler and hexdump
+    all show the same ones over and over. Least recently used entries are dropped beyond vdb-pointer-cache-size.
+    """
+
+    def __init__( self ):
+        self.entries = collections.OrderedDict()
+        self.stats = vdb.cache.cache_entry()
+        self.stats.cache = self.entries
+
+    def get( self, key ):
+        ret = self.entries.get(key,None)
+        if( ret is None ):
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+            self.entries.move_to_end(key)
+        return ret
+
+    def put( self, key, value ):
+        self.entries[key] = value
+        while( len(self.entries) > max(cache_size.value,0) ):
+            self.entries.popitem(last=False)
+
+    def flush( self, _ev = None ):
+        if( len(self.entries) ):
+            vdb.log(f"Flushing pointer render cache due to {_ev}",level=5)
+        self.entries.clear()
+
+chain_cache = render_cache()
+color_cache = render_cache()
+vdb.cache.register( "chain_cache", chain_cache.stats )
+vdb.cache.register( "color_cache", color_cache.stats )
+
+@vdb.event.stop()
+@vdb.event.inferior_call()
+@vdb.event.memory_changed()
+@vdb.event.new_objfile()
+@vdb.event.theme_changed()
+def flush_render_cache( ev = None ):
+    chain_cache.flush(ev)
+    color_cache.flush(ev)
+
+def selected_thread( ):
+    """
+    Part of the cache keys, which stack counts as our own depends on the selected thread
+    """
+    try:
+        thread = gdb.selected_thread()
+    except gdb.error:
+        return None
+    if( thread is None ):
+        return None
+    return thread.global_num
+
+def pointer_value( ptr ):
+    if( isinstance(ptr,int) ):
+        return ptr
+    return vdb.util.xint(ptr)
+
 def as_c_str( ptr, maxlen = 64 ):
     c_str = bytearray()
 #    rptr = ptr
@@ -178,17 +244,26 @@ def as_tailspec( ptr, minasc, spec ):
 def as_tail( ptr, minasc ):
     return as_tailspec( ptr, minasc, "ax" )
 
-def color( ptr, archsize = None ):
-    """Colorize the pointer according to the currently known memory situation"""
+def color( ptr, archsize = None, mm = None ):
+    """Colorize the pointer according to the currently known memory situation, mm is its region if already known"""
 
     if( archsize is None ):
         archsize = vdb.arch.pointer_size
 
-    ptr=vdb.util.xint(ptr)
+    ptr = pointer_value(ptr)
+    colorspec = vdb.memory.default_colorspec.value
+    key = ( ptr, archsize, colorspec, selected_thread() )
+    ret = color_cache.get(key)
+    if( ret is None ):
+        ret = format_color( ptr, archsize, colorspec, mm )
+        color_cache.put(key,ret)
+    return ret
+
+def format_color( ptr, archsize, colorspec, mm ):
     plen = archsize // 4
 #    t,additional = get_type(ptr,archsize)
 
-    s,mm,col,additional = vdb.memory.mmap.color(ptr,colorspec=vdb.memory.default_colorspec.value)
+    s,mm,col,additional = vdb.memory.mmap.color(ptr,colorspec=colorspec,mm=mm)
 #    scolor = colormap.get(t,color_unknown)
 
     if( mm.mtype == vdb.memory.memory_type.NULL ):
@@ -219,8 +294,27 @@ def colors( ptr, archsize = None ):
 
 # @return pure means it is just the pointer, no additional text (but maybe additional colouring)
 # Make this return the display length too somehow
-@vdb.util.memoize( [ gdb.events.stop, vdb.event.theme_changed ] )
 def chain( ptr, archsize = None, maxlen = 8, test_for_ascii = True, minascii = None, last = True, tailspec = None, do_annotate = True ):
+    return cached_chain( ptr, archsize, maxlen, test_for_ascii, minascii, last, tailspec, do_annotate )
+
+def cached_chain( ptr, archsize, maxlen, test_for_ascii, minascii, last, tailspec, do_annotate, batch = None ):
+    if( archsize is None ):
+        archsize = vdb.arch.pointer_size
+    if( minascii is None ):
+        minascii = min_ascii.value
+    flags = ( test_for_ascii, minascii, last, do_annotate, vdb.memory.default_colorspec.value, selected_thread() )
+    key = ( pointer_value(ptr), archsize, maxlen, tailspec, flags )
+    ret = chain_cache.get(key)
+    if( ret is None ):
+        ret = format_chain( ptr, archsize, maxlen, test_for_ascii, minascii, last, tailspec, do_annotate, batch )
+        chain_cache.put(key,ret)
+    return ret
+
+def format_chain( ptr, archsize, maxlen, test_for_ascii, minascii, last, tailspec, do_annotate, batch = None ):
+    """
+    The work of chain(). With a chain_batch the memory map regions and the pointed to values come from what it has
+    read already and the rest of the chain is formatted through it.
+    """
     if( archsize is None ):
         archsize = vdb.arch.pointer_size
 
@@ -229,10 +323,13 @@ def chain( ptr, archsize = None, maxlen = 8, test_for_ascii = True, minascii = N
 
 #    print("chain(0x%x,…)" % ptr )
 #    print("type(ptr) = '%s'" % type(ptr) )
-    ret,add,_,_,_ = color(ptr,archsize)
+    mm = None
+    if( batch is not None ):
+        mm = batch.regions.get(ptr,None)
+    ret,add,_,_,_ = color(ptr,archsize,mm)
     pure = True
 
-    if( do_annotate ):
+    if( do_annotate and ( batch is None or batch.may_have_symbol(ptr) ) ):
         an = annotate( ptr )
     else:
         an = None
@@ -258,7 +355,10 @@ def chain( ptr, archsize = None, maxlen = 8, test_for_ascii = True, minascii = N
         pure = False
         ret += f"   {ascstring}"
     try:
-        nptr,gvalue = dereference( ptr )
+        if( batch is None ):
+            nptr,gvalue = dereference( ptr )
+        else:
+            nptr,gvalue = batch.dereference( ptr )
 
 #        print(f"{nptr.type=}")
 #        print(f"{nptr.bytes=}")
@@ -266,15 +366,21 @@ def chain( ptr, archsize = None, maxlen = 8, test_for_ascii = True, minascii = N
 #        print(f"{gvalue.bytes=}")
 
         if( int(nptr) == int(gvalue) ):
-            ret += arrow_infinity.value + color(gvalue,archsize)[0]
+            mm = None
+            if( batch is not None ):
+                mm = batch.regions.get(gvalue,None)
+            ret += arrow_infinity.value + color(gvalue,archsize,mm)[0]
             pure = False
         else:
 #        print("gvalue = '%s'" % gvalue )
             if( not last and maxlen == 1):
                 pass
-            else:
+            elif( batch is None ):
                 ret += arrow_right.value + chain(gvalue,archsize,maxlen-1,tailspec=tailspec)[0]
                 pure = False
+            else:
+                ret += arrow_right.value + batch.chain(gvalue,maxlen-1,tailspec=tailspec)[0]
+                pure = False
     except gdb.MemoryError as e:
 #        print("e = '%s'" % e )
         pass
@@ -282,6 +388,103 @@ def chain( ptr, archsize = None, maxlen = 8, test_for_ascii = True, minascii = N
         raise
     return (ret,pure)
 
+class chain_batch:
+    """
+    Resolves the pointer chains of many pointers at once. Level by level all new pointers are classified against the
+    memory map in one pass and what they point to is read in as few reads as possible, identical pointers are only
+    looked at once. Those reads also bring the memory that the tails (strings etc.) need into the memory cache.
+    """
+
+    def __init__( self, archsize = None ):
+        if( archsize is None ):
+            archsize = vdb.arch.pointer_size
+        self.archsize = archsize
+        self.psize = vdb.arch.pointer_size // 8
+        self.regions = {} # pointer => memory region, None if not in any
+        self.words = {} # pointer => the pointer it points to, None if that could not be read
+        self.reads = 0
+
+    def prefetch( self, ptrs, maxlen ):
+        level = set(ptrs)
+        for _ in range(maxlen):
+            todo = sorted( p for p in level if p not in self.regions )
+            if( len(todo) == 0 ):
+                break
+            for p,mm in zip(todo,vdb.memory.mmap.classify(todo)):
+                self.regions[p] = mm
+            self.fetch( todo )
+            level = { self.words[p] for p in todo if self.words[p] is not None }
+
+    def fetch( self, ptrs ):
+        """
+        Reads the pointers at all of the (sorted) addresses, together with what as_c_str() would read there. Close ones in
+        the same region are read together.
+        """
+        span = max( 64, self.psize )
+        groups = []
+        for p in ptrs:
+            mm = self.regions.get(p,None)
+            if( mm is not None and mm.atype in ( vdb.memory.access_type.ACCESS_INACCESSIBLE, vdb.memory.access_type.ACCESS_INV ) ):
+                self.words[p] = None
+                continue
+            if( len(groups) > 0 and groups[-1][2] is mm and p <= groups[-1][1] + gap.value ):
+                groups[-1][1] = max( groups[-1][1], p + span )
+                groups[-1][3].append(p)
+            else:
+                groups.append( [ p, p + span, mm, [ p ] ] )
+        for start,end,mm,members in groups:
+            if( mm is not None ):
+                end = min( end, max( mm.end, members[-1] + self.psize ) )
+            data = None
+            if( len(members) > 1 ):
+                self.reads += 1
+                data = vdb.memory.read( start, end - start )
+            if( data is not None ):
+                data = data.tobytes()
+                for p in members:
+                    self.words[p] = int.from_bytes( data[p-start:p-start+self.psize], "little" )
+                continue
+            # Not all of it is readable, the pointers on their own might be
+            for p in members:
+                self.words[p] = self.read_word(p)
+
+    def read_word( self, ptr ):
+        self.reads += 1
+        data = vdb.memory.read( ptr, self.psize )
+        if( data is None ):
+            return None
+        return int.from_bytes( data.tobytes(), "little" )
+
+    def dereference( self, ptr ):
+        """
+        Like dereference() but from what was read already, raises gdb.MemoryError when it could not be read
+        """
+        try:
+            val = self.words[ptr]
+        except KeyError:
+            val = self.read_word(ptr)
+            self.words[ptr] = val
+        if( val is None ):
+            raise gdb.MemoryError(f"Cannot access memory at address {ptr:#0x}")
+        return ( ptr & ( 2 ** vdb.arch.pointer_size - 1 ), val )
+
+    def may_have_symbol( self, ptr ):
+        mm = self.regions.get(ptr,None)
+        return ( mm is None or mm.section is not None or mm.mtype not in vdb.memory.symbolless_types )
+
+    def chain( self, ptr, maxlen = 8, test_for_ascii = True, minascii = None, last = True, tailspec = None, do_annotate = True ):
+        return cached_chain( ptr, self.archsize, maxlen, test_for_ascii, minascii, last, tailspec, do_annotate, self )
+
+def chains( ptrs, archsize = None, maxlen = 8, test_for_ascii = True, minascii = None, tailspec = None ):
+    """
+    chain() for a whole list of pointers, e.g. all the words of a hexdump. Returns the ( string, pure ) for each of them
+    in the same order.
+    """
+    ptrs = [ int(p) for p in ptrs ]
+    batch = chain_batch( archsize )
+    batch.prefetch( ptrs, maxlen )
+    return [ batch.chain( p, maxlen, test_for_ascii, minascii, tailspec = tailspec ) for p in ptrs ]
+
 
 
 
@@ -1451,7 +1451,7 @@ class Registers():
         rname,raddr,rbit,rtype = rpos
         if( is_blacklisted(raddr) ):
             return (None,None)
-        val = vdb.memory.read_uncached(raddr,rbit//8)
+        val = vdb.memory.read(raddr,rbit//8)
         if( val is None ): # unable to read or otherwise not accessible
             if( not mmapfake.value ):
                 print(f"{reg}@{raddr:#0x} blacklisted: memory not accessible")
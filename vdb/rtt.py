@@ -36,6 +36,9 @@ class segger_rtt_channel:
             rtt0.buffer = rtt0.struct["pBuffer"]
             rtt0.size = rtt0.struct["SizeOfBuffer"]
             rtt0.channel = channel
+            # The target writes it while running, without us noticing
+            buf = int(rtt0.buffer)
+            vdb.memory.set_policy( f"rtt{channel}", [ ( buf, buf + int(rtt0.size) ) ], vdb.memory.cache_policy.UNCACHED )
             segger_rtt_channel.rtt_channels[channel] = rtt0
         return rtt0
 
@@ -49,13 +52,13 @@ class segger_rtt_channel:
 
         alldata = ""
         if( self.read_offset > wroff ):
-            data = vdb.memory.read_uncached( self.buffer + self.read_offset, self.size - self.read_offset )
+            data = vdb.memory.read( self.buffer + self.read_offset, self.size - self.read_offset )
             datas = data.tobytes().decode("utf-8")
             alldata += datas
             self.read_offset = 0
 
         if( wroff > self.read_offset ):
-            data = vdb.memory.read_uncached( self.buffer + self.read_offset, wroff - self.read_offset )
+            data = vdb.memory.read( self.buffer + self.read_offset, wroff - self.read_offset )
             datas = data.tobytes().decode("utf-8")
             alldata += datas
             self.read_offset = wroff
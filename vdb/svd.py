@@ -8,6 +8,7 @@ import vdb.config
 import vdb.util
 import vdb.register
 import vdb.hexdump
+import vdb.memory
 
 import gdb
 import gdb.types
@@ -34,6 +35,7 @@ scan_filter = vdb.config.parameter("vdb-svd-scan-filter","",docstring="Regexp to
 scan_silent = vdb.config.parameter("vdb-svd-scan-silent",True,docstring="Don't ouput every file being scanned")
 parse_delayed = vdb.config.parameter("vdb-svd-parse-delayed",False,docstring="When true, parse only fully when an svd load command is issued")
 threads = vdb.config.parameter("vdb-svd-use-threads",True)
+peripheral_gap = 0x400 # registers closer than this are in one uncached memory range
 
 
 verbose = False
@@ -341,6 +343,21 @@ class svd_device:
 #                vdb.hexdump.annotate_range(r.mmap_address, bitsize//8, name )
         if( skip > 0 ):
             print(f"Skipped {skip} registers due to unkonwn mapping position.")
+        self.set_cache_policy()
+
+    def set_cache_policy( self ):
+        """
+        Reading peripheral registers can have side effects and their values change on their own, so never cache them.
+        Neighbouring registers are merged into one range so that the table stays small.
+        """
+        regs = sorted( ( pos[1], pos[1] + max(pos[2] or 32,8) // 8 ) for pos in vdb.register.mmapped_positions.values() )
+        ranges = []
+        for start,end in regs:
+            if( len(ranges) > 0 and start <= ranges[-1][1] + peripheral_gap ):
+                ranges[-1][1] = max(ranges[-1][1],end)
+            else:
+                ranges.append( [start,end] )
+        vdb.memory.set_policy( "svd", ranges, vdb.memory.cache_policy.UNCACHED )
 
     def _parse_name( self, ctx, node ):
         self.name = node.text
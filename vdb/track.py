@@ -17,6 +17,8 @@ import traceback
 import time
 import datetime
 import struct
+import array
+import bisect
 import rich
 
 
@@ -31,6 +33,8 @@ sleep_time = vdb.config.parameter("vdb-track-interval-sleep",0.00)
 sync_second = vdb.config.parameter("vdb-track-interval-sync-to-second",True)
 skip_long = vdb.config.parameter("vdb-track-skip-long-intervals",False)
 verbosity = vdb.config.parameter("vdb-track-verbosity",2)
+max_rows = vdb.config.parameter("vdb-track-max-rows",1000000)
+max_age = vdb.config.parameter("vdb-track-max-age",0.0)
 
 
 # XXX All over the place we have similar things, unify it into one "big" vdb.log facility that does:
@@ -488,7 +492,193 @@ def stop( bpev ):
 #        gdb.post_event(do_continue)
     return False
 
-tracking_data = {}
+class track_column:
+    """
+    The values of one tracking number, one slot per row of the track_store. Starts out as a typed array for integers or
+    floats and falls back to a plain list once something else (strings, lists of array tracks, floats among integers)
+    needs to go in.
+    """
+
+    def __init__( self ):
+        self.values = None
+        self.present = bytearray()
+
+    def __len__( self ):
+        return len(self.present)
+
+    def get( self, idx ):
+        if( idx >= len(self.present) or not self.present[idx] ):
+            return None
+        return self.values[idx]
+
+    def initial( self, value ):
+        if( isinstance(value,int) and -2**63 <= value < 2**63 ):
+            return array.array("q")
+        if( isinstance(value,float) ):
+            return array.array("d")
+        return []
+
+    def fit( self, value ):
+        """
+        Changes the storage type if needed for the value to fit in, returns the value as it is to be stored
+        """
+        if( self.values is None ):
+            self.values = self.initial(value)
+        if( isinstance(self.values,list) ):
+            return value
+        if( self.values.typecode == "q" ):
+            if( isinstance(value,int) and -2**63 <= value < 2**63 ):
+                return value
+        elif( isinstance(value,float) ):
+            return value
+        # Mixed integers and floats go into a list too, converting either one would change how they are shown
+        self.values = list(self.values)
+        return value
+
+    def set( self, idx, value ):
+        value = self.fit(value)
+        missing = idx + 1 - len(self.present)
+        if( missing > 0 ):
+            if( isinstance(self.values,list) ):
+                self.values.extend( [None] * missing )
+            else:
+                self.values.extend( [0] * missing )
+            self.present.extend( bytes(missing) )
+        self.values[idx] = value
+        self.present[idx] = 1
+
+    def insert( self, idx ):
+        if( idx < len(self.present) ):
+            self.values.insert(idx, None if isinstance(self.values,list) else 0 )
+            self.present.insert(idx,0)
+
+    def drop( self, count ):
+        del self.present[:count]
+        if( self.values is not None ):
+            del self.values[:count]
+
+class track_store:
+    """
+    All the tracked data, a timestamp column shared by one track_column per tracking number. Rows are kept sorted by
+    their timestamp, with only vdb-track-max-rows or the last vdb-track-max-age seconds (if set) retained. The oldest
+    rows are dropped like from a ring buffer, the space is given back once they make up half of the arrays. Every row
+    also gets a sequence number in the order they were added, which is what positions from end() refer to.
+    """
+
+    def __init__( self ):
+        self.timestamps = array.array("d")
+        self.sequence = array.array("Q") # per row, in the order they were added, late ones sit in between
+        self.columns = {} # tracking number => track_column
+        self.start = 0 # index of the oldest row still retained
+        self.next_sequence = 0
+        self.last_late = -1 # sequence number of the newest row that was not added at the end
+
+    def __len__( self ):
+        return len(self.timestamps) - self.start
+
+    def clear( self ):
+        self.timestamps = array.array("d")
+        self.sequence = array.array("Q")
+        self.columns = {}
+        self.start = 0
+
+    def end( self ):
+        """
+        The position after the newest row, rows(position) later on gives what has been added since
+        """
+        return self.next_sequence
+
+    def column( self, number ):
+        return self.columns.get(number,None)
+
+    def get( self, number, idx ):
+        col = self.columns.get(number,None)
+        if( col is None ):
+            return None
+        return col.get(idx)
+
+    def rows( self, position = None ):
+        """
+        Yields ( timestamp, index ) of all the retained rows, oldest first, or only those added after a position from
+        end(), late ones included. The index is for the get() of the columns and only valid until the next add().
+        """
+        ts = self.timestamps
+        seq = self.sequence
+        first = self.start
+        if( position is not None ):
+            if( self.last_late >= position ):
+                # Somewhere in between, look at all of them
+                for idx in range(first,len(ts)):
+                    if( seq[idx] >= position ):
+                        yield ( ts[idx], idx )
+                return
+            # Only added at the end since then
+            last = len(ts)
+            while( last > first and seq[last-1] >= position ):
+                last -= 1
+            first = last
+        for idx in range(first,len(ts)):
+            yield ( ts[idx], idx )
+
+    def expire( self, now ):
+        ts = self.timestamps
+        mr = max_rows.value
+        if( mr > 0 and len(ts) - self.start >= mr ):
+            self.start = len(ts) - mr + 1
+        ma = max_age.fvalue
+        if( ma > 0 ):
+            self.start = bisect.bisect_left( ts, now - ma, self.start )
+        if( self.start > 0 and self.start >= len(ts) // 2 ):
+            del ts[:self.start]
+            del self.sequence[:self.start]
+            for col in self.columns.values():
+                col.drop(self.start)
+            self.start = 0
+
+    def row( self, now ):
+        ts = self.timestamps
+        if( len(ts) > self.start ):
+            if( ts[-1] == now ):
+                return len(ts) - 1
+            if( now < ts[-1] ):
+                # e.g. the $ret of a finish that comes in after others already stored data
+                idx = bisect.bisect_left( ts, now, self.start )
+                if( ts[idx] == now ):
+                    return idx
+                # Too old to be retained, it would be the first one to go
+                mr = max_rows.value
+                if( idx == self.start and mr > 0 and len(ts) - self.start >= mr ):
+                    return None
+                ma = max_age.fvalue
+                if( ma > 0 and now < ts[-1] - ma ):
+                    return None
+                # Make room for it just like for a new one at the end
+                self.expire(ts[-1])
+                idx = bisect.bisect_left( ts, now, self.start )
+                ts.insert(idx,now)
+                self.sequence.insert(idx,self.next_sequence)
+                self.last_late = self.next_sequence
+                self.next_sequence += 1
+                for col in self.columns.values():
+                    col.insert(idx)
+                return idx
+        self.expire(now)
+        ts.append(now)
+        self.sequence.append(self.next_sequence)
+        self.next_sequence += 1
+        return len(ts) - 1
+
+    def add( self, now, number, value ):
+        idx = self.row(now)
+        if( idx is None ):
+            return
+        col = self.columns.get(number,None)
+        if( col is None ):
+            col = track_column()
+            self.columns[number] = col
+        col.set(idx,value)
+
+tracking_data = track_store()
 # Quick hack for writing a single csv file
 tracking_line = {}
 
@@ -509,6 +699,29 @@ class pseudo_item:
 # When we create the breakpoint ourselves, we use the breakpoint management too
 # When we use $ret we need a finish breakpoint... Can we just set it and never call "finish"?
 # Note: When we chose a breakpoint where we already have a track item for, we attach to it
+def stored_value( val ):
+    """
+    What is stored for the value of a track, numbers are kept as numbers and everything else as the string gdb shows
+    """
+    if( isinstance(val,gdb.Value) ):
+        try:
+            t = val.type.strip_typedefs()
+            code = t.code
+            # chars are TYPE_CODE_INT too but show as 65 'A', and with another output-radix than 10 the number as gdb
+            # shows it is what the user wants to see
+            if( code == gdb.TYPE_CODE_INT and t.sizeof > 1 and gdb.parameter("output-radix") == 10 ):
+                return int(val)
+            if( code == gdb.TYPE_CODE_FLT ):
+                return float(val)
+        except gdb.error:
+            pass
+    elif( isinstance(val,(int,float,list)) ):
+        return val
+    val = str(val)
+    if( len(val) > 0 and val[-1] == "\n" ):
+        val = val[:-1]
+    return val
+
 class track_item_base:
 
     def __init__( self ):
@@ -697,8 +910,7 @@ class track_item(track_item_base):
 #        print(f"save_data({now},{data},{number})")
         if( number is None ):
             number = self.number
-        td = tracking_data.setdefault(now,{})
-        td[number] = data
+        tracking_data.add(now,number,data)
 
         self.csv_output( data, now )
 
@@ -777,10 +989,7 @@ class track_item(track_item_base):
                         val = gdb.parse_and_eval("$")
             else:
                 val=gdb.parse_and_eval(self.expression)
-            val = str(val)
-            if( len(val) > 0 and val[-1] == "\n" ):
-                val = val[:-1]
-            self.save_data(now,str(val))
+            self.save_data(now,stored_value(val))
 #            t0 = time.time()
 #            print(f"{tracking_data=}")
             self.notify_all()
@@ -1021,8 +1230,7 @@ def show( ):
 
 
 def clear( ):
-    global tracking_data
-    tracking_data = {}
+    tracking_data.clear()
 
     tbn = list( trackings_by_number.values() )
     for n in tbn:
@@ -1056,7 +1264,8 @@ def get_data( ):
         datatable.append( ["Name"] + datanames )
     datatable.append( ["Time"] + dataexpressions )
     datatable.append( [] )
-    for ts in sorted(tracking_data.keys()):
+    columns = [ tracking_data.column(dk) for dk in sorted(trackings_by_number.keys()) ]
+    for ts,idx in tracking_data.rows():
         if( first == 0 ):
             first = ts
         if( rel_time.value ):
@@ -1066,16 +1275,11 @@ def get_data( ):
             dt = datetime.datetime.fromtimestamp(ts)
             showts = dt.strftime("%Y.%m.%d %H:%M:%S.%f")
         line = [ showts ]
-        tdata = tracking_data[ts]
-        for dk in sorted(trackings_by_number.keys()):
-#            print("dk = '%s'" % (dk,) )
-            td = tdata.get(dk,None)
-#            print("td = '%s'" % (td,) )
-            if( td is None ):
+        for col in columns:
+            if( col is None ):
                 line.append(None)
             else:
-                line.append(td)
-
+                line.append(col.get(idx))
 
         datatable.append( line )
     return datatable
@@ -1349,9 +1553,7 @@ class data_track_action( track_action ):
 #        vdb.util.bark() # print("BARK")
         if( val is not None ):
 #            print(f"{ex} = {val}")
-            # XXX Is there a faster way? We call that in the loop below multiple times or the same now
-            td = tracking_data.setdefault(now,{})
-            td[number] = str(val)
+            tracking_data.add(now,number,stored_value(val))
 
     def action( self,now ):
         ret = True
@@ -326,6 +326,7 @@ vmmap <cspec> - uses this colorspec
         elif( len(argv) >= 1 ):
             if( len(argv) > 0 ):
                 if( argv[0] == "refresh" ):
+                    vdb.memory.mmap.invalidate()
                     vdb.memory.mmap.parse()
                     return
                 elif( argv[0] == "visual" ):
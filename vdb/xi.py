@@ -9,6 +9,7 @@ import vdb.util
 import vdb.pointer
 import vdb.event
 import vdb.register
+import vdb.memory
 import vdb.asm
 
 from itertools import chain
@@ -195,6 +196,7 @@ class xi_listing:
         self.time = time.time()
         self.listing = []
         self.minframe = 4096
+        self.memory_diff = None
 
     def add( self, xi ):
         self.listing.append(xi)
@@ -313,7 +315,7 @@ class xi_listing:
 
 
 
-def xi( num, filter, full, events, flow, registers ):
+def xi( num, filter, full, events, flow, registers, memory = False ):
 #    print("############################################")
 #    vdb.util.bark() # print("BARK")
     regs = gdb.execute("registers",False,True)
@@ -333,6 +335,10 @@ def xi( num, filter, full, events, flow, registers ):
     xilist = xi_listing()
     xi_db[xilist.id] = xilist
 
+    # Catches all memory changes, not just those we know the instructions do
+    if( memory ):
+        before = vdb.memory.take_snapshot()
+
     prog = vdb.util.progress_bar(num_completed = True, spinner = True)
     pt = prog.add_task(f"Executing {num} single steps", total = num )
     prog.start()
@@ -473,8 +479,13 @@ def xi( num, filter, full, events, flow, registers ):
     print(regs)
 
     vdb.util.print_table(xilist.as_table(),use_rich=False)
+    if( memory ):
+        after = vdb.memory.take_snapshot( before.ranges )
+        xilist.memory_diff = vdb.memory.diff_snapshots( before, after )
+        vdb.memory.print_snapshot_diff( xilist.memory_diff, limit = vdb.memory.max_diff_lines.value )
     if( vdb.enabled("asm") ):
         vdb.asm.xi_history = xilist.get_history()
+        vdb.asm.invalidate_render_cache(None)
 
 
 def xi_show( argv ):
@@ -487,6 +498,8 @@ def xi_show( argv ):
         print(f"Cannot find xi listing for id {xid}")
         return
     vdb.util.print_table(xlst.as_table())
+    if( xlst.memory_diff is not None ):
+        vdb.memory.print_snapshot_diff( xlst.memory_diff, limit = vdb.memory.max_diff_lines.value )
 
 def xi_list( ):
     xtbl = [ ["ID", "Time", "Size", "Begin", "End" ] ]
@@ -515,6 +528,7 @@ class cmd_xi (vdb.command.command):
 eXecute Instructions ( and save data along the way )
 xi/f       full (local variables) info per frame
 xi/e       execute a "step" hook/event on each step for other plugins
+xi/m       snapshot all writable memory before and after and show everything that changed
 """
 
     def __init__ (self):
@@ -530,6 +544,7 @@ xi/e       execute a "step" hook/event on each step for other plugins
             filter = None
             flow = False
             registers = True
+            memory = False
 
             if( len(argv) ):
                 match argv[0]:
@@ -563,13 +578,15 @@ xi/e       execute a "step" hook/event on each step for other plugins
                 flow = True
             if( "e" in flags ):
                 events = True
+            if( "m" in flags ):
+                memory = True
 
             if( filter is not None and not full ):
                 print(f"WARNING: Peripheral filter {filter} will not be applied since we are not running in /f full mode")
 
             if( len(argv) > 0 ):
                 num = int(argv[0])
-            xi(num,filter,full,events,flow, registers)
+            xi(num,filter,full,events,flow, registers, memory)
 #            print (self.__doc__)
         except:
             vdb.print_exc()